@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+Performance benchmarks for pyGenomeTracks.
+
+The benchmarks do not rely on any file of the test suite:
+all inputs are generated on the fly by :mod:`benchmarks.generators`
+in a deterministic way (the same scale and seed always give the
+same files). The scenarios defined in :mod:`benchmarks.scenarios`
+time the initialization of the tracks, the plot and the savefig.
+
+Usage::
+
+    # run all scenarios at the 'small' scale and store the timings
+    python -m benchmarks run --scale small --outFileName results.json
+    # run only some scenarios
+    python -m benchmarks run --scenarios bed6 bigwig
+    # do not reuse the cache (gtf conversions, indexes) between runs
+    python -m benchmarks run --scenarios gtf gtf_genes --coldCache
+    # compare to a baseline previously obtained with 'run'
+    python -m benchmarks compare baseline.json results.json
+"""
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import os
+import sys
+import tempfile
+import platform
+import logging
+from . generators import SCALES
+from . scenarios import SCENARIOS, run_scenario
+
+DEFAULT_THRESHOLD = 1.25
+
+
+def parse_arguments(args=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Runs the pyGenomeTracks benchmarks on synthetic data '
+        'or compares two results files.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run = subparsers.add_parser('run', help='Run the scenarios.')
+    run.add_argument('--scale',
+                     help='Size of the synthetic data (default: %(default)s).',
+                     choices=list(SCALES.keys()),
+                     default='small')
+    run.add_argument('--scenarios',
+                     help='Scenarios to run (default: all).',
+                     choices=list(SCENARIOS.keys()),
+                     nargs='+')
+    run.add_argument('--repeat',
+                     help='Number of times each scenario is run, the '
+                     'minimum time is kept (default: %(default)s).',
+                     type=int,
+                     default=3)
+    run.add_argument('--seed',
+                     help='Seed used to generate the data '
+                     '(default: %(default)s).',
+                     type=int,
+                     default=0)
+    run.add_argument('--workDir',
+                     help='Directory where the synthetic data is generated. '
+                     'Reusing a directory avoids generating the data again '
+                     '(default: a temporary directory).')
+    run.add_argument('--coldCache',
+                     help='Each run starts with an empty cache directory '
+                     '(by default, the gtf conversions and the indexes '
+                     'computed by the first run are reused by the next ones).',
+                     action='store_true')
+    run.add_argument('--outFileName', '-out',
+                     help='json file where the timings are written.')
+
+    compare = subparsers.add_parser('compare',
+                                    help='Compare results to a baseline.')
+    compare.add_argument('baseline',
+                         help='json file produced by run used as reference.')
+    compare.add_argument('results',
+                         help='json file produced by run to compare.')
+    compare.add_argument('--threshold',
+                         help='A step is reported as a regression if it is '
+                         'slower than threshold times the baseline '
+                         '(default: %(default)s).',
+                         type=float,
+                         default=DEFAULT_THRESHOLD)
+    return parser.parse_args(args)
+
+
+def run(args):
+    scale = SCALES[args.scale]
+    scenarios = args.scenarios if args.scenarios else list(SCENARIOS.keys())
+    if args.workDir is None:
+        work_dir = tempfile.mkdtemp(prefix=f"pgt_benchmarks_{args.scale}_")
+    else:
+        work_dir = os.path.join(args.workDir, f"{args.scale}_{args.seed}")
+        if not os.path.exists(work_dir):
+            os.makedirs(work_dir)
+    results = {'metadata': {'scale': args.scale,
+                            'seed': args.seed,
+                            'repeat': args.repeat,
+                            'cold_cache': args.coldCache,
+                            'python': platform.python_version(),
+                            'machine': platform.machine()},
+               'results': {}}
+    for name in scenarios:
+        try:
+            timings = run_scenario(SCENARIOS[name], work_dir, scale,
+                                   repeat=args.repeat, seed=args.seed,
+                                   cold_cache=args.coldCache)
+        except Exception as detail:
+            # One failing scenario should not prevent to run the others
+            print(f"{name:<25}failed: {detail!r}")
+            continue
+        results['results'][name] = timings
+        print(f"{name:<25}" + "".join([f"{step}: {value:8.3f}s  "
+                                       for step, value in timings.items()]))
+        sys.stdout.flush()
+    if args.outFileName is not None:
+        with open(args.outFileName, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    return results
+
+
+def compare(args):
+    """
+    Prints the ratio results / baseline for each
+    scenario and each step. Returns the number of regressions.
+    """
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    with open(args.results) as fh:
+        results = json.load(fh)
+    if baseline['metadata']['scale'] != results['metadata']['scale']:
+        sys.stderr.write("*Warning*\nThe baseline and the results were not "
+                         "obtained with the same scale.\n")
+    n_regressions = 0
+    for name, timings in results['results'].items():
+        if name not in baseline['results']:
+            print(f"{name:<25}not in baseline")
+            continue
+        line = f"{name:<25}"
+        for step, value in timings.items():
+            ref = baseline['results'][name][step]
+            ratio = value / ref if ref > 0 else float('inf')
+            flag = ''
+            if ratio > args.threshold:
+                flag = ' !'
+                n_regressions += 1
+            line += f"{step}: {ref:8.3f}s -> {value:8.3f}s (x{ratio:.2f}){flag}  "
+        print(line)
+    print(f"{n_regressions} step(s) slower than {args.threshold} times "
+          "the baseline.")
+    return n_regressions
+
+
+def main(args=None):
+    args = parse_arguments(args)
+    # The track initialization is very verbose.
+    # The loggers of pygenometracks are set to DEBUG by each module
+    # (and by each track) so the INFO and DEBUG records are disabled
+    # for all loggers instead of raising their levels.
+    logging.disable(logging.INFO)
+    if args.command == 'run':
+        run(args)
+    else:
+        if compare(args) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
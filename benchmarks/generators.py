@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic generators of synthetic input files.
+
+Every generator takes the output path, a :class:`Scale` and a seed
+and writes a file of the corresponding format with a single
+chromosome called ``chr1``. Using the same scale and the same seed
+always produces the same file.
+"""
+import collections
+import numpy as np
+import pyBigWig
+import pysam
+
+CHROM = 'chr1'
+NUCLEOTIDES = np.array(list('ACGT'))
+
+Scale = collections.namedtuple('Scale', ['chrom_size', 'features',
+                                         'bins', 'hic_bins', 'links',
+                                         'maf_blocks', 'maf_species'])
+
+# chrom_size is the size of the single chromosome of the synthetic data
+SCALES = {'tiny': Scale(chrom_size=200000, features=200, bins=2000,
+                        hic_bins=100, links=200, maf_blocks=20,
+                        maf_species=3),
+          'small': Scale(chrom_size=1000000, features=2000, bins=20000,
+                         hic_bins=500, links=2000, maf_blocks=200,
+                         maf_species=5),
+          'medium': Scale(chrom_size=10000000, features=20000, bins=200000,
+                          hic_bins=2000, links=20000, maf_blocks=2000,
+                          maf_species=10),
+          'large': Scale(chrom_size=50000000, features=200000,
+                         bins=2000000, hic_bins=5000, links=200000,
+                         maf_blocks=20000, maf_species=20)}
+
+
+def _features(scale, seed, min_length=500, max_length=50000):
+    """
+    Returns sorted starts and ends of ``scale.features``
+    intervals on the chromosome
+    """
+    rng = np.random.RandomState(seed)
+    lengths = rng.randint(min_length, max_length, size=scale.features)
+    starts = np.sort(rng.randint(0, scale.chrom_size - max_length,
+                                 size=scale.features))
+    return starts, starts + lengths, rng
+
+
+def _blocks(rng, start, end, max_blocks=10):
+    """
+    Returns block sizes and relative block starts
+    which span start to end
+    """
+    length = end - start
+    n_blocks = min(rng.randint(1, max_blocks + 1), max(1, length // 100))
+    if n_blocks == 1:
+        return [length], [0]
+    # Each block starts at a different position
+    inner_starts = np.sort(rng.choice(np.arange(1, length // 10),
+                                      n_blocks - 1, replace=False)) * 10
+    relative_starts = [0] + inner_starts.tolist()
+    boundaries = relative_starts + [length]
+    sizes = [max(1, (b - a) // 2)
+             for a, b in zip(boundaries[:-1], boundaries[1:])]
+    # The last block must end at the end of the feature
+    sizes[-1] = length - relative_starts[-1]
+    return sizes, relative_starts
+
+
+def write_bed(file_name, scale, seed=0, bed12=False):
+    """
+    Writes a bed6 or a bed12 with genes
+    """
+    starts, ends, rng = _features(scale, seed)
+    with open(file_name, 'w') as fh:
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            fields = [CHROM, start, end, f'gene_{i}',
+                      rng.randint(0, 1000), '+-'[rng.randint(0, 2)]]
+            if bed12:
+                sizes, relative_starts = _blocks(rng, start, end)
+                # The coding part is within the first and the last block
+                thick_start = start + min(sizes[0] - 1, 50)
+                thick_end = end - min(sizes[-1] - 1, 50)
+                fields += [thick_start, thick_end,
+                           ','.join(map(str, rng.randint(0, 256, 3))),
+                           len(sizes),
+                           ','.join(map(str, sizes)),
+                           ','.join(map(str, relative_starts))]
+            fh.write('\t'.join(map(str, fields)) + '\n')
+
+
+def write_gtf(file_name, scale, seed=0):
+    """
+    Writes a gtf with genes, transcripts, exons and CDS.
+    Each gene has between 1 and 3 transcripts.
+    """
+    starts, ends, rng = _features(scale, seed)
+    with open(file_name, 'w') as fh:
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            strand = '+-'[rng.randint(0, 2)]
+            gene_attributes = f'gene_id "G{i:07d}"; gene_name "gene_{i}";'
+
+            def write_line(feature, feature_start, feature_end, attributes):
+                # gtf are 1-based
+                fh.write('\t'.join([CHROM, 'bench', feature,
+                                    str(feature_start + 1), str(feature_end),
+                                    '.', strand, '.', attributes]) + '\n')
+
+            write_line('gene', start, end, gene_attributes)
+            for j in range(rng.randint(1, 4)):
+                tr_attributes = gene_attributes + \
+                    f' transcript_id "T{i:07d}.{j}";' \
+                    f' transcript_name "gene_{i}-{j}";'
+                write_line('transcript', start, end, tr_attributes)
+                sizes, relative_starts = _blocks(rng, start, end)
+                for size, relative_start in zip(sizes, relative_starts):
+                    exon_start = start + relative_start
+                    write_line('exon', exon_start, exon_start + size,
+                               tr_attributes)
+                    write_line('CDS', exon_start, exon_start + size,
+                               tr_attributes)
+
+
+def _bedgraph_values(scale, seed):
+    rng = np.random.RandomState(seed)
+    bin_size = max(1, scale.chrom_size // scale.bins)
+    starts = np.arange(0, scale.chrom_size, bin_size)
+    ends = np.minimum(starts + bin_size, scale.chrom_size)
+    # A smooth signal with noise
+    values = np.abs(np.sin(starts / scale.chrom_size * 50) * 20
+                    + rng.normal(0, 2, size=len(starts)))
+    return starts, ends, values
+
+
+def write_bedgraph(file_name, scale, seed=0):
+    """
+    Writes a bedgraph covering the whole chromosome
+    """
+    starts, ends, values = _bedgraph_values(scale, seed)
+    with open(file_name, 'w') as fh:
+        for start, end, value in zip(starts, ends, values):
+            fh.write(f'{CHROM}\t{start}\t{end}\t{value:.3f}\n')
+
+
+def write_tabix_bedgraph(file_name, scale, seed=0):
+    """
+    Writes a bgzip compressed bedgraph
+    indexed by tabix (file_name must end with .bgz)
+    """
+    plain_file = file_name[:-4]
+    write_bedgraph(plain_file, scale, seed)
+    pysam.tabix_compress(plain_file, file_name, force=True)
+    pysam.tabix_index(file_name, preset='bed', force=True)
+
+
+def write_bigwig(file_name, scale, seed=0):
+    """
+    Writes a bigwig covering the whole chromosome
+    """
+    starts, ends, values = _bedgraph_values(scale, seed)
+    bw = pyBigWig.open(file_name, 'w')
+    bw.addHeader([(CHROM, scale.chrom_size)])
+    bw.addEntries([CHROM] * len(starts), starts.tolist(),
+                  ends=ends.tolist(), values=values.tolist())
+    bw.close()
+
+
+def _hic_pixels(scale, seed, n_bins):
+    rng = np.random.RandomState(seed)
+    bin1, bin2 = np.triu_indices(n_bins)
+    distance = bin2 - bin1
+    # Only keep the contacts close to the diagonal
+    keep = distance < max(10, n_bins // 5)
+    bin1, bin2, distance = bin1[keep], bin2[keep], distance[keep]
+    counts = rng.poisson(1000 / (1 + distance)) + 1
+    return bin1, bin2, counts
+
+
+def write_cool(file_name, scale, seed=0, n_bins=None):
+    """
+    Writes a cool file with a contact decreasing with the distance
+    """
+    import cooler
+    import pandas as pd
+    if n_bins is None:
+        n_bins = scale.hic_bins
+    bin_size = scale.chrom_size // n_bins
+    starts = np.arange(n_bins) * bin_size
+    bins = pd.DataFrame({'chrom': CHROM, 'start': starts,
+                         'end': np.minimum(starts + bin_size,
+                                           scale.chrom_size)})
+    bin1, bin2, counts = _hic_pixels(scale, seed, n_bins)
+    pixels = pd.DataFrame({'bin1_id': bin1, 'bin2_id': bin2,
+                           'count': counts})
+    cooler.create_cooler(file_name, bins, pixels, ordered=True)
+
+
+def write_mcool(file_name, scale, seed=0):
+    """
+    Writes a mcool file with 3 resolutions
+    (the scenarios use the finest one)
+    """
+    import cooler
+    base_file = file_name[:-6] + '.base.cool'
+    write_cool(base_file, scale, seed)
+    bin_size = scale.chrom_size // scale.hic_bins
+    cooler.zoomify_cooler(base_file, file_name,
+                          [bin_size, bin_size * 2, bin_size * 4],
+                          chunksize=10000000)
+
+
+def write_links(file_name, scale, seed=0):
+    """
+    Writes a links file (bedpe like) with a score
+    """
+    rng = np.random.RandomState(seed)
+    max_distance = scale.chrom_size // 10
+    starts1 = np.sort(rng.randint(0, scale.chrom_size - max_distance,
+                                  size=scale.links))
+    starts2 = starts1 + rng.randint(1000, max_distance, size=scale.links)
+    scores = rng.uniform(0, 10, size=scale.links)
+    with open(file_name, 'w') as fh:
+        for start1, start2, score in zip(starts1, starts2, scores):
+            fh.write(f'{CHROM}\t{start1}\t{start1 + 1000}\t'
+                     f'{CHROM}\t{start2}\t{start2 + 1000}\t{score:.3f}\n')
+
+
+def write_narrowpeak(file_name, scale, seed=0):
+    """
+    Writes a narrowPeak file
+    """
+    starts, ends, rng = _features(scale, seed, min_length=100,
+                                  max_length=2000)
+    with open(file_name, 'w') as fh:
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            signal = rng.uniform(1, 50)
+            fh.write(f'{CHROM}\t{start}\t{end}\tpeak_{i}\t'
+                     f'{rng.randint(0, 1000)}\t.\t{signal:.5f}\t'
+                     f'{signal * 5:.5f}\t{signal * 4:.5f}\t'
+                     f'{rng.randint(0, end - start)}\n')
+
+
+def write_epilogos(file_name, scale, seed=0, n_categories=15):
+    """
+    Writes a bgzip compressed qcat file indexed by tabix
+    (file_name must end with .bgz)
+    """
+    plain_file = file_name[:-4]
+    rng = np.random.RandomState(seed)
+    bin_size = max(1, scale.chrom_size // scale.bins)
+    with open(plain_file, 'w') as fh:
+        for i, start in enumerate(range(0, scale.chrom_size, bin_size)):
+            values = np.sort(rng.normal(0, 0.05, size=n_categories))
+            categories = rng.permutation(n_categories) + 1
+            qcat = ', '.join([f'[{v:.4f},{c}]'
+                              for v, c in zip(values, categories)])
+            fh.write(f'{CHROM}\t{start}\t{start + bin_size}\t'
+                     f'id:{i},qcat:[ {qcat} ]\n')
+    pysam.tabix_compress(plain_file, file_name, force=True)
+    pysam.tabix_index(file_name, preset='bed', force=True)
+
+
+def _random_sequence(rng, length):
+    return ''.join(NUCLEOTIDES[rng.randint(0, 4, size=length)])
+
+
+def write_maf(file_name, scale, seed=0, reference='ref'):
+    """
+    Writes a maf file with ``scale.maf_species`` species
+    (the first one is the reference). The other species
+    are the reference with mismatches and gaps.
+    """
+    rng = np.random.RandomState(seed)
+    block_size = scale.chrom_size // scale.maf_blocks
+    species = [reference] + [f'species{i}'
+                             for i in range(1, scale.maf_species)]
+    with open(file_name, 'w') as fh:
+        fh.write('##maf version=1\n')
+        for start in range(0, scale.chrom_size, block_size):
+            length = min(block_size, scale.chrom_size - start) // 2
+            ref_seq = np.array(list(_random_sequence(rng, length)))
+            fh.write(f'a score={rng.randint(0, 100000)}.0\n')
+            for sp in species:
+                seq = ref_seq.copy()
+                if sp != reference:
+                    mutated = rng.random_sample(length) < 0.1
+                    seq[mutated] = NUCLEOTIDES[rng.randint(0, 4,
+                                                           size=mutated.sum())]
+                    seq[rng.random_sample(length) < 0.05] = '-'
+                seq = ''.join(seq)
+                size = length - seq.count('-')
+                fh.write(f's {sp}.{CHROM} {start} {size} + '
+                         f'{scale.chrom_size} {seq}\n')
+            fh.write('\n')
+
+
+def write_fasta(file_name, scale, seed=0, line_length=60):
+    """
+    Writes a fasta file with the chromosome sequence.
+    If the file_name ends with .gz, the file is bgzip compressed.
+    """
+    rng = np.random.RandomState(seed)
+    sequence = _random_sequence(rng, scale.chrom_size)
+    lines = [f'>{CHROM}'] + [sequence[i:i + line_length]
+                             for i in range(0, len(sequence), line_length)]
+    plain_file = file_name[:-3] if file_name.endswith('.gz') else file_name
+    with open(plain_file, 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+    if plain_file != file_name:
+        pysam.tabix_compress(plain_file, file_name, force=True)
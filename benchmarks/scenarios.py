@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Timed scenarios.
+
+Each scenario generates its input file(s) with :mod:`benchmarks.generators`,
+writes a tracks file and measures:
+
+- ``init``: the creation of the :class:`PlotTracks` object
+  (parsing of the tracks file and loading of the data)
+- ``plot``: the call to :meth:`PlotTracks.plot` (which includes
+  the drawing and a first savefig)
+- ``savefig``: a second savefig of the figure returned by plot
+"""
+import io
+import os
+import shutil
+import tempfile
+import time
+import collections
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from pygenometracks.tracksClass import PlotTracks
+from . import generators
+from .generators import CHROM
+
+Scenario = collections.namedtuple('Scenario', ['name', 'files', 'tracks',
+                                               'region_length'])
+# files is a list of (file name, generator, kwargs)
+# tracks is the content of the tracks file, the file names are
+# relative to the working directory
+# region_length is the length of the plotted region
+# (None for the whole chromosome)
+
+SCENARIOS = [Scenario('bed6',
+                      [('genes.bed', generators.write_bed, {})],
+                      "[genes]\nfile = genes.bed\nheight = 10\n",
+                      None),
+             Scenario('bed12',
+                      [('genes12.bed', generators.write_bed,
+                        {'bed12': True})],
+                      "[genes]\nfile = genes12.bed\nheight = 10\n",
+                      None),
+             Scenario('bed12_global_max_row',
+                      [('genes12.bed', generators.write_bed,
+                        {'bed12': True})],
+                      "[genes]\nfile = genes12.bed\nheight = 10\n"
+                      "global_max_row = true\n",
+                      None),
+             Scenario('gtf',
+                      [('genes.gtf', generators.write_gtf, {})],
+                      "[genes]\nfile = genes.gtf\nheight = 10\n",
+                      None),
+             Scenario('gtf_genes',
+                      [('genes.gtf', generators.write_gtf, {})],
+                      "[genes]\nfile = genes.gtf\nheight = 10\n"
+                      "merge_transcripts = true\n",
+                      None),
+             Scenario('bedgraph',
+                      [('signal.bedgraph', generators.write_bedgraph, {})],
+                      "[signal]\nfile = signal.bedgraph\nheight = 3\n",
+                      None),
+             Scenario('bedgraph_tabix',
+                      [('signal.bedgraph.bgz',
+                        generators.write_tabix_bedgraph, {})],
+                      "[signal]\nfile = signal.bedgraph.bgz\nheight = 3\n",
+                      None),
+             Scenario('bigwig',
+                      [('signal.bw', generators.write_bigwig, {})],
+                      "[signal]\nfile = signal.bw\nheight = 3\n",
+                      None),
+             Scenario('bigwig_40_tracks',
+                      [('signal.bw', generators.write_bigwig, {})],
+                      "[signal]\nfile = signal.bw\nheight = 1\n" * 40,
+                      None),
+             Scenario('cool',
+                      [('matrix.cool', generators.write_cool, {})],
+                      "[hic]\nfile = matrix.cool\ndepth = 1000000\n"
+                      "file_type = hic_matrix\n",
+                      None),
+             Scenario('mcool',
+                      [('matrix.mcool', generators.write_mcool, {})],
+                      "[hic]\nfile = matrix.mcool::/resolutions/{bin_size}\n"
+                      "depth = 1000000\nfile_type = hic_matrix\n",
+                      None),
+             Scenario('links_arcs',
+                      [('contacts.links', generators.write_links, {})],
+                      "[links]\nfile = contacts.links\nheight = 5\n",
+                      None),
+             Scenario('links_triangles',
+                      [('contacts.links', generators.write_links, {})],
+                      "[links]\nfile = contacts.links\nheight = 5\n"
+                      "links_type = triangles\n",
+                      None),
+             Scenario('narrowpeak',
+                      [('peaks.narrowPeak', generators.write_narrowpeak,
+                        {})],
+                      "[peaks]\nfile = peaks.narrowPeak\nheight = 3\n",
+                      None),
+             Scenario('epilogos',
+                      [('epilogos.qcat.bgz', generators.write_epilogos, {})],
+                      "[epilogos]\nfile = epilogos.qcat.bgz\nheight = 5\n",
+                      None),
+             Scenario('maf',
+                      [('alignment.maf', generators.write_maf, {})],
+                      "[maf]\nfile = alignment.maf\nreference = ref\n"
+                      "height = 5\n",
+                      None),
+             Scenario('fasta_zoomin',
+                      [('genome.fa', generators.write_fasta, {})],
+                      "[fasta]\nfile = genome.fa\nheight = 1\n",
+                      500),
+             Scenario('fasta_zoomout',
+                      [('genome.fa', generators.write_fasta, {})],
+                      "[fasta]\nfile = genome.fa\nheight = 1\n",
+                      20000),
+             Scenario('fasta_gz',
+                      [('genome.fa.gz', generators.write_fasta, {})],
+                      "[fasta]\nfile = genome.fa.gz\nheight = 1\n"
+                      "file_type = fasta\n",
+                      500)]
+
+SCENARIOS = collections.OrderedDict([(s.name, s) for s in SCENARIOS])
+
+
+def prepare(scenario, work_dir, scale, seed=0):
+    """
+    Generates the files needed by the scenario
+    (if they do not exist yet) and writes the tracks file.
+    Returns the path of the tracks file.
+    """
+    for file_name, generator, kwargs in scenario.files:
+        file_path = os.path.join(work_dir, file_name)
+        if not os.path.exists(file_path):
+            generator(file_path, scale, seed=seed, **kwargs)
+    tracks_file = os.path.join(work_dir, f"{scenario.name}.ini")
+    bin_size = scale.chrom_size // scale.hic_bins
+    with open(tracks_file, 'w') as fh:
+        fh.write(scenario.tracks.format(bin_size=bin_size))
+    return tracks_file
+
+
+def get_region(scenario, scale):
+    """
+    Returns the region plotted by the scenario:
+    the center of the chromosome.
+    """
+    if scenario.region_length is None:
+        return CHROM, 0, scale.chrom_size
+    start = (scale.chrom_size - scenario.region_length) // 2
+    return CHROM, start, start + scenario.region_length
+
+
+def run_scenario(scenario, work_dir, scale, repeat=3, seed=0,
+                 fig_width=40, dpi=72, cold_cache=False):
+    """
+    Runs the scenario ``repeat`` times and returns a dictionary
+    with the minimum time (in seconds) of each step.
+    If cold_cache is True, each run starts with an empty
+    cache directory (the gtf conversions, fasta and maf indexes
+    are computed again).
+    """
+    tracks_file = prepare(scenario, work_dir, scale, seed=seed)
+    chrom, start, end = get_region(scenario, scale)
+    out_file = os.path.join(work_dir, f"{scenario.name}.png")
+    timings = {'init': [], 'plot': [], 'savefig': []}
+    cache_dir_before = os.environ.get('PYGENOMETRACKS_CACHE_DIR')
+    for _ in range(repeat):
+        if cold_cache:
+            cache_dir = tempfile.mkdtemp(prefix='cache_', dir=work_dir)
+            os.environ['PYGENOMETRACKS_CACHE_DIR'] = cache_dir
+        try:
+            _run_once(tracks_file, chrom, start, end, out_file,
+                      timings, fig_width, dpi)
+        finally:
+            if cold_cache:
+                shutil.rmtree(cache_dir)
+                if cache_dir_before is None:
+                    del os.environ['PYGENOMETRACKS_CACHE_DIR']
+                else:
+                    os.environ['PYGENOMETRACKS_CACHE_DIR'] = cache_dir_before
+    return {step: min(values) for step, values in timings.items()}
+
+
+def _run_once(tracks_file, chrom, start, end, out_file, timings,
+              fig_width, dpi):
+    """
+    Plots the region once and appends the time of each step
+    to timings.
+    """
+    start_time = time.perf_counter()
+    trp = PlotTracks(tracks_file, fig_width=fig_width, dpi=dpi,
+                     plot_regions=[(chrom, start, end)])
+    timings['init'].append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    fig = trp.plot(out_file, chrom, start, end)
+    timings['plot'].append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    fig.savefig(io.BytesIO(), dpi=dpi)
+    timings['savefig'].append(time.perf_counter() - start_time)
+
+    plt.close(fig)
+    trp.close_files()
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+import collections
+from intervaltree import Interval
+import numpy as np
+from .readBed import BED_INTERVAL_CLASSES, intervals_to_column_chunks
+
+
+class BedIntervalStore(object):
+    r"""
+    Stores bed intervals in numpy columns (one array per field)
+    instead of one namedtuple per interval inside interval trees.
+    The names are concatenated in a single string with the offset
+    of each name and the blocks of all intervals are flattened
+    with the offset of the blocks of each interval.
+    The BedInterval namedtuples are only created for the intervals
+    which are queried.
+
+    It can be used as the dictionary of IntervalTree it replaces:
+    store[chrom][start:end] returns the intervals overlapping
+    the region as Interval(start, end, BedInterval).
+
+    >>> from pygenometracks.readBed import BedInterval12
+    >>> store = BedIntervalStore.from_intervals([
+    ...     BedInterval12('chr1', 10, 50, 'gene_a', 1.0, '+', 20, 40,
+    ...                   [255, 0, 0], 2, [10, 10], [0, 30]),
+    ...     BedInterval12('chr2', 0, 20, 'gene_b', 2.0, '-', 0, 20,
+    ...                   [0, 0, 255], 1, [20], [0]),
+    ...     BedInterval12('chr1', 0, 5, 'gene_c', 0.5, '.', 0, 5,
+    ...                   [0, 0, 0], 1, [5], [0])])
+    >>> list(store.keys())
+    ['chr1', 'chr2']
+    >>> 'chr3' in store
+    False
+    >>> store.size, store.min_score, store.max_score
+    (3, 0.5, 2.0)
+    >>> [region.data.name for region in store['chr1'][0:60]]
+    ['gene_c', 'gene_a']
+    >>> store['chr1'][20:30]
+    [Interval(10, 50, BedInterval(chromosome='chr1', start=10, end=50, name='gene_a', score=1.0, strand='+', thick_start=20, thick_end=40, rgb=[255, 0, 0], block_count=2, block_sizes=[10, 10], block_starts=[0, 30]))]
+    >>> store['chr1'][50:60]
+    []
+    """
+
+    def __init__(self, column_chunks=()):
+        """
+        :param column_chunks: iterable of the columns of intervals
+                              (see ReadBed.get_columns) all with
+                              the same fields.
+        """
+        self.number_of_fields = 6
+        self.chromosomes = []
+        chrom_ids = {}
+        self.strands = []
+        strand_ids = {}
+        chunks = collections.defaultdict(list)
+        names = []
+        # rgb which are not 3 integers (index: rgb)
+        other_rgbs = {}
+        self.size = 0
+        for columns in column_chunks:
+            self.number_of_fields = len(columns)
+            chunks['chrom_codes'].append(self.encode(columns['chromosome'],
+                                                     self.chromosomes, chrom_ids))
+            chunks['strand_codes'].append(self.encode(columns['strand'],
+                                                      self.strands, strand_ids))
+            names += columns['name']
+            for field in ['start', 'end', 'score', 'thick_start',
+                          'thick_end', 'block_count']:
+                if field in columns:
+                    chunks[field].append(columns[field])
+            if 'rgb' in columns:
+                rgbs = columns['rgb']
+                if isinstance(rgbs, list):
+                    rgb_array = np.zeros((len(rgbs), 3), dtype=np.int64)
+                    for i, rgb in enumerate(rgbs):
+                        if isinstance(rgb, list) and len(rgb) == 3:
+                            rgb_array[i] = rgb
+                        else:
+                            other_rgbs[self.size + i] = rgb
+                    rgbs = rgb_array
+                chunks['rgb'].append(rgbs)
+            for field in ['block_sizes', 'block_starts']:
+                if field in columns:
+                    chunks[field + '_lengths'].append(columns[field][0])
+                    chunks[field].append(columns[field][1])
+            self.size += len(columns['start'])
+        columns = {field: np.concatenate(values) for field, values in chunks.items()}
+        del chunks
+        for field in ['chrom_codes', 'strand_codes', 'start', 'end']:
+            columns.setdefault(field, np.zeros(0, dtype=np.int64))
+        columns.setdefault('score', np.zeros(0, dtype=np.float64))
+
+        # The intervals are sorted by chromosome, start and end
+        order = np.lexsort((columns['end'], columns['start'], columns['chrom_codes']))
+        self.starts = columns['start'][order]
+        self.ends = columns['end'][order]
+        self.scores = columns['score'][order]
+        self.strand_codes = columns['strand_codes'][order].astype(np.int8)
+        names = [names[i] for i in order]
+        self.name_offsets = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(np.array([len(name) for name in names], dtype=np.int64),
+                  out=self.name_offsets[1:])
+        self.names = ''.join(names)
+        del names
+        if self.number_of_fields >= 7:
+            self.thick_starts = columns['thick_start'][order]
+        if self.number_of_fields >= 8:
+            self.thick_ends = columns['thick_end'][order]
+        if self.number_of_fields >= 9:
+            self.rgbs = columns['rgb'][order]
+            new_index = np.empty_like(order)
+            new_index[order] = np.arange(self.size)
+            self.other_rgbs = {int(new_index[i]): rgb for i, rgb in other_rgbs.items()}
+        if self.number_of_fields >= 10:
+            self.block_counts = columns['block_count'][order]
+        if self.number_of_fields >= 11:
+            self.block_offsets, self.block_sizes = \
+                self.reorder_blocks(columns['block_sizes_lengths'],
+                                    columns['block_sizes'], order)
+        if self.number_of_fields >= 12:
+            __, self.block_starts = \
+                self.reorder_blocks(columns['block_starts_lengths'],
+                                    columns['block_starts'], order)
+
+        # Each chromosome is a slice of the columns
+        chrom_codes = columns['chrom_codes'][order]
+        bounds = np.searchsorted(chrom_codes, np.arange(len(self.chromosomes) + 1))
+        self.chrom_slices = {chrom: (bounds[i], bounds[i + 1])
+                             for i, chrom in enumerate(self.chromosomes)}
+        # max_ends[i] is the maximum end of the intervals of the
+        # same chromosome before i (included) so the intervals
+        # which may overlap a region are found by bisection
+        self.max_ends = np.empty_like(self.ends)
+        for first, last in self.chrom_slices.values():
+            np.maximum.accumulate(self.ends[first:last],
+                                  out=self.max_ends[first:last])
+
+        self.BedInterval = BED_INTERVAL_CLASSES[self.number_of_fields]
+
+    @classmethod
+    def from_intervals(cls, bed_intervals):
+        """
+        Returns the store of an iterable of BedInterval
+        with the same fields.
+        """
+        return cls(intervals_to_column_chunks(bed_intervals))
+
+    @staticmethod
+    def encode(values, categories, ids):
+        """
+        Returns the codes of the values (their index in categories).
+        The new values are added to categories and ids (value: code)
+        in their order of appearance.
+
+        >>> categories = ['chr2']
+        >>> BedIntervalStore.encode(['chr1', 'chr2', 'chr1', 'chr3'],
+        ...                         categories, {'chr2': 0}).tolist()
+        [1, 0, 1, 2]
+        >>> categories
+        ['chr2', 'chr1', 'chr3']
+        """
+        uniques, first_index, inverse = np.unique(np.array(values, dtype=str),
+                                                  return_index=True,
+                                                  return_inverse=True)
+        for value in uniques[np.argsort(first_index)]:
+            value = str(value)
+            if value not in ids:
+                ids[value] = len(categories)
+                categories.append(value)
+        return np.array([ids[str(value)] for value in uniques], dtype=np.int64)[inverse]
+
+    @staticmethod
+    def reorder_blocks(lengths, values, order):
+        """
+        Reorders the flattened values of blocks
+        (lengths[i] values per interval) following order.
+        Returns the new offsets and values.
+
+        >>> offsets, values = BedIntervalStore.reorder_blocks(
+        ...     np.array([2, 1, 3]), np.array([1, 2, 3, 4, 5, 6]),
+        ...     np.array([2, 0, 1]))
+        >>> offsets.tolist(), values.tolist()
+        ([0, 3, 5, 6], [4, 5, 6, 1, 2, 3])
+        """
+        old_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=old_offsets[1:])
+        new_lengths = lengths[order]
+        new_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(new_lengths, out=new_offsets[1:])
+        # index in the old values of each new value:
+        index = np.repeat(old_offsets[:-1][order] - new_offsets[:-1], new_lengths) \
+            + np.arange(new_offsets[-1])
+        return new_offsets, values[index]
+
+    @property
+    def min_score(self):
+        return float(self.scores.min()) if self.size > 0 else float('inf')
+
+    @property
+    def max_score(self):
+        return float(self.scores.max()) if self.size > 0 else float('-inf')
+
+    def keys(self):
+        return self.chrom_slices.keys()
+
+    def __iter__(self):
+        return iter(self.chrom_slices)
+
+    def __contains__(self, chrom):
+        return chrom in self.chrom_slices
+
+    def __getitem__(self, chrom):
+        first, last = self.chrom_slices[chrom]
+        return ChromIntervals(self, chrom, first, last)
+
+    def overlap(self, chrom, start, end):
+        """
+        Returns the indices of the intervals of chrom
+        overlapping [start, end).
+        """
+        first, last = self.chrom_slices[chrom]
+        # Before first all intervals end before start:
+        first += np.searchsorted(self.max_ends[first:last], start, side='right')
+        # From last all intervals start after end:
+        last = first + np.searchsorted(self.starts[first:last], end, side='left')
+        return first + np.flatnonzero(self.ends[first:last] > start)
+
+    def get_intervals(self, chrom, indices):
+        """
+        Returns the Interval(start, end, BedInterval)
+        of the intervals at indices (all on chrom).
+        """
+        starts = self.starts[indices].tolist()
+        ends = self.ends[indices].tolist()
+        columns = [[chrom] * len(starts), starts, ends,
+                   [self.names[self.name_offsets[i]:self.name_offsets[i + 1]]
+                    for i in indices],
+                   self.scores[indices].tolist(),
+                   [self.strands[code] for code in self.strand_codes[indices]]]
+        if self.number_of_fields >= 7:
+            columns.append(self.thick_starts[indices].tolist())
+        if self.number_of_fields >= 8:
+            columns.append(self.thick_ends[indices].tolist())
+        if self.number_of_fields >= 9:
+            columns.append([self.other_rgbs.get(i, rgb)
+                            for i, rgb in zip(indices, self.rgbs[indices].tolist())])
+        if self.number_of_fields >= 10:
+            columns.append(self.block_counts[indices].tolist())
+        if self.number_of_fields >= 11:
+            block_fields = ['block_sizes', 'block_starts'][:self.number_of_fields - 10]
+            for values in [getattr(self, field) for field in block_fields]:
+                columns.append([values[self.block_offsets[i]:self.block_offsets[i + 1]].tolist()
+                                for i in indices])
+        # Like in an IntervalTree, identical intervals are only returned once
+        return list(dict.fromkeys([Interval(start, end, self.BedInterval._make(values))
+                                   for start, end, values in zip(starts, ends, zip(*columns))]))
+
+
+class ChromIntervals(object):
+    """
+    The intervals of one chromosome of a BedIntervalStore.
+    Slicing it with [start:end] returns the list of
+    intervals overlapping [start, end).
+    """
+
+    def __init__(self, store, chrom, first, last):
+        self.store = store
+        self.chrom = chrom
+        self.first = first
+        self.last = last
+
+    def __len__(self):
+        return self.last - self.first
+
+    def __iter__(self):
+        return iter(self.store.get_intervals(self.chrom,
+                                             np.arange(self.first, self.last)))
+
+    def __getitem__(self, region):
+        return self.store.get_intervals(self.chrom,
+                                        self.store.overlap(self.chrom,
+                                                           region.start,
+                                                           region.stop))
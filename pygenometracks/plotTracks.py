@@ -240,6 +240,15 @@ def parse_arguments(args=None):
                              ' with a decreasing x-axis.',
                         action='store_true')
 
+    parser.add_argument('--threads',
+                        help='Number of threads used to read the data of the '
+                             'tracks. When several threads are used, the data '
+                             'of all tracks is read concurrently and, with '
+                             '--BED, the data of the next region is read while '
+                             'the current region is plotted (default is 1).',
+                        type=int,
+                        default=1)
+
     parser.add_argument('--version', action='version',
                         version=f'%(prog)s {__version__}')
 
@@ -253,7 +262,7 @@ def main(args=None):
     # Identify the regions to plot:
     if args.BED:
         regions = []
-        for line in args.BED.readlines():
+        for line in args.BED:
             try:
                 chrom, start, end = line.strip().split('\t')[0:3]
             except ValueError:
@@ -274,7 +283,8 @@ def main(args=None):
     trp = PlotTracks(args.tracks.name, args.width, fig_height=args.height,
                      fontsize=args.fontSize, dpi=args.dpi,
                      track_label_width=args.trackLabelFraction,
-                     plot_regions=regions, plot_width=args.plotWidth)
+                     plot_regions=regions, plot_width=args.plotWidth,
+                     threads=args.threads)
 
     # Create dir if dir does not exists:
     # Modified from https://stackoverflow.com/questions/12517451/automatically-creating-directories-with-file-output
@@ -285,17 +295,19 @@ def main(args=None):
         name = args.outFileName.split(".")
         file_suffix = name[-1]
         file_prefix = ".".join(name[:-1])
-        for chrom, start, end in regions:
+        for (chrom, start, end), tracks_data in trp.iter_tracks_data(regions):
             file_name = f"{file_prefix}_{chrom}-{start}-{end}.{file_suffix}"
             if end - start < 200000:
                 warnings.warn("A region shorter than 200kb has been "
                               "detected! This can be too small to return "
                               "a proper TAD plot!\n")
             sys.stderr.write(f"saving {file_name}\n")
-            current_fig = trp.plot(file_name, chrom, start, end, title=args.title,
-                                   h_align_titles=args.trackLabelHAlign,
-                                   decreasing_x_axis=args.decreasingXAxis)
-            plt.close(current_fig)
+            # The figure is reused from one region to the other
+            # it is closed by trp.close_files()
+            trp.plot(file_name, chrom, start, end, title=args.title,
+                     h_align_titles=args.trackLabelHAlign,
+                     decreasing_x_axis=args.decreasingXAxis,
+                     tracks_data=tracks_data, reuse_figure=True)
     else:
         current_fig = trp.plot(args.outFileName, *regions[0], title=args.title,
                                h_align_titles=args.trackLabelHAlign,
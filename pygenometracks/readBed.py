@@ -1,7 +1,132 @@
 # -*- coding: utf-8 -*-
 import sys
 import collections
-from .utilities import to_string, InputError
+import itertools
+import warnings
+import numpy as np
+from .utilities import to_string, InputError, file_position, iter_chunk_lines
+
+# list of bed fields
+BED_FIELDS = ['chromosome', 'start', 'end',
+              'name', 'score', 'strand',
+              'thick_start', 'thick_end',
+              'rgb', 'block_count',
+              'block_sizes', 'block_starts']
+
+
+def _bed_interval_class(number_of_fields):
+    """
+    Returns a namedtuple class named BedInterval with
+    the number_of_fields first bed fields.
+    The class is stored in this module under the name
+    BedInterval<number_of_fields> so the intervals can be pickled.
+    """
+    bed_interval = collections.namedtuple('BedInterval',
+                                          BED_FIELDS[:number_of_fields])
+    bed_interval.__qualname__ = f'BedInterval{number_of_fields}'
+    return bed_interval
+
+
+BedInterval6 = _bed_interval_class(6)
+BedInterval7 = _bed_interval_class(7)
+BedInterval8 = _bed_interval_class(8)
+BedInterval9 = _bed_interval_class(9)
+BedInterval10 = _bed_interval_class(10)
+BedInterval11 = _bed_interval_class(11)
+BedInterval12 = _bed_interval_class(12)
+BED_INTERVAL_CLASSES = {6: BedInterval6, 7: BedInterval7, 8: BedInterval8,
+                        9: BedInterval9, 10: BedInterval10,
+                        11: BedInterval11, 12: BedInterval12}
+# Number of lines parsed at once by ReadBed.iter_columns
+CHUNK_SIZE = 100000
+
+
+def to_integers(values):
+    """
+    Returns the integers of a list of strings as a numpy array
+    (the unsigned integers are parsed at once).
+    Raises a ValueError if one of the strings is not an integer.
+
+    >>> to_integers(['1', '20', '300'])
+    array([  1,  20, 300])
+    >>> to_integers(['-1', '+20'])
+    array([-1, 20])
+    >>> to_integers(['1', '1.5'])
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid literal for int() with base 10: '1.5'
+    """
+    joined = ' '.join(values)
+    if joined.isascii() and joined.replace(' ', '').isdigit() and \
+       joined.count(' ') == len(values) - 1:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            integers = np.fromstring(joined, dtype=np.int64, sep=' ')
+        if len(integers) == len(values):
+            return integers
+    return np.array(values).astype(np.int64)
+
+
+def intervals_to_columns(bed_intervals):
+    """
+    Returns the columns (see ReadBed.get_columns) of
+    a list of BedInterval with the same fields
+    or None if the list is empty.
+
+    >>> columns = intervals_to_columns([
+    ...     BedInterval12('chr1', 0, 100, 'gene_1', 0, '+', 10, 90,
+    ...                   [0, 0, 0], 2, [20, 30], [0, 70])])
+    >>> columns['start'], columns['block_sizes']
+    (array([0]), (array([2]), array([20, 30])))
+    """
+    if len(bed_intervals) == 0:
+        return None
+    columns = {}
+    for field, values in zip(bed_intervals[0]._fields, zip(*bed_intervals)):
+        if field in ['start', 'end', 'thick_start', 'thick_end', 'block_count']:
+            values = np.array(values, dtype=np.int64)
+        elif field == 'score':
+            values = np.array(values, dtype=np.float64)
+        elif field in ['block_sizes', 'block_starts']:
+            values = (np.array([len(v) for v in values], dtype=np.int64),
+                      np.array(list(itertools.chain.from_iterable(values)),
+                               dtype=np.int64))
+        else:
+            values = list(values)
+        columns[field] = values
+    return columns
+
+
+def intervals_to_column_chunks(bed_intervals, chunk_size=CHUNK_SIZE):
+    """
+    Yields the columns (see ReadBed.get_columns) of an
+    iterable of BedInterval by chunks of chunk_size intervals.
+    """
+    bed_intervals = iter(bed_intervals)
+    while True:
+        columns = intervals_to_columns(list(itertools.islice(bed_intervals,
+                                                             chunk_size)))
+        if columns is None:
+            return
+        yield columns
+
+
+def read_bed_chunk(file_name, chunk, fields_to_read):
+    """
+    Returns the list of the columns (see ReadBed.get_columns)
+    of the lines of a chunk of a bed file (see utilities.split_file)
+    by chunks of CHUNK_SIZE lines or None if one of the lines
+    is not valid (the file should then be read sequentially
+    to get the warnings with the right line numbers).
+    """
+    bed_file_h = ReadBed(iter_chunk_lines(file_name, chunk), fields_to_read)
+    all_columns = []
+    for raw_lines in bed_file_h.iter_line_chunks():
+        columns = bed_file_h.get_columns([line.strip() for line in raw_lines])
+        if columns is None:
+            return None
+        all_columns.append(columns)
+    return all_columns
 
 
 class ReadBed(object):
@@ -17,9 +142,12 @@ class ReadBed(object):
 
     """
 
-    def __init__(self, file_handle):
+    def __init__(self, file_handle, fields_to_read=None):
         """
         :param file_handle: file handle
+        :param fields_to_read: number of fields to read at each line
+                               (by default it is guessed from the
+                               first line)
         :return:
         """
 
@@ -30,32 +158,189 @@ class ReadBed(object):
         self.fields_to_read = 12
         self.file_handle = file_handle
         self.line_number = 0
-        # guess file type
-        try:
-            fields = self.get_no_comment_line()
-        except StopIteration:
-            self.file_type = 'bed6'
+        if fields_to_read is not None:
+            self.fields_to_read = fields_to_read
+            self.file_type = 'bed6' if fields_to_read <= 6 else f'bed{fields_to_read}'
         else:
-            self.get_bed_interval(fields, is_first_line=True)
-        self.file_handle.seek(0)
+            # guess file type
+            try:
+                fields = self.get_no_comment_line()
+            except StopIteration:
+                self.file_type = 'bed6'
+            else:
+                self.get_bed_interval(fields, is_first_line=True)
+            self.file_handle.seek(0)
 
         # list of bed fields
-        self.fields = ['chromosome', 'start', 'end',
-                       'name', 'score', 'strand',
-                       'thick_start', 'thick_end',
-                       'rgb', 'block_count',
-                       'block_sizes', 'block_starts']
-
-        if self.fields_to_read <= 6:
-            self.BedInterval = collections.namedtuple('BedInterval',
-                                                      self.fields[:6])
-        else:
-            self.BedInterval = collections.namedtuple('BedInterval',
-                                                      self.fields[:self.fields_to_read])
+        self.fields = BED_FIELDS
+
+        self.BedInterval = BED_INTERVAL_CLASSES[max(6, self.fields_to_read)]
 
     def __iter__(self):
         return self
 
+    @property
+    def position(self):
+        """
+        The position in the file on disk
+        (in the compressed file if it is compressed).
+        """
+        return file_position(self.file_handle)
+
+    def iter_line_chunks(self, chunk_size=CHUNK_SIZE):
+        """
+        Reads the file by chunks of chunk_size lines
+        and yields the lines of each chunk without
+        the comments and the empty lines.
+        """
+        while True:
+            raw_lines = list(itertools.islice(self.file_handle, chunk_size))
+            if len(raw_lines) == 0:
+                return
+            if not isinstance(raw_lines[0], str):
+                raw_lines = to_string(raw_lines)
+            raw_lines = [line for line in raw_lines
+                         if not (line.startswith(("#", "track", "browser"))
+                                 or line.strip() == '')]
+            if len(raw_lines) > 0:
+                yield raw_lines
+
+    def iter_columns(self, chunk_size=CHUNK_SIZE):
+        """
+        Reads the file by chunks of chunk_size lines
+        and yields the columns of the intervals of each chunk.
+        The lines of a chunk are parsed all at once (see get_columns)
+        except if one of them is malformed: in this case the chunk is
+        parsed line by line with get_bed_interval so the warnings
+        and the errors are the same.
+        """
+        for raw_lines in self.iter_line_chunks(chunk_size):
+            columns = self.get_columns([line.strip() for line in raw_lines])
+            if columns is None:
+                bed_intervals = []
+                for line in raw_lines:
+                    self.line_number += 1
+                    bed_intervals.append(self.get_bed_interval(line))
+                columns = intervals_to_columns(bed_intervals)
+            else:
+                self.line_number += len(raw_lines)
+            yield columns
+
+    def get_columns(self, lines):
+        r"""
+        Parses the (stripped) lines of bed all at once.
+        Returns a dictionary with the bed fields as keys and:
+         - lists of strings for chromosome, name and strand
+         - numpy arrays for start, end, score, thick_start,
+           thick_end and block_count
+         - an array with one row per interval for rgb
+         - a tuple (number of blocks per interval, blocks values)
+           for block_sizes and block_starts.
+        Returns None if the lines do not have all the same number
+        of fields or if one of the lines is not valid.
+
+        >>> bed_lines = ["chr1\t0\t1000\tgene_1\t0.5\t-\t0\t1000\t0\t3\t10,20,300\t0,200,700",
+        ...              "chr1\t10\t100\tgene_2\t1\t+\t20\t50\t255,0,0\t1\t90,\t0,"]
+        >>> with open('/tmp/test.bed', 'w') as fh:
+        ...     foo = fh.write("\n".join(bed_lines))
+        >>> bed_f = ReadBed(open('/tmp/test.bed','r'))
+        >>> columns = bed_f.get_columns(bed_lines)
+        >>> columns['name'], columns['score']
+        (['gene_1', 'gene_2'], array([0.5, 1. ]))
+        >>> columns['rgb'].tolist()
+        [[0, 0, 0], [255, 0, 0]]
+        >>> columns['block_starts']
+        (array([3, 1]), array([  0, 200, 700,   0]))
+        >>> bed_f.get_columns(["chr1\t10\t100\tgene_2\t1\t1\t20\t50\t255,0,0\t1\t90,\t0,"]) is None
+        True
+        """
+        n_lines = len(lines)
+        n_fields = lines[0].count('\t') + 1
+        if n_fields < self.fields_to_read or \
+           any(line.count('\t') + 1 != n_fields for line in lines):
+            return None
+        fields = '\t'.join(lines).split('\t')
+        columns = {}
+        try:
+            for idx, field in enumerate(self.fields[:self.fields_to_read]):
+                values = fields[idx::n_fields]
+                if idx in [0, 3]:
+                    columns[field] = values
+                elif idx == 5:
+                    if not set(values).issubset(['+', '-', '.']):
+                        return None
+                    columns[field] = values
+                elif idx in [1, 2, 6, 7, 9]:
+                    columns[field] = to_integers(values)
+                elif idx == 4:
+                    columns[field] = np.array(values).astype(np.float64)
+                elif idx == 8:
+                    columns[field] = self.get_rgb_column(values)
+                    if columns[field] is None:
+                        return None
+                else:
+                    # block sizes and block starts
+                    n_parts = np.array([value.count(',') for value in values]) + 1
+                    parts = ','.join(values).split(',')
+                    is_value = np.array([part != '' for part in parts], dtype=bool)
+                    columns[field] = (np.bincount(np.repeat(np.arange(n_lines),
+                                                            n_parts)[is_value],
+                                                  minlength=n_lines),
+                                      to_integers([part for part in parts if part != '']))
+        except ValueError:
+            return None
+        if self.fields_to_read < 6:
+            # The default values are used
+            default = {'name': ".", 'score': 0., 'strand': "."}
+            for field in self.fields[self.fields_to_read:6]:
+                columns[field] = [default[field]] * n_lines
+            columns['score'] = np.array(columns['score'], dtype=np.float64)
+        if not np.all(columns['end'] > columns['start']):
+            return None
+        if self.fields_to_read == 12 and not self.are_blocks_valid(columns):
+            return None
+        return columns
+
+    @staticmethod
+    def get_rgb_column(values):
+        """
+        Returns the rgb of the values (either 'r,g,b' or an integer
+        which is used as blue) as an array with one row per value
+        or None if one of the values is not valid.
+        """
+        rgb = np.zeros((len(values), 3), dtype=np.int64)
+        n_commas = np.array([value.count(',') for value in values])
+        if not np.all((n_commas == 0) | (n_commas == 2)):
+            return None
+        is_single = n_commas == 0
+        if np.all(is_single):
+            rgb[:, 2] = to_integers(values)
+        else:
+            values = np.array(values)
+            rgb[is_single, 2] = to_integers(values[is_single].tolist())
+            rgb[~is_single] = to_integers(','.join(values[~is_single]).split(',')).reshape(-1, 3)
+        return rgb
+
+    @staticmethod
+    def are_blocks_valid(columns):
+        """
+        Checks the blocks of bed12 columns
+        like check_bed12 does for a single line.
+        """
+        block_counts = columns['block_count']
+        n_sizes, block_sizes = columns['block_sizes']
+        n_starts, block_relative_starts = columns['block_starts']
+        if not (np.all(n_sizes == block_counts) and np.all(n_starts == block_counts)
+                and np.all(block_counts > 0)):
+            return False
+        lengths = np.repeat(columns['end'] - columns['start'], block_counts)
+        block_ends = block_relative_starts + block_sizes
+        if np.any(block_relative_starts > lengths) or np.any(block_ends > lengths):
+            return False
+        offsets = np.concatenate([[0], np.cumsum(block_counts)[:-1]])
+        return np.all(np.minimum.reduceat(block_relative_starts, offsets) == 0) and \
+            np.all(np.maximum.reduceat(block_ends, offsets) == columns['end'] - columns['start'])
+
     def get_no_comment_line(self):
         """
         Skips comment lines starting with '#'
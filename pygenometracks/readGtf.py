@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
-import collections
-
 import gffutils
+import os
+import pickle
+import tempfile
 import warnings
-from .utilities import InputError
+import numpy as np
+from .utilities import InputError, get_cache_file_name, change_chrom_names, opener
+from .readBed import BED_FIELDS, BedInterval12, intervals_to_column_chunks
 import logging
 
 
@@ -31,6 +34,29 @@ warnings.filterwarnings("ignore", message="It appears you have a transcript "
                         "database creation")
 
 
+def parse_gtf_attributes(attributes):
+    """
+    Returns a dictionary with the first value of each attribute
+    (None if the attribute has no value), as gffutils does.
+
+    >>> parse_gtf_attributes('gene_id "G1"; tag "basic"; tag "CCDS"; level 2;')
+    {'gene_id': 'G1', 'tag': 'basic', 'level': '2'}
+    >>> parse_gtf_attributes('gene_id')
+    {'gene_id': None}
+    """
+    values = {}
+    for item in attributes.split(';'):
+        key_value = item.split(None, 1)
+        if len(key_value) == 0 or key_value[0] in values:
+            continue
+        if len(key_value) == 1:
+            values[key_value[0]] = None
+        else:
+            values[key_value[0]] = key_value[1].split('"')[1] \
+                if key_value[1].startswith('"') else key_value[1].split()[0]
+    return values
+
+
 class ReadGtf(object):
     """
     Reads a gtf file.
@@ -44,29 +70,78 @@ class ReadGtf(object):
 
     def __init__(self, file_path, prefered_name="transcript_name",
                  merge_transcripts=True,
-                 merge_overlapping_exons=True):
+                 merge_overlapping_exons=True,
+                 use_cache=False, use_gffutils=False):
         """
         :param file_path: the path of the gtf file
+        :param use_cache: if True, the bed12 intervals are
+                          stored in the cache directory and
+                          reused by the next runs.
+        :param use_gffutils: if True, the gtf is converted using
+                             a gffutils database, else it is
+                             converted in a single pass over the file
+                             (both give the same intervals).
         :return:
         """
 
         self.file_type = 'bed12'
 
         # list of bed fields
-        self.fields = ['chromosome', 'start', 'end',
-                       'name', 'score', 'strand',
-                       'thick_start', 'thick_end',
-                       'rgb', 'block_count',
-                       'block_sizes', 'block_starts']
+        self.fields = BED_FIELDS
 
-        self.BedInterval = collections.namedtuple('BedInterval', self.fields)
+        self.BedInterval = BedInterval12
         # I think the name which should be written
         # should be the transcript_name
         # But we can change it to gene_name
         self.prefered_name = prefered_name
         self.merge_transcripts = merge_transcripts
         self.merge_overlapping_exons = merge_overlapping_exons
+        # The bed12 intervals when they are all computed at once:
+        self.intervals = None
+        # The number of intervals already returned:
+        self.position = 0
+
+        if use_cache:
+            cache_file = self.get_cache_file_name(file_path)
+            if os.path.exists(cache_file):
+                with open(cache_file, 'rb') as f:
+                    intervals = [self.BedInterval._make(values)
+                                 for values in pickle.load(f)]
+            else:
+                if not use_gffutils:
+                    intervals = self.read_gtf(file_path)
+                else:
+                    self.create_db(file_path)
+                    if self.length == 0:
+                        intervals = []
+                    else:
+                        intervals = list(self)
+                # The cache is written to a temporary file
+                # which is renamed at the end
+                # to never use a partial cache
+                with tempfile.NamedTemporaryFile(dir=os.path.dirname(cache_file),
+                                                 delete=False) as f:
+                    pickle.dump([tuple(bed) for bed in intervals], f)
+                os.replace(f.name, cache_file)
+            self.set_intervals(intervals)
+        elif not use_gffutils:
+            self.set_intervals(self.read_gtf(file_path))
+        else:
+            self.create_db(file_path)
 
+    def get_cache_file_name(self, file_path):
+        """
+        The name of the cache depends on the path of the gtf file,
+        its modification time and the options used to convert
+        the gtf to bed12.
+        """
+        return get_cache_file_name(file_path,
+                                   f"{self.prefered_name}"
+                                   f".{int(self.merge_transcripts)}"
+                                   f"{int(self.merge_overlapping_exons)}"
+                                   ".bed12.pkl")
+
+    def create_db(self, file_path):
         # Will process the gtf to get one item per transcript:
         # This will create a database:
         try:
@@ -90,15 +165,261 @@ class ReadGtf(object):
                 self.all_transcripts = self.db.features_of_type("transcript",
                                                                 order_by='start')
 
+    def read_gtf(self, file_path):
+        """
+        Converts the gtf to a list of bed12 intervals
+        in a single pass over the file.
+        The genes and transcripts are the ones gffutils would
+        have in its database: the ones described in the gtf
+        and the ones inferred from the exons.
+        The children of a gene (or of a transcript) are
+        all the lines with this gene_id (or transcript_id).
+        """
+        # The genes and transcripts of the gtf:
+        # featuretype, id, chrom, start, end, strand, name
+        features = []
+        features_ids = set()
+        n_autoid = {'gene': 0, 'transcript': 0}
+        # For each parent id:
+        # the min start and max end of all the children:
+        children_extent = {}
+        # the exons as start, end, chrom, strand, name:
+        exons = {}
+        # the CDS as start, end:
+        cds = {}
+        # The gene(s) of each transcript id
+        transcript_genes = {}
+        # The transcripts with exons (with transcript_id)
+        transcripts_with_exons = set()
+        n_lines = 0
+        n_exons = 0
+        with opener(file_path) as f:
+            for line in f:
+                line = line.decode('utf-8')
+                if line.startswith('#') or line.strip() == '':
+                    continue
+                fields = line.rstrip('\r\n').split('\t')
+                try:
+                    featuretype = fields[2]
+                    start = int(fields[3])
+                    end = int(fields[4])
+                    attributes = parse_gtf_attributes(fields[8])
+                except (IndexError, ValueError):
+                    raise InputError("This is not a gtf file.")
+                n_lines += 1
+                parents = []
+                transcript_id = attributes.get('transcript_id')
+                gene_id = attributes.get('gene_id')
+                if transcript_id is not None:
+                    parents.append(transcript_id)
+                if gene_id is not None:
+                    if gene_id not in parents:
+                        parents.append(gene_id)
+                    if transcript_id is not None:
+                        transcript_genes.setdefault(transcript_id,
+                                                    set()).add(gene_id)
+                if featuretype in n_autoid:
+                    feature_id = attributes.get(featuretype + '_id')
+                    if feature_id is None:
+                        n_autoid[featuretype] += 1
+                        feature_id = f"{featuretype}_{n_autoid[featuretype]}"
+                    if feature_id in features_ids:
+                        raise InputError("This is not a gtf file. "
+                                         f"{feature_id} is present multiple"
+                                         " times.")
+                    features_ids.add(feature_id)
+                    features.append((featuretype, feature_id, fields[0],
+                                     start, end, fields[6],
+                                     attributes.get(self.prefered_name)))
+                for parent in parents:
+                    if parent in children_extent:
+                        min_start, max_end = children_extent[parent]
+                        children_extent[parent] = (min(min_start, start),
+                                                   max(max_end, end))
+                    else:
+                        children_extent[parent] = (start, end)
+                    if featuretype == 'exon':
+                        exons.setdefault(parent, []).append((start, end,
+                                                             fields[0], fields[6],
+                                                             attributes.get(self.prefered_name)))
+                    elif featuretype == 'CDS':
+                        cds.setdefault(parent, []).append((start, end))
+                if featuretype == 'exon':
+                    n_exons += 1
+                    if transcript_id is not None:
+                        transcripts_with_exons.add(transcript_id)
+        if n_lines == 0:
+            return []
+
+        # The transcripts and the genes which are not in the gtf
+        # are inferred from the exons:
+        inferred_genes = set()
+        inferred_transcripts = []
+        for transcript_id in transcripts_with_exons:
+            if transcript_id in transcript_genes:
+                genes = transcript_genes[transcript_id]
+                inferred_transcripts.append((min(genes), transcript_id))
+                inferred_genes.update(genes)
+        for featuretype, inferred in [('transcript',
+                                       [t for __, t in sorted(inferred_transcripts)]),
+                                      ('gene', sorted(inferred_genes))]:
+            for feature_id in inferred:
+                if feature_id in features_ids or feature_id not in exons:
+                    continue
+                features_ids.add(feature_id)
+                feature_exons = exons[feature_id]
+                features.append((featuretype, feature_id,
+                                 feature_exons[0][2],
+                                 min([e[0] for e in feature_exons]),
+                                 max([e[1] for e in feature_exons]),
+                                 feature_exons[0][3], None))
+
+        if self.merge_transcripts:
+            featuretype = 'gene'
+        else:
+            featuretype = 'transcript'
+        features = sorted([f for f in features if f[0] == featuretype],
+                          key=lambda f: f[3])
+        if len(features) == 0 and not self.merge_transcripts:
+            # This is unexpected as the database contains things
+            log.warning("No transcript found consider. If your gtf only have genes, use `merge_transcripts = true`")
+
+        # The blocks of each feature:
+        if n_exons > 0:
+            feature_exons = [sorted(exons.get(f[1], []), key=lambda e: e[0])
+                             for f in features]
+            blocks_starts, blocks_ends = \
+                self.get_blocks(feature_exons, self.merge_overlapping_exons)
+        else:
+            # The gtf does not have exon info:
+            # The block goes from the first to the last child
+            blocks_starts = []
+            blocks_ends = []
+            for __, feature_id, __, start, end, __, __ in features:
+                start, end = children_extent.get(feature_id, (start, end))
+                blocks_starts.append([start - 1])
+                blocks_ends.append([end])
+            feature_exons = [[] for f in features]
+
+        intervals = []
+        for (__, feature_id, chrom, start, end, strand, name), f_exons, \
+                exons_starts, exons_ends in zip(features, feature_exons,
+                                                blocks_starts, blocks_ends):
+            if name is None:
+                # Else try to guess the prefered_name from exons:
+                exons_names = [e[4] for e in f_exons]
+                if len(exons_names) > 0 and None not in exons_names:
+                    name = exons_names[0]
+                else:
+                    # Else take the transcript id
+                    name = feature_id
+            # If the cds is defined in the gtf,
+            # use it to define the thick start and end
+            # The gtf is 1-based closed intervalls
+            # and bed are 0-based half-open so:
+            # I need to remove one from each start
+            if feature_id in cds:
+                cds_start = min([c[0] for c in cds[feature_id]]) - 1
+                # The end of the last CDS (the one with the last start):
+                cds_end = max(cds[feature_id], key=lambda c: c[0])[1]
+            else:
+                cds_start = start - 1
+                cds_end = start - 1
+            exons_length = [e - s for s, e in zip(exons_starts, exons_ends)]
+            relative_exons_starts = [s - (start - 1) for s in exons_starts]
+            intervals.append(self.BedInterval._make([chrom, start - 1, end,
+                                                     name, 0, strand,
+                                                     cds_start, cds_end, "0",
+                                                     len(exons_starts),
+                                                     exons_length,
+                                                     relative_exons_starts]))
+        return intervals
+
+    @staticmethod
+    def get_blocks(features_exons, merge_overlapping_exons):
+        """
+        Returns the list of the 0-based starts and
+        the list of the ends of the blocks of each feature
+        from the exons (1-based start, end) sorted by start.
+        The overlapping exons of a feature are merged
+        if merge_overlapping_exons.
+
+        >>> exons = [[(1, 100), (50, 150), (151, 200)], [], [(10, 20)]]
+        >>> ReadGtf.get_blocks(exons, True)
+        ([[0, 150], [], [9]], [[150, 200], [], [20]])
+        >>> ReadGtf.get_blocks(exons, False)
+        ([[0, 49, 150], [], [9]], [[100, 150, 200], [], [20]])
+        """
+        starts = np.array([e[0] for f_exons in features_exons
+                           for e in f_exons], dtype=np.int64)
+        ends = np.array([e[1] for f_exons in features_exons
+                         for e in f_exons], dtype=np.int64)
+        # The index of the feature of each exon:
+        feature_index = np.repeat(np.arange(len(features_exons)),
+                                  [len(f_exons) for f_exons in features_exons])
+        if merge_overlapping_exons and len(starts) > 0:
+            # The coordinates of each feature are shifted
+            # so that the exons of different features never overlap
+            # and a single cumulative max gives the end of
+            # the current block:
+            shift = feature_index * (ends.max() + 1)
+            running_end = np.maximum.accumulate(ends + shift)
+            new_block = np.ones(len(starts), dtype=bool)
+            new_block[1:] = starts[1:] + shift[1:] > running_end[:-1]
+            block_first_exon = np.flatnonzero(new_block)
+            starts = starts[block_first_exon]
+            ends = np.maximum.reduceat(ends, block_first_exon)
+            feature_index = feature_index[block_first_exon]
+        limits = np.searchsorted(feature_index,
+                                 np.arange(len(features_exons) + 1)).tolist()
+        starts = (starts - 1).tolist()
+        ends = ends.tolist()
+        return ([starts[first:last] for first, last in zip(limits[:-1], limits[1:])],
+                [ends[first:last] for first, last in zip(limits[:-1], limits[1:])])
+
+    def set_intervals(self, intervals):
+        """
+        The intervals are already converted to bed12
+        (they come from the cache or from read_gtf).
+        """
+        self.intervals = intervals
+        self.length = len(intervals)
+        self.all_transcripts = iter(intervals)
+
+    def restrict_to_regions(self, plot_regions, around_region=0):
+        """
+        Only keeps the intervals which overlap the plot_regions
+        extended by around_region (using both versions of the
+        chromosome names). Only possible when the cache is used.
+        """
+        regions = [(chrom_name, max(0, start - around_region),
+                    end + around_region)
+                   for chrom, start, end in plot_regions
+                   for chrom_name in [chrom, change_chrom_names(chrom)]]
+        self.set_intervals([bed for bed in self.intervals
+                            if any(bed.chromosome == chrom
+                                   and bed.start < end and bed.end > start
+                                   for chrom, start, end in regions)])
+
     def __iter__(self):
         return self
 
+    def iter_columns(self):
+        """
+        Yields the columns (see ReadBed.get_columns)
+        of the intervals by chunks.
+        """
+        return intervals_to_column_chunks(self)
+
     def __next__(self):
         """
         :return: bedInterval object
         """
-        bed = self.get_bed_interval()
-
+        if self.intervals is not None:
+            bed = next(self.all_transcripts)
+        else:
+            bed = self.get_bed_interval()
+        self.position += 1
         return bed
 
     def get_bed_interval(self):
@@ -0,0 +1,27 @@
+import pytest
+from pygenometracks.utilities import data_sources
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """
+    The files which are cached from one run to the other
+    (maf and fasta indexes, gtf converted to bed12)
+    are written in a temporary directory for each test
+    instead of the cache directory of the user.
+    """
+    cache_dir = tmp_path / 'pyGenomeTracks_cache'
+    monkeypatch.setenv('PYGENOMETRACKS_CACHE_DIR', str(cache_dir))
+    return cache_dir
+
+
+@pytest.fixture(autouse=True)
+def empty_data_sources(monkeypatch):
+    """
+    Each test starts with no shared data source
+    (see utilities.DataSources) so the tests checking
+    the data sources do not depend on the tracks
+    which were not closed by the other tests.
+    """
+    monkeypatch.setattr(data_sources, 'sources', {})
+    return data_sources
@@ -4,6 +4,7 @@ from matplotlib.testing.compare import compare_images
 from tempfile import NamedTemporaryFile
 import os.path
 import pygenometracks.plotTracks
+import pysam
 from pygenometracks.utilities import InputError
 mpl.use('agg')
 
@@ -356,6 +357,47 @@ overlay_previous = share-y
 with open(os.path.join(ROOT, "arcs_overlay.ini"), 'w') as fh:
     fh.write(browser_tracks)
 
+browser_tracks = """
+[arcs]
+title = 2000 links max_links = none
+file = many_links.arcs
+color = bwr
+height = 5
+max_links = none
+
+[spacer]
+
+[arcs]
+title = 2000 links max_links = 500
+file = many_links.arcs
+color = bwr
+height = 5
+max_links = 500
+
+[spacer]
+
+[arcs]
+title = 2000 links links_type = squares max_links = 500
+file = many_links.arcs
+color = red
+line_width = 1
+height = 10
+links_type = squares
+max_links = 500
+
+[x-axis]
+where = bottom
+"""
+with open(os.path.join(ROOT, "many_links.ini"), 'w') as fh:
+    fh.write(browser_tracks)
+
+# The links compressed with bgzip and indexed from start1 to end2
+pysam.tabix_index(os.path.join(ROOT, "many_links.arcs"), force=True,
+                  seq_col=0, start_col=1, end_col=5, zerobased=True,
+                  keep_original=True)
+with open(os.path.join(ROOT, "many_links_tabix.ini"), 'w') as fh:
+    fh.write(browser_tracks.replace('many_links.arcs', 'many_links.arcs.gz'))
+
 tolerance = 13  # default matplotlib pixed difference tolerance
 
 
@@ -523,3 +565,21 @@ def test_arcs_overlay():
     assert res is None, res
 
     os.remove(outfile.name)
+
+
+def test_many_links_density():
+    outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
+                                 delete=False)
+    for suf in ['', '_tabix']:
+        ini_file = os.path.join(ROOT, f"many_links{suf}.ini")
+        region = "chr11:40000000-46000000"
+        expected_file = os.path.join(ROOT, 'master_many_links.png')
+        args = f"--tracks {ini_file} --region {region} "\
+               "--trackLabelFraction 0.2 --width 38 --dpi 130 "\
+               f"--outFileName {outfile.name}".split()
+        pygenometracks.plotTracks.main(args)
+        res = compare_images(expected_file,
+                             outfile.name, tolerance)
+        assert res is None, res
+
+        os.remove(outfile.name)
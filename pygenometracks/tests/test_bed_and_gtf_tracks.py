@@ -4,7 +4,9 @@ mpl.use('agg')
 from matplotlib.testing.compare import compare_images
 from tempfile import NamedTemporaryFile
 import os.path
+import itertools
 import pygenometracks.plotTracks
+from pygenometracks.readGtf import ReadGtf
 from pygenometracks.utilities import InputError
 
 
@@ -625,6 +627,10 @@ with open(os.path.join(ROOT, "bed_vlines.ini"), 'w') as fh:
     fh.write(browser_tracks)
 with open(os.path.join(ROOT, "bed_vlines_incorrect.ini"), 'w') as fh:
     fh.write(browser_tracks + 'line_style = dashed\n')
+# The vlines from a bigBed (global_max_row cannot be used with bigBed)
+with open(os.path.join(ROOT, "bed_vlines_bigbed.ini"), 'w') as fh:
+    fh.write(browser_tracks.replace('tad_classification.bed',
+                                    'tad_classification.bb'))
 
 browser_tracks = """
 [x-axis]
@@ -1063,6 +1069,30 @@ def test_plot_tracks_bed_with_maxLab_BED():
         os.remove(output_file)
 
 
+def test_plot_tracks_bed_with_maxLab_BED_threads():
+    extension = '.png'
+
+    outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
+                                 delete=False)
+    ini_file = os.path.join(ROOT, "bed_maxLab_tracks.ini")
+    bed_file = os.path.join(ROOT, 'imbricated_X_regions.bed')
+    args = f"--tracks {ini_file} --BED {bed_file} "\
+           "--trackLabelFraction 0.2 --width 38 --dpi 130 "\
+           f"--threads 3 --outFileName {outfile.name}".split()
+    pygenometracks.plotTracks.main(args)
+    for region, expected_basename_file in [("X:2000000-3500000", "master_maxLab"),
+                                           ("X:3000000-3500000", "master_maxLab_zoom")]:
+        region_str = region.replace(':', '-')
+        output_file = outfile.name[:-4] + '_' + region_str + extension
+        expected_file = os.path.join(ROOT, expected_basename_file
+                                     + extension)
+        res = compare_images(expected_file,
+                             output_file, tolerance)
+        assert res is None, res
+
+        os.remove(output_file)
+
+
 def test_plot_tracks_genes_rgb():
 
     outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
@@ -1207,7 +1237,7 @@ def test_plot_tracks_bed_vlines():
     outfile = NamedTemporaryFile(suffix=extension, prefix='pyGenomeTracks_test_',
                                  delete=False)
     bed_file = os.path.join(ROOT, 'regionsXfakeChr.bed')
-    for suf in ['', '_incorrect']:
+    for suf in ['', '_incorrect', '_bigbed']:
         ini_file = os.path.join(ROOT, f"bed_vlines{suf}.ini")
         args = f"--tracks {ini_file} --BED {bed_file} "\
                "--trackLabelFraction 0.5 --width 38 --dpi 130 "\
@@ -1224,10 +1254,33 @@ def test_plot_tracks_bed_vlines():
             assert res is None, res
 
             os.remove(output_file)
-        if 'incorrect' in ini_file:
+        if 'incorrect' in ini_file or 'bigbed' in ini_file:
             os.remove(ini_file)
 
 
+def test_bigbed_global_max_row():
+    outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
+                                 delete=False)
+    ini_file = NamedTemporaryFile(suffix='.ini', mode='w', delete=False)
+    ini_file.write(f"""
+[genes]
+file = {os.path.join(ROOT, 'dm3_genes_withrgbandscore.bb')}
+global_max_row = true
+""")
+    ini_file.close()
+    region = "X:3000000-3300000"
+    args = f"--tracks {ini_file.name} --region {region} "\
+           f"--outFileName {outfile.name}".split()
+    try:
+        pygenometracks.plotTracks.main(args)
+    except InputError as e:
+        assert 'global_max_row' in str(e)
+    else:
+        raise Exception("global_max_row with a bigBed file should fail.")
+    os.remove(ini_file.name)
+    os.remove(outfile.name)
+
+
 def test_plot_tracks_genes_italic():
 
     outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
@@ -1374,3 +1427,51 @@ def test_rtf():
             raise Exception(f"The bed_invalid_rtf{suf} should fail.")
 
         os.remove(ini_file)
+
+
+def test_gtf_cache(cache_dir, monkeypatch):
+    # cache_dir is a temporary cache directory (see conftest.py)
+    gtf_file = os.path.join(ROOT, "HoxD.gtf")
+
+    def read_gtf_not_called(self, file_path):
+        raise AssertionError("The gtf should be read from the cache.")
+
+    for merge_transcripts in [True, False]:
+        # The first time, the gtf is parsed:
+        expected = list(ReadGtf(gtf_file,
+                                merge_transcripts=merge_transcripts,
+                                use_cache=True))
+        assert len(expected) > 0
+        # The second time, the cache is used:
+        with monkeypatch.context() as m:
+            m.setattr(ReadGtf, 'read_gtf', read_gtf_not_called)
+            cached_gtf = ReadGtf(gtf_file,
+                                 merge_transcripts=merge_transcripts,
+                                 use_cache=True)
+        assert cached_gtf.length == len(expected)
+        assert list(cached_gtf) == expected
+    # One cache per set of options:
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_gtf_reader_as_gffutils():
+    # The blocks of exons with the same start
+    # may be in any order with gffutils
+    # When the transcripts are merged, the transcript_name of
+    # the gene is any of its transcripts with gffutils
+    def normalize(bed):
+        blocks = sorted(zip(bed.block_starts, bed.block_sizes))
+        return bed._replace(block_starts=[b[0] for b in blocks],
+                            block_sizes=[b[1] for b in blocks])
+    for gtf_file, merge_transcripts, merge_overlapping_exons in \
+        itertools.product(["HoxD.gtf", "no_exon.gtf",
+                           "dm3_subset_BDGP5.78.gtf.gz"],
+                          [True, False], [True, False]):
+        prefered_name = "gene_name" if merge_transcripts else "transcript_name"
+        intervals = [list(ReadGtf(os.path.join(ROOT, gtf_file), prefered_name,
+                                  merge_transcripts, merge_overlapping_exons,
+                                  use_gffutils=use_gffutils))
+                     for use_gffutils in [True, False]]
+        assert len(intervals[0]) > 0
+        assert sorted([normalize(bed) for bed in intervals[0]]) == \
+            sorted([normalize(bed) for bed in intervals[1]])
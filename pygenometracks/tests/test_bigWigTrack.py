@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 import matplotlib as mpl
 mpl.use('agg')
+import matplotlib.pyplot as plt
 from matplotlib.testing.compare import compare_images
 from tempfile import NamedTemporaryFile
 import os.path
 import pygenometracks.plotTracks
+from pygenometracks.tracksClass import PlotTracks
 
 ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                     "test_data")
@@ -663,3 +665,44 @@ def test_op_with_scientific_notation():
     assert res is None, res
 
     os.remove(outfile.name)
+
+
+def test_number_of_bins_auto():
+    ini_content = f"""
+[bigwig]
+file = {os.path.join(ROOT, "bigwig_chrx_2e6_5e6.bw")}
+number_of_bins = auto
+
+[bedgraph]
+file = {os.path.join(ROOT, "bedgraph_chrx_2e6_5e6.bg")}
+summary_method = mean
+number_of_bins = auto
+"""
+    with NamedTemporaryFile(suffix='.ini', mode='w',
+                            delete=False) as ini_file:
+        ini_file.write(ini_content)
+    for fig_width, dpi in [(10, 72), (40, 200)]:
+        trp = PlotTracks(ini_file.name, fig_width=fig_width, dpi=dpi,
+                         plot_regions=[('X', 3000000, 3500000)])
+        # There is one bin per pixel of the plot
+        for track in trp.track_obj_list:
+            data = track.fetch('X', 3000000, 3500000)
+            assert len(data.scores) == int(track.plot_width_px)
+        trp.close_files()
+    os.remove(ini_file.name)
+
+
+def test_plot_wraps_fetch_and_draw():
+    ini_file = os.path.join(ROOT, "bigwig.ini")
+    trp = PlotTracks(ini_file, plot_regions=[('X', 2700000, 3100000)])
+    track = trp.track_obj_list[0]
+    # plot is kept for the external callers and fetches then draws
+    fig, ax = plt.subplots()
+    track.plot(ax, 'X', 2700000, 3100000)
+    assert len(ax.get_children()) > 0
+    fig_draw, ax_draw = plt.subplots()
+    track.draw(ax_draw, track.fetch('X', 2700000, 3100000))
+    assert ax.get_ylim() == ax_draw.get_ylim()
+    plt.close(fig)
+    plt.close(fig_draw)
+    trp.close_files()
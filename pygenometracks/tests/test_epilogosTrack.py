@@ -90,3 +90,22 @@ def test_epilogos_track_over_chr_end():
     assert res is None, res
 
     os.remove(outfile.name)
+
+
+def test_epilogos_track_wide():
+    # There are more bins than pixels so
+    # the mean of each category per pixel is plotted
+    outfile = NamedTemporaryFile(suffix='.png', prefix='bedgraph_test_',
+                                 delete=False)
+    ini_file = os.path.join(ROOT, "epilogos.ini")
+    region = "X:2000000-3500000"
+    expected_file = os.path.join(ROOT, 'master_epilogos_wide.png')
+    args = f"--tracks {ini_file} --region {region} "\
+           "--trackLabelFraction 0.2 --dpi 130 "\
+           f"--outFileName {outfile.name}".split()
+    pygenometracks.plotTracks.main(args)
+    res = compare_images(expected_file,
+                         outfile.name, tolerance)
+    assert res is None, res
+
+    os.remove(outfile.name)
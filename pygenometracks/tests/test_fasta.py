@@ -3,12 +3,54 @@ import matplotlib as mpl
 from matplotlib.testing.compare import compare_images
 from tempfile import NamedTemporaryFile
 import os.path
+import gzip
+import shutil
+import re
+import struct
+import zlib
+import pyfaidx
+import pysam
 import pygenometracks.plotTracks
+from pygenometracks.utilities import InputError
+from pygenometracks.tracks.FastaTrack import get_bgzip_blocks
 mpl.use('agg')
 
 ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                     "test_data")
 
+
+def fasta_to_2bit(fasta_file, twobit_file):
+    """
+    Writes the sequences of fasta_file in the 2bit format
+    (the lower case are masked)
+    """
+    fasta = pyfaidx.Fasta(fasta_file, sequence_always_upper=False)
+    records = []
+    for name in fasta.keys():
+        seq = str(fasta[name][:])
+        blocks = []
+        for pattern in ['[Nn]+', '[a-z]+']:
+            matches = list(re.finditer(pattern, seq))
+            blocks += [struct.pack('<I', len(matches))]
+            blocks += [struct.pack('<' + 'I' * len(matches), *[m.start() for m in matches]),
+                       struct.pack('<' + 'I' * len(matches), *[m.end() - m.start() for m in matches])]
+        codes = [{'T': 0, 'C': 1, 'A': 2, 'G': 3}.get(base, 0) for base in seq.upper()]
+        codes += [0] * (- len(codes) % 4)
+        packed = bytes([codes[i] << 6 | codes[i + 1] << 4 | codes[i + 2] << 2 | codes[i + 3]
+                        for i in range(0, len(codes), 4)])
+        records.append((name, struct.pack('<I', len(seq)) + b''.join(blocks)
+                        + struct.pack('<I', 0) + packed))
+    fasta.close()
+    offset = 16 + sum([1 + len(name) + 4 for name, _ in records])
+    with open(twobit_file, 'wb') as f:
+        f.write(struct.pack('<IIII', 0x1A412743, 0, len(records), 0))
+        for name, record in records:
+            f.write(struct.pack('<B', len(name)) + name.encode() + struct.pack('<I', offset))
+            offset += len(record)
+        for name, record in records:
+            f.write(record)
+
+
 browser_tracks = """
 [x-axis]
 
@@ -32,6 +74,17 @@ file_type = bed
 with open(os.path.join(ROOT, "fasta_tracks.ini"), 'w') as fh:
     fh.write(browser_tracks)
 
+# The same sequence as 2bit and compressed with bgzip:
+fasta_to_2bit(os.path.join(ROOT, "fasta_track.fasta"),
+              os.path.join(ROOT, "fasta_track.2bit"))
+pysam.tabix_compress(os.path.join(ROOT, "fasta_track.fasta"),
+                     os.path.join(ROOT, "fasta_track.fasta.gz"),
+                     force=True)
+for ending in ['2bit', 'fasta.gz']:
+    with open(os.path.join(ROOT, f"fasta_tracks_{ending.replace('.', '_')}.ini"), 'w') as fh:
+        fh.write(browser_tracks.replace("fasta_track.fasta",
+                                        f"fasta_track.{ending}"))
+
 browser_tracks = """
 [x-axis]
 
@@ -46,6 +99,47 @@ height = 5
 with open(os.path.join(ROOT, "fasta_track_malformed.ini"), 'w') as fh:
     fh.write(browser_tracks)
 
+browser_tracks = """
+[x-axis]
+
+[gc]
+file = fasta_track.fasta
+title = GC percent (number_of_bins = 100)
+number_of_bins = 100
+height = 3
+file_type = gc_content
+
+[cpg_oe]
+file = fasta_track.2bit
+title = CpG o/e from 2bit (type = line, number_of_bins = 50)
+composition = cpg_oe
+number_of_bins = 50
+type = line
+color = darkred
+height = 3
+file_type = gc_content
+
+[n_fraction]
+file = fasta_track.fasta.gz
+title = N fraction from bgzip fasta (max_value = 0.2)
+composition = n_fraction
+max_value = 0.2
+color = grey
+height = 3
+file_type = gc_content
+
+[annotation]
+file = fasta_track.bed
+title = Annotation
+height = 2
+color = darkblue
+labels = false
+fontsize = 10
+file_type = bed
+"""
+with open(os.path.join(ROOT, "gc_content.ini"), 'w') as fh:
+    fh.write(browser_tracks)
+
 tolerance = 13  # default matplotlib pixed difference tolerance
 
 
@@ -67,6 +161,25 @@ def test_fasta_zoomout():
     os.remove(outfile.name)
 
 
+def test_fasta_bars():
+
+    outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
+                                 delete=False)
+    ini_file = os.path.join(ROOT, "fasta_tracks.ini")
+    # The region is too large to plot letters
+    region = "rDNA_unit_8919x2_bp:0-1000"
+    expected_file = os.path.join(ROOT, 'master_fasta_tracks_bars.png')
+    args = f"--tracks {ini_file} --region {region} "\
+           "--trackLabelFraction 0.2 --width 38 --dpi 130 "\
+           f"--outFileName {outfile.name}".split()
+    pygenometracks.plotTracks.main(args)
+    res = compare_images(expected_file,
+                         outfile.name, tolerance)
+    assert res is None, res
+
+    os.remove(outfile.name)
+
+
 def test_fasta_zoomin():
 
     outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
@@ -193,3 +306,88 @@ def test_fasta_malformed():
     assert res is None, res
 
     os.remove(outfile.name)
+
+
+def test_fasta_2bit_bgzip():
+    for ending in ['2bit', 'fasta_gz']:
+        ini_file = os.path.join(ROOT, f"fasta_tracks_{ending}.ini")
+        for region, expected in [("rDNA_unit_8919x2_bp:0-11", 'zoomin'),
+                                 ("rDNA_unit_8919x2_bp:17840-17850", 'end_chr')]:
+            outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
+                                         delete=False)
+            expected_file = os.path.join(ROOT, f'master_fasta_tracks_{expected}.png')
+            args = f"--tracks {ini_file} --region {region} "\
+                   "--trackLabelFraction 0.2 --width 38 --dpi 130 "\
+                   f"--outFileName {outfile.name}".split()
+            pygenometracks.plotTracks.main(args)
+            res = compare_images(expected_file,
+                                 outfile.name, tolerance)
+            assert res is None, res
+
+            os.remove(outfile.name)
+
+
+def test_bgzip_blocks_extra_subfields():
+    # A bgzip file where the BC subfield is not the first extra subfield
+    contents = [b'>chr1\nACGT\n', b'ACGTACGT\n', b'']
+    with NamedTemporaryFile(suffix='.fa.gz', delete=False) as f:
+        for content in contents:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            data = compressor.compress(content) + compressor.flush()
+            extra = b''.join([b'XY', struct.pack('<H', 2), b'ab',
+                              b'BC', struct.pack('<H', 2),
+                              struct.pack('<H', 12 + 12 + len(data) + 8 - 1)])
+            f.write(b''.join([b'\x1f\x8b\x08\x04', bytes(6),
+                              struct.pack('<H', len(extra)), extra, data,
+                              struct.pack('<II', zlib.crc32(content), len(content))]))
+    blocks = get_bgzip_blocks(f.name)
+    assert blocks[:, 1].tolist() == [0, len(contents[0]),
+                                     len(contents[0]) + len(contents[1])]
+    with gzip.open(f.name, 'rb') as fh:
+        assert fh.read() == b''.join(contents)
+    os.remove(f.name)
+
+
+def test_fasta_plain_gzip():
+    fasta_file = os.path.join(ROOT, "fasta_track_plain_gzip.fasta.gz")
+    with open(os.path.join(ROOT, "fasta_track.fasta"), 'rb') as f_in:
+        with gzip.open(fasta_file, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+    ini_file = os.path.join(ROOT, "fasta_track_plain_gzip.ini")
+    with open(ini_file, 'w') as fh:
+        fh.write(f"[fasta]\nfile = {fasta_file}\n")
+    outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
+                                 delete=False)
+    region = "rDNA_unit_8919x2_bp:0-11"
+    args = f"--tracks {ini_file} --region {region} "\
+           f"--outFileName {outfile.name}".split()
+    try:
+        pygenometracks.plotTracks.main(args)
+    except InputError as e:
+        assert 'compress it with bgzip' in str(e)
+    else:
+        raise Exception("The plot of a fasta compressed with gzip should fail.")
+    finally:
+        os.remove(fasta_file)
+        os.remove(ini_file)
+        os.remove(outfile.name)
+
+
+def test_gc_content():
+    extension = '.png'
+    ini_file = os.path.join(ROOT, "gc_content.ini")
+    for region in ["rDNA_unit_8919x2_bp:0-17838",
+                   "rDNA_unit_8919x2_bp:1000-3000"]:
+        outfile = NamedTemporaryFile(suffix=extension, prefix='pyGenomeTracks_test_',
+                                     delete=False)
+        region_str = region.replace(':', '-')
+        expected_file = os.path.join(ROOT, f'master_gc_content_{region_str}.png')
+        args = f"--tracks {ini_file} --region {region} "\
+               "--trackLabelFraction 0.2 --width 38 --dpi 130 "\
+               f"--outFileName {outfile.name}".split()
+        pygenometracks.plotTracks.main(args)
+        res = compare_images(expected_file,
+                             outfile.name, tolerance)
+        assert res is None, res
+
+        os.remove(outfile.name)
@@ -4,7 +4,11 @@ mpl.use('agg')
 from matplotlib.testing.compare import compare_images
 from tempfile import NamedTemporaryFile
 import os.path
+import gzip
+import shutil
+import pysam
 import pygenometracks.plotTracks
+from pygenometracks.utilities import InputError
 
 
 ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
@@ -128,6 +132,14 @@ height = 5
 with open(os.path.join(ROOT, "maf_withe.ini"), 'w') as fh:
     fh.write(browser_tracks)
 
+# The same with the maf compressed with bgzip:
+pysam.tabix_compress(os.path.join(ROOT, "mm10_chr2_isl2_lessspe.maf"),
+                     os.path.join(ROOT, "mm10_chr2_isl2_lessspe.maf.gz"),
+                     force=True)
+with open(os.path.join(ROOT, "maf_withe_bgzip.ini"), 'w') as fh:
+    fh.write(browser_tracks.replace("mm10_chr2_isl2_lessspe.maf",
+                                    "mm10_chr2_isl2_lessspe.maf.gz"))
+
 tolerance = 13  # default matplotlib pixed difference tolerance
 
 
@@ -308,5 +320,68 @@ def test_second_maf_withe():
                              outfile.name, tolerance)
         assert res is None, res
         os.remove(outfile.name)
-    # Remove the index file:
-    os.remove(os.path.join(ROOT, 'mm10_chr2_isl2_lessspe.maf.index'))
+    # The index is not next to the file but in the cache directory:
+    assert not os.path.exists(os.path.join(ROOT, 'mm10_chr2_isl2_lessspe.maf.index'))
+    assert len(os.listdir(os.environ['PYGENOMETRACKS_CACHE_DIR'])) > 0
+
+
+def test_second_maf_withe_bgzip():
+    extension = '.png'
+    ini_file = os.path.join(ROOT, "maf_withe_bgzip.ini")
+
+    for i, region in enumerate(['chr2:74,070,244-74,071,016',
+                                'chr2:74,075,687-74,075,808'],
+                               start=1):
+        outfile = NamedTemporaryFile(suffix=extension, prefix='pyGenomeTracks_test_',
+                                     delete=False)
+        expected_file = os.path.join(ROOT, f'master_maf_withe_region{i}.png')
+        args = f"--tracks {ini_file} --region {region} "\
+            "--trackLabelFraction 0.2 --width 38 --dpi 130 "\
+            f"--outFileName {outfile.name}".split()
+        pygenometracks.plotTracks.main(args)
+        res = compare_images(expected_file,
+                             outfile.name, tolerance)
+        assert res is None, res
+        os.remove(outfile.name)
+
+
+def test_maf_plain_gzip():
+    # A maf compressed with gzip (not bgzip) is rejected
+    maf_file = os.path.join(ROOT, "first_plain_gzip.maf.gz")
+    with open(os.path.join(ROOT, "first.maf"), 'rb') as f_in, \
+         gzip.open(maf_file, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    ini_file = os.path.join(ROOT, "maf_plain_gzip.ini")
+    with open(ini_file, 'w') as fh:
+        fh.write(f"[maf]\nfile = {maf_file}\nreference = mm10\n")
+    outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
+                                 delete=True)
+    region = "chr2:34704975-34705208"
+    args = f"--tracks {ini_file} --region {region} "\
+        f"--outFileName {outfile.name}".split()
+    try:
+        pygenometracks.plotTracks.main(args)
+    except InputError as e:
+        assert 'compress it with bgzip' in str(e)
+    else:
+        raise Exception("The maf compressed with gzip should fail.")
+    os.remove(ini_file)
+    os.remove(maf_file)
+
+
+def test_second_maf_withe_summary():
+    extension = '.png'
+    ini_file = os.path.join(ROOT, "maf_withe.ini")
+    # The region is large so the summary is displayed
+    region = 'chr2:74,060,473-74,082,287'
+    outfile = NamedTemporaryFile(suffix=extension, prefix='pyGenomeTracks_test_',
+                                 delete=False)
+    expected_file = os.path.join(ROOT, 'master_maf_withe_summary.png')
+    args = f"--tracks {ini_file} --region {region} "\
+        "--trackLabelFraction 0.2 --width 38 --dpi 130 "\
+        f"--outFileName {outfile.name}".split()
+    pygenometracks.plotTracks.main(args)
+    res = compare_images(expected_file,
+                         outfile.name, tolerance)
+    assert res is None, res
+    os.remove(outfile.name)
@@ -5,6 +5,7 @@ from matplotlib.testing.compare import compare_images
 from tempfile import NamedTemporaryFile
 import os.path
 import pygenometracks.plotTracks
+import pysam
 
 ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                     "test_data")
@@ -66,24 +67,35 @@ with open(os.path.join(ROOT, "narrow_peak.ini"), 'w') as fh:
 with open(os.path.join(ROOT, "narrow_peak2.ini"), 'w') as fh:
     fh.write(tracks.replace('test.narrowPeak', 'test2.narrowPeak'))
 
+# The same peaks compressed with bgzip and indexed with tabix
+pysam.tabix_index(os.path.join(ROOT, "test.narrowPeak"), force=True,
+                  preset='bed', keep_original=True)
+with open(os.path.join(ROOT, "narrow_peak_tabix.ini"), 'w') as fh:
+    fh.write(tracks.replace('test.narrowPeak', 'test.narrowPeak.gz'))
+
+# The same peaks as bigBed
+with open(os.path.join(ROOT, "narrow_peak_bigbed.ini"), 'w') as fh:
+    fh.write(tracks.replace('test.narrowPeak', 'test.narrowPeak.bb'))
+
 tolerance = 13  # default matplotlib pixed difference tolerance
 
 
 def test_narrow_track():
     outfile = NamedTemporaryFile(suffix='.png', prefix='narrowTrack_test_',
                                  delete=False)
-    ini_file = os.path.join(ROOT, "narrow_peak.ini")
-    region = "X:2760000-2802000"
-    expected_file = os.path.join(ROOT, 'master_narrowPeak.png')
-    args = f"--tracks {ini_file} --region {region} "\
-           "--trackLabelFraction 0.2 --dpi 130 "\
-           f"--outFileName {outfile.name}".split()
-    pygenometracks.plotTracks.main(args)
-    res = compare_images(expected_file,
-                         outfile.name, tolerance)
-    assert res is None, res
-
-    os.remove(outfile.name)
+    for suf in ['', '_tabix', '_bigbed']:
+        ini_file = os.path.join(ROOT, f"narrow_peak{suf}.ini")
+        region = "X:2760000-2802000"
+        expected_file = os.path.join(ROOT, 'master_narrowPeak.png')
+        args = f"--tracks {ini_file} --region {region} "\
+               "--trackLabelFraction 0.2 --dpi 130 "\
+               f"--outFileName {outfile.name}".split()
+        pygenometracks.plotTracks.main(args)
+        res = compare_images(expected_file,
+                             outfile.name, tolerance)
+        assert res is None, res
+
+        os.remove(outfile.name)
 
 
 def test_narrow_track_2():
@@ -4,7 +4,10 @@ mpl.use('agg')
 from matplotlib.testing.compare import compare_images
 from tempfile import NamedTemporaryFile
 import os.path
+import numpy as np
 import pygenometracks.plotTracks
+from pygenometracks.readBed import ReadBed, intervals_to_columns, read_bed_chunk
+from pygenometracks.utilities import opener, map_file_chunks
 
 
 ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
@@ -353,3 +356,48 @@ def test_plot_tracks_bed_invalid_zero_block():
     else:
         raise Exception("invalid_zero_block should fail.")
     os.remove(ini_file)
+
+
+def test_read_bed_columns():
+    # The columns parsed by chunks (the malformed chunks
+    # are parsed line by line) are the same as line by line
+    for bed_file in ['broadPeak.broadPeak', 'gappedPeak.gappedPeak',
+                     'filtered.results.bed', 'strange_strand.bed',
+                     'invalid_strand.bed', 'invalid_rgb.bed',
+                     'invalid_rgb2.bed', 'invalid_CDScoo.bed',
+                     'invalid_blockCount.bed', 'invalid_blocks.bed',
+                     'invalid_score.bed', 'invalid_score2.bed',
+                     'dm3_genes.bed.gz',
+                     'tad_classification.bed']:
+        file_name = os.path.join(ROOT, bed_file)
+        expected = intervals_to_columns(list(ReadBed(opener(file_name))))
+        chunks = list(ReadBed(opener(file_name)).iter_columns(chunk_size=7))
+        for field, values in expected.items():
+            if field in ['block_sizes', 'block_starts']:
+                for i in range(2):
+                    assert np.array_equal(np.concatenate([c[field][i] for c in chunks]),
+                                          values[i]), (bed_file, field)
+            else:
+                assert np.array_equal(np.concatenate([c[field] for c in chunks]),
+                                      np.array(values)), (bed_file, field)
+
+
+def test_read_bed_chunks_in_parallel():
+    # The chunks of the file parsed in parallel
+    # give the same columns as the sequential parsing
+    file_name = os.path.join(ROOT, 'tad_classification.bed')
+    bed_file_h = ReadBed(opener(file_name))
+    expected = list(bed_file_h.iter_columns())[0]
+    all_columns = map_file_chunks(read_bed_chunk, file_name,
+                                  bed_file_h.fields_to_read,
+                                  chunk_size=20000, max_workers=2)
+    assert len(all_columns) > 1
+    chunks = [columns for chunk in all_columns for columns in chunk]
+    for field, values in expected.items():
+        assert np.array_equal(np.concatenate([c[field] for c in chunks]),
+                              np.array(values)), field
+    # A chunk with a malformed line is not parsed
+    file_name = os.path.join(ROOT, 'invalid_rgb.bed')
+    assert map_file_chunks(read_bed_chunk, file_name,
+                           ReadBed(opener(file_name)).fields_to_read,
+                           chunk_size=100, max_workers=2).count(None) > 0
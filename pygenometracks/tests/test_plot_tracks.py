@@ -397,6 +397,41 @@ def test_plot_tracks_missing_chr():
     os.remove(outfile.name)
 
 
+def test_plot_tracks_bed():
+    # The figure is reused between the regions
+    # The result should be the same as plotting each region
+    if mpl.__version__ == "3.1.1":
+        my_tolerance = 16
+    else:
+        my_tolerance = tolerance
+
+    outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
+                                 delete=False)
+    bed_file = NamedTemporaryFile(suffix='.bed', prefix='pyGenomeTracks_test_',
+                                  delete=False, mode='w')
+    bed_file.write("X\t3000000\t3500000\n"
+                   "X\t0\t1000000\n"
+                   "Y\t0\t1000000\n")
+    bed_file.close()
+    ini_file = os.path.join(ROOT, "browser_tracks.ini")
+    args = f"--tracks {ini_file} --BED {bed_file.name} "\
+           "--trackLabelFraction 0.2 --width 38 --dpi 130 "\
+           f"--outFileName {outfile.name}".split()
+    pygenometracks.plotTracks.main(args)
+    for region, expected_png in zip(['X-3000000-3500000', 'X-0-1000000',
+                                     'Y-0-1000000'],
+                                    ['master_plot.png', 'master_plot_2.png',
+                                     'master_plot_3.png']):
+        output_file = outfile.name[:-4] + '_' + region + '.png'
+        expected_file = os.path.join(ROOT, expected_png)
+        res = compare_images(expected_file,
+                             output_file, my_tolerance)
+        assert res is None, res
+
+        os.remove(output_file)
+    os.remove(bed_file.name)
+
+
 def test_plot_tracks_dec():
 
     outfile = NamedTemporaryFile(suffix='.png', prefix='pyGenomeTracks_test_',
@@ -1,7 +1,12 @@
 import unittest
 import os
+import gzip
+import time
+import threading
 from pygenometracks import utilities
 import matplotlib.pyplot as plt
+from tempfile import NamedTemporaryFile
+from pygenometracks.tracksClass import PlotTracks
 
 
 ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
@@ -50,6 +55,203 @@ class TestUilitiesMethods(unittest.TestCase):
         utilities.plot_coverage(ax, x_values, score_list, plot_type, size, color, negative_color, alpha, grid)
         assert len(ax.get_children()) == n_children + 1
 
+    def test_shared_data_sources(self):
+        bw_file = os.path.join(ROOT, "bigwig_chrx_2e6_5e6.bw")
+        bed_file = os.path.join(ROOT, "tad_classification.bed")
+        ini_content = f"""
+[bigwig fill]
+file = {bw_file}
+
+[bigwig line]
+file = {bw_file}
+type = line
+overlay_previous = share-y
+
+[tads]
+file = {bed_file}
+file_type = domains
+
+[genes]
+file = {bed_file}
+"""
+        with NamedTemporaryFile(suffix='.ini', mode='w',
+                                delete=False) as ini_file:
+            ini_file.write(ini_content)
+        trp = PlotTracks(ini_file.name,
+                         plot_regions=[('X', 3000000, 3500000)])
+        bw_fill, bw_line, tads, genes = trp.track_obj_list
+        # The files are opened only once
+        assert bw_fill.bw is bw_line.bw
+        assert tads.interval_tree is genes.interval_tree
+        assert trp.track_locks[0] is trp.track_locks[1]
+        assert trp.track_locks[0] is not trp.track_locks[2]
+        key = bw_fill.data_source_keys[0]
+        assert key in utilities.data_sources.sources
+        trp.close_files()
+        assert key not in utilities.data_sources.sources
+        os.remove(ini_file.name)
+
+    def test_data_sources_by_reader(self):
+        gtf_file = os.path.join(ROOT, "dm3_subset_BDGP5.78.gtf.gz")
+        ini_content = f"""
+[genes as gtf]
+file = {gtf_file}
+file_type = gtf
+
+[genes as gtf again]
+file = {gtf_file}
+file_type = gtf
+
+[genes as bed]
+file = {gtf_file}
+file_type = bed
+"""
+        with NamedTemporaryFile(suffix='.ini', mode='w',
+                                delete=False) as ini_file:
+            ini_file.write(ini_content)
+        trp = PlotTracks(ini_file.name,
+                         plot_regions=[('X', 3000000, 3500000)])
+        gtf, gtf_again, bed = trp.track_obj_list
+        # The intervals are shared only with the same reader
+        assert gtf.interval_tree is gtf_again.interval_tree
+        assert gtf.interval_tree is not bed.interval_tree
+        assert dict(gtf.data_source_keys[0][3])['reader'] == 'gtf'
+        assert dict(bed.data_source_keys[0][3])['reader'] == 'gtf_as_bed'
+        trp.close_files()
+        os.remove(ini_file.name)
+
+    def test_no_fetch_while_drawing(self):
+        bw_file = os.path.join(ROOT, "bigwig_chrx_2e6_5e6.bw")
+        ini_content = f"""
+[bigwig]
+file = {bw_file}
+"""
+        with NamedTemporaryFile(suffix='.ini', mode='w',
+                                delete=False) as ini_file:
+            ini_file.write(ini_content)
+        regions = [('X', 3000000 + i * 100000, 3100000 + i * 100000)
+                   for i in range(4)]
+        trp = PlotTracks(ini_file.name, plot_regions=regions, threads=2)
+        track = trp.track_obj_list[0]
+        state = {'drawing': False, 'overlaps': 0}
+        fetch, draw = track.fetch, track.draw
+
+        def slow_draw(ax, data):
+            state['drawing'] = True
+            time.sleep(0.1)
+            draw(ax, data)
+            state['drawing'] = False
+
+        def checked_fetch(*args):
+            if state['drawing']:
+                state['overlaps'] += 1
+            return fetch(*args)
+
+        track.draw, track.fetch = slow_draw, checked_fetch
+        try:
+            for region, tracks_data in trp.iter_tracks_data(regions):
+                with NamedTemporaryFile(suffix='.png') as outfile:
+                    trp.plot(outfile.name, *region, tracks_data=tracks_data,
+                             reuse_figure=True)
+        finally:
+            trp.close_files()
+            os.remove(ini_file.name)
+        # The next region is prefetched but never during the draw
+        assert state['overlaps'] == 0
+
+    def test_iter_lines_with_progress(self):
+        for file_name in ["tad_classification.bed", "dm3_genes.bed.gz"]:
+            file_name = os.path.join(ROOT, file_name)
+            with utilities.opener(file_name) as fh:
+                expected = fh.readlines()
+            with utilities.opener(file_name) as fh:
+                assert list(utilities.iter_lines_with_progress(fh, every=10)) == expected
+                # The whole file on disk has been read
+                assert utilities.file_position(fh) == os.path.getsize(file_name)
+
+    def test_opener_bgzip(self):
+        # This file has been compressed with bgzip
+        bgzip_file = os.path.join(ROOT, "tad_separation_score_with_gap.bm.bgz")
+        with gzip.open(bgzip_file, 'rb') as fh:
+            expected = fh.readlines()
+        with utilities.opener(bgzip_file) as fh:
+            assert isinstance(fh.raw, utilities.BgzfReader)
+            assert fh.readline() == expected[0]
+            fh.seek(0)
+            assert fh.readlines() == expected
+            # The whole file on disk has been read
+            assert utilities.file_position(fh) == os.path.getsize(bgzip_file)
+
+    def test_bgzip_shared_threads(self):
+        bgzip_file = os.path.join(ROOT, "tad_separation_score_with_gap.bm.bgz")
+        with gzip.open(bgzip_file, 'rb') as fh:
+            expected = fh.read()
+        handles = [utilities.opener(bgzip_file) for __ in range(50)]
+        for fh in handles:
+            assert fh.read() == expected
+        # All the files use the same pool of threads
+        bgzf_threads = [thread for thread in threading.enumerate()
+                        if thread.name.startswith('bgzf')]
+        assert len(bgzf_threads) <= (os.cpu_count() or 1)
+        for fh in handles:
+            fh.close()
+
+    def test_split_file(self):
+        for file_name, chunk_size in [("tad_classification.bed", 1000),
+                                      ("tad_separation_score_with_gap.bm.bgz", 100000)]:
+            file_name = os.path.join(ROOT, file_name)
+            with utilities.opener(file_name) as fh:
+                expected = fh.readlines()
+            chunks = utilities.split_file(file_name, chunk_size)
+            assert len(chunks) > 1
+            # Each line is in a single chunk
+            assert [line for chunk in chunks
+                    for line in utilities.iter_chunk_lines(file_name, chunk)] == expected
+        # The gzip files cannot be splitted
+        assert utilities.split_file(os.path.join(ROOT, "dm3_genes.bed.gz")) is None
+
+    def test_file_to_intervaltree_chunks(self):
+        file_name = os.path.join(ROOT, "tad_separation_score_with_gap.bm.bgz")
+        interval_tree, min_value, max_value = utilities.file_to_intervaltree(file_name)
+        all_columns = utilities.map_file_chunks(utilities.bed_like_chunk_to_columns,
+                                                file_name, chunk_size=100000,
+                                                max_workers=2)
+        assert min([columns[4] for columns in all_columns]) == min_value
+        assert max([columns[5] for columns in all_columns]) == max_value
+        intervals = [(chrom, start, end, value)
+                     for chroms, starts, ends, values, __, __ in all_columns
+                     for chrom, start, end, value in zip(chroms, starts, ends, values)]
+        assert sorted(intervals) == sorted((chrom, interval.begin, interval.end, interval.data)
+                                           for chrom in interval_tree
+                                           for interval in interval_tree[chrom])
+
+    def test_bigbed_to_bed(self):
+        bb_file = os.path.join(ROOT, "tad_classification.bb")
+        bed_file = os.path.join(ROOT, "tad_classification.bed")
+        assert utilities.is_bigbed(bb_file)
+        assert not utilities.is_bigbed(bed_file)
+        with open(bed_file, 'r') as fh:
+            all_lines = fh.readlines()
+        # The whole bigBed is never converted
+        with self.assertRaises(utilities.InputError):
+            utilities.bigbed_to_bed(bb_file, None)
+        # Only the entries of the regions are written
+        # (with the other chromosome name and each entry once):
+        regions = [('X', 3000000, 3100000), ('chrX', 3050000, 3200000)]
+        expected = [line for line in all_lines
+                    if line.startswith('chrX\t')
+                    and int(line.split('\t')[1]) < 3200000
+                    and int(line.split('\t')[2]) > 3000000]
+        with open(utilities.bigbed_to_bed(bb_file, regions), 'r') as fh:
+            assert sorted(fh.readlines()) == sorted(expected)
+        # With global_max_row all the entries would be needed
+        with NamedTemporaryFile(suffix='.ini', mode='w',
+                                delete=False) as ini_file:
+            ini_file.write(f"[tads]\nfile = {bb_file}\nglobal_max_row = true\n")
+        with self.assertRaises(utilities.InputError):
+            PlotTracks(ini_file.name, plot_regions=regions)
+        os.remove(ini_file.name)
+
 
 class TestFormatter(unittest.TestCase):
 
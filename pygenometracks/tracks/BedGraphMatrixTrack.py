@@ -1,5 +1,5 @@
 from . BedGraphTrack import BedGraphTrack
-from . GenomeTrack import GenomeTrack
+from . GenomeTrack import GenomeTrack, TrackData
 import numpy as np
 from matplotlib import cm
 
@@ -105,15 +105,11 @@ file_type = {TRACK_TYPE}
             for param in ['individual_color', 'summary_color']:
                 self.process_color(param, colormap_possible=False)
 
-    def plot(self, ax, chrom_region, start_region, end_region):
-        """
-        Plots a bedgraph matrix file, that instead of having
-        a single value per bin, it has several values.
-        """
+    def fetch(self, chrom_region, start_region, end_region):
         values_list, start_pos = self.get_scores(chrom_region, start_region, end_region)
         if start_pos == []:
-            self.adjust_ylim(ax)
-            return
+            return TrackData(chrom_region, start_region, end_region,
+                             matrix=None, start_pos=None)
         matrix_rows = []
         for values in values_list:
             values = list(map(float, values))
@@ -123,6 +119,20 @@ file_type = {TRACK_TYPE}
         if self.properties['orientation'] == 'inverted':
             matrix = np.flipud(matrix)
 
+        return TrackData(chrom_region, start_region, end_region,
+                         matrix=matrix, start_pos=start_pos)
+
+    def draw(self, ax, data):
+        """
+        Plots a bedgraph matrix file, that instead of having
+        a single value per bin, it has several values.
+        """
+        if data.matrix is None:
+            self.adjust_ylim(ax)
+            return
+        matrix = data.matrix
+        start_pos = data.start_pos
+
         if self.properties['type'] == 'lines':
             if self.properties['pos_score_in_bin'] == 'block':
                 # convert [(0, 10), (10, 20), (20, 30)] into [0, 10, 10, 20, 20, 30]
@@ -172,3 +182,4 @@ file_type = {TRACK_TYPE}
     def __del__(self):
         if self.tbx is not None:
             self.tbx.close()
+        self.release_data_sources()
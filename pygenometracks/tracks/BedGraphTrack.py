@@ -1,4 +1,4 @@
-from . GenomeTrack import GenomeTrack
+from . GenomeTrack import GenomeTrack, TrackData
 from .. utilities import file_to_intervaltree, plot_coverage, InputError, transform, change_chrom_names
 import numpy as np
 import pyBigWig
@@ -50,6 +50,7 @@ nans_to_zeros = true
 # mean/average/stdev/dev/max/min/cov/coverage/sum
 # summary_method = mean
 # number_of_bins = 700
+# With number_of_bins = auto, there is one bin per pixel of the plot
 # set show_data_range to false to hide the text on the left showing the data range
 show_data_range = true
 # to compute operations on the fly on the file
@@ -103,7 +104,8 @@ file_type = {TRACK_TYPE}
                            'grid': False}
     NECESSARY_PROPERTIES = ['file']
     SYNONYMOUS_PROPERTIES = {'max_value': {'auto': None},
-                             'min_value': {'auto': None}}
+                             'min_value': {'auto': None},
+                             'number_of_bins': {'auto': None}}
     POSSIBLE_PROPERTIES = {'orientation': [None, 'inverted'],
                            'summary_method': ['mean', 'average', 'max', 'min',
                                               'stdev', 'dev', 'coverage',
@@ -147,8 +149,7 @@ file_type = {TRACK_TYPE}
                     self.tbx2 = pysam.TabixFile(self.properties['second_file'])
                 except IOError:
                     # load the file as an interval tree
-                    self.interval_tree2, __, __ = file_to_intervaltree(self.properties['second_file'],
-                                                                       self.properties['region'])
+                    self.interval_tree2 = self.load_intervaltree(self.properties['second_file'])
 
     def set_properties_defaults(self):
         super(BedGraphTrack, self).set_properties_defaults()
@@ -191,24 +192,36 @@ file_type = {TRACK_TYPE}
             self.tbx = pysam.TabixFile(self.properties['file'])
         except IOError:
             # load the file as an interval tree
-            self.interval_tree, __, __ = file_to_intervaltree(self.properties['file'],
-                                                              self.properties['region'])
+            self.interval_tree = self.load_intervaltree(self.properties['file'])
 
         self.num_fields = None
 
-    def _get_row_data(self, row, tbx_var='self.tbx'):
+    def load_intervaltree(self, file_name):
+        """
+        Loads the file restricted to the plotted regions
+        as an interval tree (the interval tree is shared
+        between all tracks using the same file).
+        """
+        interval_tree, __, __ = \
+            self.acquire_data_source('intervaltree', file_name,
+                                     lambda: file_to_intervaltree(file_name,
+                                                                  self.properties['region']),
+                                     plot_regions=self.properties['region'])
+        return interval_tree
+
+    def _get_row_data(self, row, tbx):
         """
         Returns the chrom, start, end and fields from either a tabix or a
         interval tree.
         Args:
             row: if tabix, the row comes from self.tbx.fetch otherwise
             comes from sorted(interval_tree[chrom] ...
+            tbx: the tabix file or None if an interval tree is used
 
         Returns:
             start, end, fields where values is a list
 
         """
-        tbx = eval(tbx_var)
         if tbx is not None:
             fields = row.split("\t")
             values = fields[3:]
@@ -278,7 +291,7 @@ file_type = {TRACK_TYPE}
 
         prev_end = start_region
         for row in iterator:
-            start, end, values = self._get_row_data(row, tbx_var)
+            start, end, values = self._get_row_data(row, tbx)
             # if the region is not consecutive with respect to the previous
             # nan values are added.
             if return_nans and prev_end < start:
@@ -299,11 +312,11 @@ file_type = {TRACK_TYPE}
 
         return score_list, pos_list
 
-    def plot(self, ax, chrom_region, start_region, end_region):
+    def fetch(self, chrom_region, start_region, end_region):
         score_list, pos_list = self.get_scores(chrom_region, start_region, end_region)
         if pos_list == []:
-            self.adjust_ylim(ax)
-            return
+            return TrackData(chrom_region, start_region, end_region,
+                             x_values=None, scores=None)
         try:
             score_list = [float(x[0]) for x in score_list]
         except ValueError as ve:
@@ -317,9 +330,9 @@ file_type = {TRACK_TYPE}
             x_values = np.asarray([(t[0] + t[1]) / 2
                                    for i, t in enumerate(pos_list)
                                    if not np.isnan(score_list[i])],
-                                  dtype=np.float)
+                                  dtype=float)
             score_list = np.asarray([x for x in score_list if not np.isnan(x)],
-                                    dtype=np.float)
+                                    dtype=float)
         elif self.properties['summary_method'] is not None:
             score_list, x_values = self.get_values_as_bigwig(score_list,
                                                              pos_list,
@@ -351,8 +364,8 @@ file_type = {TRACK_TYPE}
                                                      tbx_var='self.tbx2',
                                                      inttree_var='self.interval_tree2')
             if pos_list2 == []:
-                self.adjust_ylim(ax)
-                return
+                return TrackData(chrom_region, start_region, end_region,
+                                 x_values=None, scores=None)
             try:
                 score_list2 = [float(x[0]) for x in score_list2]
             except ValueError as ve:
@@ -366,9 +379,9 @@ file_type = {TRACK_TYPE}
                 x_values2 = np.asarray([(t[0] + t[1]) / 2
                                         for i, t in enumerate(pos_list2)
                                         if not np.isnan(score_list2[i])],
-                                       dtype=np.float)
+                                       dtype=float)
                 score_list2 = np.asarray([x for x in score_list2 if not np.isnan(x)],
-                                         dtype=np.float)
+                                         dtype=float)
                 if not all([x1 == x2 for x1, x2 in zip(x_values, x_values2)]):
                     # The x are not compatible we need to extrapolate:
                     new_x = sorted(np.unique(np.concatenate((x_values, x_values2), axis=0)))
@@ -428,7 +441,16 @@ file_type = {TRACK_TYPE}
                                        self.properties['log_pseudocount'],
                                        self.properties['file'])
 
-        plot_coverage(ax, x_values, transformed_scores, self.plot_type,
+        return TrackData(chrom_region, start_region, end_region,
+                         x_values=x_values, scores=transformed_scores)
+
+    def draw(self, ax, data):
+        if data.scores is None:
+            self.adjust_ylim(ax)
+            return
+
+        x_values, scores = self.get_coverage_to_plot(data)
+        plot_coverage(ax, x_values, scores, self.plot_type,
                       self.size,
                       self.properties['color'],
                       self.properties['negative_color'],
@@ -442,6 +464,7 @@ file_type = {TRACK_TYPE}
 
     def get_values_as_bigwig(self, score_list, pos_list, chrom_region,
                              start_region, end_region):
+        number_of_bins = self.get_number_of_bins()
         # A temporary file is created
         id, temp_bigwig_file = tempfile.mkstemp(suffix='.bw')
         # We write into it
@@ -461,13 +484,13 @@ file_type = {TRACK_TYPE}
         scores_per_bin = np.array(bw.stats(chrom_region,
                                            start_region,
                                            end_region,
-                                           nBins=self.properties['number_of_bins'],
+                                           nBins=number_of_bins,
                                            type=self.properties['summary_method'])).astype(float)
         os.remove(temp_bigwig_file)
         if self.properties['nans_to_zeros'] and np.any(np.isnan(scores_per_bin)):
             scores_per_bin[np.isnan(scores_per_bin)] = 0
         x_values = np.linspace(start_region, end_region,
-                               self.properties['number_of_bins'])
+                               number_of_bins)
 
         return scores_per_bin, x_values
 
@@ -481,7 +504,7 @@ file_type = {TRACK_TYPE}
         # convert [1, 2, 3 ...] in [1, 1, 2, 2, 3, 3 ...]
         score_list = np.repeat(score_list, 2)
         # convert [(0, 10), (10, 20), (20, 30)] into [0, 10, 10, 20, 20, 30]
-        x_values = np.asarray(sum(pos_list, tuple()), dtype=np.float)
+        x_values = np.asarray(pos_list, dtype=float).reshape(-1)
 
         if self.properties['nans_to_zeros']:
             score_list[np.isnan(score_list)] = 0
@@ -500,3 +523,4 @@ file_type = {TRACK_TYPE}
             self.tbx.close()
         if self.tbx2 is not None:
             self.tbx2.close()
+        self.release_data_sources()
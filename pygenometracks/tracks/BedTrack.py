@@ -1,15 +1,17 @@
-from . GenomeTrack import GenomeTrack
-from .. readBed import ReadBed
+from . GenomeTrack import GenomeTrack, TrackData
+from .. readBed import ReadBed, read_bed_chunk
+from .. intervalStore import BedIntervalStore
 # To remove next 1.0
 from .. readGtf import ReadGtf
 # End to remove
-from .. utilities import opener, get_length_w, count_lines, temp_file_from_intersect, change_chrom_names
+from .. utilities import opener, get_length_w, temp_file_from_intersect, change_chrom_names, is_bigbed, map_file_chunks, InputError
 import matplotlib
 from matplotlib import font_manager
 from matplotlib.patches import Rectangle, Polygon
 from matplotlib.lines import Line2D
-from intervaltree import IntervalTree, Interval
 import numpy as np
+import os
+import itertools
 from tqdm import tqdm
 
 DEFAULT_BED_COLOR = '#1f78b4'
@@ -23,7 +25,7 @@ class BedTrack(GenomeTrack):
     SUPPORTED_ENDINGS = ['bed', 'bed3', 'bed4', 'bed5', 'bed6', 'bed8',
                          'bed9', 'bed12',
                          'bed.gz', 'bed3.gz', 'bed4.gz', 'bed5.gz', 'bed6.gz',
-                         'bed9.gz', 'bed12.gz']
+                         'bed9.gz', 'bed12.gz', 'bb', 'bigbed']
     TRACK_TYPE = 'bed'
     OPTIONS_TXT = GenomeTrack.OPTIONS_TXT + f"""
 # If the bed file contains a column for color (column 9), then this color can be used by
@@ -183,7 +185,7 @@ file_type = {TRACK_TYPE}
         self.bed_type = None  # once the bed file is processed,
         # this is bed3, bed4, bed5, bed6, bed8, bed9 or bed12
         self.current_len_w = None  # this is the length of the letter 'w' given the font size
-        self.interval_tree = {}  # interval tree of the bed regions
+        self.interval_tree = {}  # intervals of the bed regions (BedIntervalStore)
         self.interval_tree, min_score, max_score = self.process_bed(self.properties['region'])
         if self.colormap is not None:
             if self.properties['min_value'] is not None:
@@ -240,6 +242,13 @@ file_type = {TRACK_TYPE}
         self.row_scale = 2.3
 
     def get_bed_handler(self, plot_regions=None):
+        if self.properties['global_max_row'] and \
+           is_bigbed(self.properties['file']):
+            # The rows would need all the entries of the bigBed
+            raise InputError(f"In section {self.properties['section_name']},"
+                             " global_max_row cannot be used with a bigBed"
+                             " file, only the entries of the plotted regions"
+                             " are read.")
         if not self.properties['global_max_row']:
             # I do the intersection:
             file_to_open = temp_file_from_intersect(self.properties['file'],
@@ -262,16 +271,43 @@ file_type = {TRACK_TYPE}
             total_length = bed_file_h.length
         else:
             # end of remove
-            total_length = count_lines(opener(file_to_open),
-                                       asBed=True)
+            # The progress is the position in the file on disk
+            total_length = os.path.getsize(file_to_open)
             bed_file_h = ReadBed(opener(file_to_open))
 
         return(bed_file_h, total_length)
 
-    def process_bed(self, plot_regions=None):
+    def get_reader_options(self):
+        """
+        Returns the format used to parse the file
+        and the properties which change the parsing.
+        The tracks with the same file and the same
+        reader options share the intervals.
+        """
+        # To remove in next 1.0
+        if self.properties['file'].endswith('gtf') or \
+           self.properties['file'].endswith('gtf.gz'):
+            # The file is read as a gtf by get_bed_handler
+            return {'reader': 'gtf_as_bed',
+                    'prefered_name': self.properties['prefered_name'],
+                    'merge_transcripts': self.properties['merge_transcripts'],
+                    'merge_overlapping_exons':
+                    self.properties['merge_overlapping_exons']}
+        # end of remove
+        if is_bigbed(self.properties['file']):
+            return {'reader': 'bigbed'}
+        return {'reader': 'bed'}
 
-        bed_file_h, total_length = self.get_bed_handler(plot_regions)
-        self.bed_type = bed_file_h.file_type
+    def process_bed(self, plot_regions=None):
+        # The bed file is loaded only once for all tracks
+        # which use the same file with the same options
+        options = self.get_reader_options()
+        if not self.properties['global_max_row']:
+            options['plot_regions'] = plot_regions
+        interval_tree, min_score, max_score, self.bed_type = \
+            self.acquire_data_source('bed', self.properties['file'],
+                                     lambda: self.load_bed(plot_regions),
+                                     **options)
 
         if self.properties['color'] == 'bed_rgb' and \
            self.bed_type not in ['bed12', 'bed9']:
@@ -280,34 +316,46 @@ file_type = {TRACK_TYPE}
                              f"The color has been set to {DEFAULT_BED_COLOR}.\n")
             self.properties['color'] = DEFAULT_BED_COLOR
 
-        valid_intervals = 0
-        interval_tree = {}
-
-        max_score = float('-inf')
-        min_score = float('inf')
-        for bed in tqdm(bed_file_h, total=total_length):
-            if bed.score < min_score:
-                min_score = bed.score
-            if bed.score > max_score:
-                max_score = bed.score
+        return interval_tree, min_score, max_score
 
-            if bed.chromosome not in interval_tree:
-                interval_tree[bed.chromosome] = IntervalTree()
+    def load_bed(self, plot_regions=None):
+        """
+        Reads the bed file and returns the intervals
+        (stored in a BedIntervalStore which is used
+        like a dictionary of interval trees),
+        the min and max scores and the bed type.
+        """
+        bed_file_h, total_length = self.get_bed_handler(plot_regions)
 
-            interval_tree[bed.chromosome].add(Interval(bed.start,
-                                                       bed.end, bed))
-            valid_intervals += 1
+        all_columns = None
+        if isinstance(bed_file_h, ReadBed):
+            # The large files are parsed by chunks in parallel
+            all_columns = map_file_chunks(read_bed_chunk,
+                                          bed_file_h.file_handle.name,
+                                          bed_file_h.fields_to_read)
+        if all_columns is not None and None not in all_columns:
+            interval_tree = BedIntervalStore(itertools.chain.from_iterable(all_columns))
+        else:
+            # The file is parsed sequentially
+            # (small file, single cpu or malformed lines)
+            with tqdm(total=total_length, unit_scale=True) as progress:
+                def column_chunks():
+                    for columns in bed_file_h.iter_columns():
+                        progress.update(bed_file_h.position - progress.n)
+                        yield columns
+                interval_tree = BedIntervalStore(column_chunks())
 
         try:
             bed_file_h.file_handle.close()
         except AttributeError:
             pass
 
-        if valid_intervals == 0:
+        if interval_tree.size == 0:
             self.log.warning("No valid intervals were found in file "
                              f"{self.properties['file']}.\n")
 
-        return interval_tree, min_score, max_score
+        return interval_tree, interval_tree.min_score, \
+            interval_tree.max_score, bed_file_h.file_type
 
     def get_max_num_row(self, len_w, small_relative):
         ''' Process the whole bed regions at the given figure length
@@ -378,7 +426,7 @@ file_type = {TRACK_TYPE}
             ypos = free_row * self.row_scale
         return ypos
 
-    def plot(self, ax, chrom_region, start_region, end_region):
+    def fetch(self, chrom_region, start_region, end_region):
         if chrom_region not in self.interval_tree.keys():
             chrom_region_before = chrom_region
             chrom_region = change_chrom_names(chrom_region)
@@ -389,10 +437,20 @@ file_type = {TRACK_TYPE}
                                  f" and {chrom_region}:{start_region - AROUND_REGION}-{end_region + AROUND_REGION}"
                                  " inside the bed file. "
                                  "This will generate an empty track!!\n")
-                return
+                return TrackData(chrom_region, start_region, end_region,
+                                 genes_overlap=None)
 
-        genes_overlap = \
-            sorted(self.interval_tree[chrom_region][start_region:end_region])
+        # chrom_region is the chromosome name used in the bed file
+        return TrackData(chrom_region, start_region, end_region,
+                         genes_overlap=sorted(self.interval_tree[chrom_region][start_region:end_region]))
+
+    def draw(self, ax, data):
+        if data.genes_overlap is None:
+            return
+        chrom_region = data.chrom_region
+        start_region = data.start_region
+        end_region = data.end_region
+        genes_overlap = data.genes_overlap
 
         if self.properties['display'] == 'triangles':
             self.plot_triangles(ax, genes_overlap)
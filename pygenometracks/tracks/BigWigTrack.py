@@ -1,4 +1,4 @@
-from . GenomeTrack import GenomeTrack
+from . GenomeTrack import GenomeTrack, TrackData
 import numpy as np
 from .. utilities import plot_coverage, InputError, transform, change_chrom_names
 import pyBigWig
@@ -24,6 +24,7 @@ min_value = 0
 # into the number of bins specified
 # Then, at each bin the bigwig mean value is computed and plotted.
 # A lower number of bins produces a coarser tracks
+# With number_of_bins = auto, there is one bin per pixel of the plot
 number_of_bins = 700
 # to convert missing data (NaNs) into zeros. Otherwise, missing data is not plotted.
 nans_to_zeros = true
@@ -88,7 +89,8 @@ file_type = {TRACK_TYPE}
                            'grid': False}
     NECESSARY_PROPERTIES = ['file']
     SYNONYMOUS_PROPERTIES = {'max_value': {'auto': None},
-                             'min_value': {'auto': None}}
+                             'min_value': {'auto': None},
+                             'number_of_bins': {'auto': None}}
     POSSIBLE_PROPERTIES = {'orientation': [None, 'inverted'],
                            'summary_method': ['mean', 'average', 'max', 'min',
                                               'stdev', 'dev', 'coverage',
@@ -113,7 +115,7 @@ file_type = {TRACK_TYPE}
 
     def __init__(self, *args, **kwargs):
         super(self.__class__, self).__init__(*args, **kwargs)
-        self.bw = pyBigWig.open(self.properties['file'])
+        self.bw = self.open_bigwig(self.properties['file'])
         self.bw2 = None
         if 'second_file' in self.properties['operation']:
             if self.properties['second_file'] is None:
@@ -121,7 +123,16 @@ file_type = {TRACK_TYPE}
                                  " requires to set the parameter"
                                  " second_file.")
             else:
-                self.bw2 = pyBigWig.open(self.properties['second_file'])
+                self.bw2 = self.open_bigwig(self.properties['second_file'])
+
+    def open_bigwig(self, file_name):
+        """
+        Opens the bigwig file (the file is shared
+        between all tracks using it).
+        """
+        return self.acquire_data_source('bigwig', file_name,
+                                        lambda: pyBigWig.open(file_name),
+                                        close=lambda bw: bw.close())
 
     def set_properties_defaults(self):
         super(BigWigTrack, self).set_properties_defaults()
@@ -144,13 +155,14 @@ file_type = {TRACK_TYPE}
                                  " It will be set as 'transformed'.\n")
                 self.properties['y_axis_values'] = 'transformed'
 
-    def plot(self, ax, chrom_region, start_region, end_region):
+    def fetch(self, chrom_region, start_region, end_region):
 
         temp_end_region, temp_nbins, scores_per_bin = self.get_scores('self.bw', self.properties['file'],
                                                                       chrom_region, start_region, end_region)
         if scores_per_bin is None:
             self.log.warning("Scores could not be computed. This will generate an empty track\n")
-            return
+            return TrackData(chrom_region, start_region, end_region,
+                             x_values=None, scores=None)
 
         if self.properties['nans_to_zeros'] and np.any(np.isnan(scores_per_bin)):
             scores_per_bin[np.isnan(scores_per_bin)] = 0
@@ -177,7 +189,8 @@ file_type = {TRACK_TYPE}
                                                                              chrom_region, start_region, end_region)
             if scores_per_bin2 is None:
                 self.log.warning("Scores for second_file could not be computed. This will generate an empty track\n")
-                return
+                return TrackData(chrom_region, start_region, end_region,
+                                 x_values=None, scores=None)
 
             if self.properties['nans_to_zeros'] and np.any(np.isnan(scores_per_bin2)):
                 scores_per_bin2[np.isnan(scores_per_bin2)] = 0
@@ -205,7 +218,15 @@ file_type = {TRACK_TYPE}
                                        self.properties['log_pseudocount'],
                                        self.properties['file'])
 
-        plot_coverage(ax, x_values, transformed_scores, self.plot_type,
+        return TrackData(chrom_region, start_region, end_region,
+                         x_values=x_values, scores=transformed_scores)
+
+    def draw(self, ax, data):
+        if data.scores is None:
+            return
+
+        x_values, scores = self.get_coverage_to_plot(data)
+        plot_coverage(ax, x_values, scores, self.plot_type,
                       self.size,
                       self.properties['color'],
                       self.properties['negative_color'],
@@ -226,6 +247,7 @@ file_type = {TRACK_TYPE}
     def get_scores(self, bw_var, bw_file, chrom_region, start_region, end_region):
         bw = eval(bw_var)
         scores_per_bin = None
+        number_of_bins = self.get_number_of_bins()
         if chrom_region not in bw.chroms().keys():
             chrom_region_before = chrom_region
             chrom_region = change_chrom_names(chrom_region)
@@ -235,7 +257,7 @@ file_type = {TRACK_TYPE}
                                  "chromosome name inside the bigwig file. "
                                  "No score will be computed for"
                                  f" {bw_file}.\n")
-                scores_per_bin = np.array([np.nan] * self.properties['number_of_bins'])
+                scores_per_bin = np.array([np.nan] * number_of_bins)
 
         if scores_per_bin is None and start_region > bw.chroms()[chrom_region]:
             self.log.warning("*Warning*\nThe region to plot starts beyond the"
@@ -243,7 +265,7 @@ file_type = {TRACK_TYPE}
                              f" {bw_file}.\n"
                              f"{chrom_region} size: {bw.chroms()[chrom_region]}"
                              f". Region to plot {start_region}-{end_region}\n")
-            scores_per_bin = np.array([np.nan] * self.properties['number_of_bins'])
+            scores_per_bin = np.array([np.nan] * number_of_bins)
 
         if scores_per_bin is None and end_region > bw.chroms()[chrom_region]:
             self.log.warning("*Warning*\nThe region to plot extends beyond the"
@@ -251,10 +273,10 @@ file_type = {TRACK_TYPE}
                              f"{chrom_region} size: {bw.chroms()[chrom_region]}"
                              f". Region to plot {start_region}-{end_region}\n")
             temp_end_region = bw.chroms()[chrom_region]
-            temp_nbins = int(self.properties['number_of_bins'] * (temp_end_region - start_region) / (end_region - start_region))
+            temp_nbins = int(number_of_bins * (temp_end_region - start_region) / (end_region - start_region))
         else:
             temp_end_region = end_region
-            temp_nbins = self.properties['number_of_bins']
+            temp_nbins = number_of_bins
         # on rare occasions pyBigWig may throw an error, apparently caused by a corruption
         # of the memory. This only occurs when calling trackPlot from different
         # processors. Reloading the file solves the problem.
@@ -278,11 +300,3 @@ file_type = {TRACK_TYPE}
                         self.log.warning(f"After {num_tries} the scores could be computed.\n")
                     break
         return temp_end_region, temp_nbins, scores_per_bin
-
-    def __del__(self):
-        try:
-            self.bw.close()
-        except AttributeError:
-            pass
-        if self.bw2 is not None:
-            self.bw2.close()
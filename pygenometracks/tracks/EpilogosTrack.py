@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import division
 from . BedGraphTrack import BedGraphTrack
-from . GenomeTrack import GenomeTrack
+from . GenomeTrack import GenomeTrack, TrackData
 import json
-from matplotlib.patches import Rectangle
-from matplotlib.collections import PatchCollection
+from matplotlib.collections import PolyCollection
 from matplotlib import cm
+import matplotlib.colors
 import numpy as np
 
+# The brackets, colons and commas of the qcat are replaced by spaces
+QCAT_SEPARATORS = str.maketrans('[]:,', '    ')
+
 
 class EpilogosTrack(BedGraphTrack):
     """
@@ -65,72 +68,171 @@ file_type = {TRACK_TYPE}
         else:
             self.categories = None
 
-    def plot(self, ax, chrom_region, start_region, end_region):
+    def fetch(self, chrom_region, start_region, end_region):
+        values_list, pos_list = self.get_scores(chrom_region, start_region, end_region)
+        if pos_list == []:
+            return TrackData(chrom_region, start_region, end_region,
+                             starts=None)
+
+        # This would happen if the qcat file has a missing value.
+        # The missing value is filled with np.repeat(np.nan, ..) and should be skipped here.
+        valid = [isinstance(qcat_json[0], str) for qcat_json in values_list]
+        values, categories = self.parse_qcat([qcat_json[0] for qcat_json, is_valid
+                                              in zip(values_list, valid) if is_valid])
+        positions = np.array(pos_list, dtype=int).reshape(-1, 2)[np.array(valid, dtype=bool)]
+
+        return TrackData(chrom_region, start_region, end_region,
+                         number_of_bins=len(values_list),
+                         starts=positions[:, 0],
+                         ends=positions[:, 1],
+                         values=values,
+                         categories=categories)
+
+    @staticmethod
+    def parse_qcat(qcat_lines):
         """
-        Plots a bedgraph matrix file, that instead of having
-        a single value per bin, it has several values.
+        Decodes all the qcat lines at once.
+        The qcat is a pseudo json line, that misses
+        the { } and the quotes, like:
+        id:8,qcat:[ [-0.0079,6], [-0.0056,17], [-0.0035,13]]
+        Returns two arrays of shape
+        (number of lines, maximum number of values in a line)
+        with the values and the category ids in the order of the
+        qcat (the lines with fewer values are filled with 0).
+
+        >>> values, categories = EpilogosTrack.parse_qcat(
+        ...     ['id:1,qcat:[ [-0.5,2], [1.5,3] ]', 'id:2,qcat:[[0.25,1]]'])
+        >>> values
+        array([[-0.5 ,  1.5 ],
+               [ 0.25,  0.  ]])
+        >>> categories
+        array([[2, 3],
+               [1, 0]])
+        """
+        qcats = [line[line.index('qcat') + 4:] for line in qcat_lines]
+        # Each value is in brackets inside the brackets of the qcat
+        counts = np.array([qcat.count('[') - 1 for qcat in qcats], dtype=int)
+        numbers = np.array(' '.join(qcats).translate(QCAT_SEPARATORS).split(),
+                           dtype=float).reshape(-1, 2)
+        values = np.zeros((len(qcats), counts.max(initial=0)))
+        categories = np.zeros(values.shape, dtype=int)
+        rows = np.repeat(np.arange(len(qcats)), counts)
+        columns = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        values[rows, columns] = numbers[:, 0]
+        categories[rows, columns] = numbers[:, 1]
+        return values, categories
+
+    @staticmethod
+    def aggregate_per_pixel(starts, ends, values, categories,
+                            start_region, end_region, number_of_pixels):
+        """
+        Divides the region in number_of_pixels and
+        computes for each category the mean value of the bins
+        whose middle is in each pixel.
+        Returns the starts, ends, values and categories
+        of the pixels with bins where the values are sorted
+        increasingly, as in the qcat.
+
+        >>> starts, ends, values, categories = EpilogosTrack.aggregate_per_pixel(
+        ...     np.array([0, 10, 20]), np.array([10, 20, 30]),
+        ...     np.array([[-1., 2.], [-3., 0.], [1., 0.]]),
+        ...     np.array([[2, 1], [2, 0], [1, 0]]), 0, 60, 3)
+        >>> starts, ends
+        (array([ 0., 20.]), array([20., 40.]))
+        >>> values
+        array([[-2.,  0.,  1.],
+               [ 0.,  0.,  1.]])
+        >>> categories
+        array([[2, 0, 1],
+               [0, 2, 1]])
+        """
+        middles = (starts + ends) / 2
+        pixels = np.floor((middles - start_region) / (end_region - start_region)
+                          * number_of_pixels).astype(int)
+        pixels = np.clip(pixels, 0, number_of_pixels - 1)
+        sums = np.zeros((number_of_pixels, categories.max(initial=0) + 1))
+        np.add.at(sums, (np.repeat(pixels, values.shape[1]), categories.ravel()),
+                  values.ravel())
+        number_of_bins = np.bincount(pixels, minlength=number_of_pixels)
+        has_bins = number_of_bins > 0
+        means = sums[has_bins] / number_of_bins[has_bins, np.newaxis]
+        order = np.argsort(means, axis=1, kind='stable')
+        pixel_limits = np.linspace(start_region, end_region, number_of_pixels + 1)
+        return pixel_limits[:-1][has_bins], pixel_limits[1:][has_bins], \
+            np.take_along_axis(means, order, axis=1), order
+
+    def get_colors(self, categories):
+        """
+        Returns the rgba colors of the categories.
         """
+        if self.categories is not None:
+            # use color from categories file
+            unique_categories, indices = np.unique(categories, return_inverse=True)
+            colors = np.array([matplotlib.colors.to_rgba(self.categories[str(qcat_id)][1])
+                               for qcat_id in unique_categories]).reshape(-1, 4)
+            return colors[indices]
         cmap = cm.get_cmap('tab20b')
+        return cmap(categories / 15)
 
-        values_list, pos_list = self.get_scores(chrom_region, start_region, end_region)
-        if pos_list == []:
+    def draw(self, ax, data):
+        """
+        Plots a bedgraph matrix file, that instead of having
+        a single value per bin, it has several values.
+        The values of each bin are stacked (starting from
+        the sum of negative values) and all rectangles
+        are drawn in one collection.
+        When there are more bins than pixels, the mean
+        of each category in each pixel is plotted.
+        """
+        if data.starts is None:
             return
 
-        ymin = float('Inf')
-        ymax = -float('Inf')
-
         edgecolor = 'black'
-        if len(values_list) > 1000:
+        if data.number_of_bins > 1000:
             edgecolor = 'none'
             linewidth = 0
-        elif 1000 > len(values_list) > 500:
+        elif 1000 > data.number_of_bins > 500:
             linewidth = 0.01
         else:
             linewidth = 0.5
 
-        rects = []
-        for idx, qcat_json in enumerate(values_list):
-            # the qcat_json is a pseudo json line, that misses
-            # the { } and the quotes. The following lines fix that.
-            qcat_json = qcat_json[0]
-            if not isinstance(qcat_json, str):
-                # This would happen if the qcat file has a missing value.
-                # The missing value is filled with np.repeat(np.nan, ..) and should be skipped here.
-                continue
-            qcat_json = '{' + qcat_json.replace('id', '"id"').replace('qcat', '"qcat"') + '}'
-            qcat = json.loads(qcat_json)
-
-            # find the minimum negative value
-            neg_values = [x[0] for x in qcat['qcat'] if x[0] < 0]
-            if len(neg_values) > 0:
-                min_neg_sum = sum([x[0] for x in qcat['qcat'] if x[0] < 0])
-            else:
-                min_neg_sum = 0
-
-            # Draw a rectangle for each value
-            y_low = min_neg_sum
-            for qcat_value, qcat_id in qcat['qcat']:
-                if qcat_value == 0:
-                    continue
-                # use color from categories file is given
-                if self.categories is not None:
-                    qcat_color = self.categories[str(qcat_id)][1]
-                else:
-                    qcat_color = cmap(qcat_id / 15)
-                height = abs(qcat_value)
-                if height + y_low > ymax:
-                    ymax = height + y_low
-                if y_low < ymin:
-                    ymin = y_low
-                start, end = pos_list[idx]
-
-                # Rectangle(xy, width, height, angle=0.0, **kwargs)
-                # Draw a rectangle with lower left at xy = (x, y) with specified width, height and rotation angle.
-                rects.append(Rectangle((start, y_low), end - start, height,
-                                       edgecolor=edgecolor, facecolor=qcat_color, linewidth=linewidth))
-                y_low += height
-        collection = PatchCollection(rects, match_original=True)
+        starts = data.starts
+        ends = data.ends
+        values = data.values
+        categories = data.categories
+        if self.plot_width_px is not None:
+            number_of_pixels = int(self.plot_width_px)
+        else:
+            number_of_pixels = int(ax.get_window_extent().width)
+        if len(starts) > number_of_pixels > 0:
+            starts, ends, values, categories = \
+                self.aggregate_per_pixel(starts, ends, values, categories,
+                                         data.start_region, data.end_region,
+                                         number_of_pixels)
+
+        # Draw a rectangle for each value
+        heights = np.abs(values)
+        min_neg_sums = np.where(values < 0, values, 0).sum(axis=1)
+        tops = min_neg_sums[:, np.newaxis] + np.cumsum(heights, axis=1)
+        bottoms = tops - heights
+        to_plot = values != 0
+        if not to_plot.any():
+            return
+        rows = np.nonzero(to_plot)[0]
+        bottoms = bottoms[to_plot]
+        tops = tops[to_plot]
+        rect_starts = starts[rows]
+        rect_ends = ends[rows]
+        vertices = np.stack([np.column_stack([rect_starts, bottoms]),
+                             np.column_stack([rect_starts, tops]),
+                             np.column_stack([rect_ends, tops]),
+                             np.column_stack([rect_ends, bottoms])], axis=1)
+        collection = PolyCollection(vertices,
+                                    facecolors=self.get_colors(categories[to_plot]),
+                                    edgecolors=edgecolor, linewidths=linewidth)
         ax.add_collection(collection)
+        ymin = bottoms.min()
+        ymax = tops.max()
         ax.set_ylim(ymin - ymin * 0.01, ymax + ymax * 0.01)
 
         if self.properties['orientation'] == 'inverted':
@@ -1,8 +1,19 @@
-from . GenomeTrack import GenomeTrack
-from .. utilities import get_optimal_fontsize, change_chrom_names
+from . GenomeTrack import GenomeTrack, TrackData
+from .. utilities import get_optimal_fontsize, change_chrom_names, \
+    InputError, opener, get_cache_file_name, is_bgzip, BgzfReader
 import numpy as np
 import pyfaidx
 import os
+import mmap
+import pickle
+import struct
+import tempfile
+import pysam.libcbgzf
+from matplotlib.collections import PathCollection
+from matplotlib.textpath import TextPath
+from matplotlib.font_manager import FontProperties
+import matplotlib.colors
+import matplotlib.transforms
 
 # Color code for seqs
 seq_color = {'A': 'red',
@@ -11,12 +22,29 @@ seq_color = {'A': 'red',
              'C': 'black',
              'N': 'grey'
              }
+# Color of the other letters
+DEFAULT_SEQ_COLOR = 'grey'
+# Above this number of bp per pixel
+# the bases are plotted as colored bars instead of letters
+FASTA_BARS_BP_PER_PIXEL = 0.2
+# Size of the chunks read to index the fasta files
+FASTA_INDEX_CHUNK_SIZE = 16 * 1024 * 1024
+# Signature of the 2bit files
+TWOBIT_SIGNATURE = 0x1A412743
+# The 4 bases of each byte of the 2bit files
+TWOBIT_BASES = np.array([[ord('TCAG'[(byte >> shift) & 3])
+                          for shift in [6, 4, 2, 0]]
+                         for byte in range(256)], dtype=np.uint8)
 
 
 class FastaTrack(GenomeTrack):
-    SUPPORTED_ENDINGS = ['.fa', '.fasta']
+    SUPPORTED_ENDINGS = ['.fa', '.fasta', '.fa.gz', '.fasta.gz', '.2bit']
     TRACK_TYPE = 'fasta'
-    OPTIONS_TXT = GenomeTrack.OPTIONS_TXT
+    OPTIONS_TXT = GenomeTrack.OPTIONS_TXT + f"""
+# The file can be a fasta file (plain or compressed with bgzip)
+# or a 2bit file.
+file_type = {TRACK_TYPE}
+    """
 
     DEFAULTS_PROPERTIES = {}
     NECESSARY_PROPERTIES = ['file']
@@ -30,24 +58,49 @@ class FastaTrack(GenomeTrack):
 
     def __init__(self, *args, **kwarg):
         super(FastaTrack, self).__init__(*args, **kwarg)
+        self.seq = self.open_fasta(self.properties['file'])
+
+    def open_fasta(self, file_name):
+        """
+        Opens the fasta or 2bit file (the file is shared
+        between all tracks using it).
+        """
+        return self.acquire_data_source('fasta', file_name,
+                                        lambda: self.load_fasta(file_name),
+                                        close=lambda seq: seq.close())
+
+    def load_fasta(self, file_name):
+        """
+        Returns an object which gives access to the sequences
+        by their name without loading the whole file.
+        """
+        with open(file_name, 'rb') as f:
+            magic = f.read(4)
+        if len(magic) == 4 and TWOBIT_SIGNATURE in struct.unpack('<I', magic) + struct.unpack('>I', magic):
+            return TwoBitFile(file_name)
+        if magic[:2] == b'\x1f\x8b':
+            if not is_bgzip(file_name):
+                # The sequences are read from their offset
+                raise InputError(f"The file {file_name} is compressed"
+                                 " with gzip. Only the fasta files"
+                                 " compressed with bgzip are supported,"
+                                 " please compress it with bgzip.")
+            # pyfaidx needs Biopython for the files compressed with bgzip
+            return IndexedFasta(file_name)
         try:
-            self.seq = pyfaidx.Fasta(self.properties['file'])
+            return pyfaidx.Fasta(file_name)
         except pyfaidx.FastaIndexingError:
-            self.seq = self.load_fasta(self.properties['file'])
-
-    def load_fasta(self, fastafile):
-        """Returns a python dict { id : sequence } for the given .fasta file"""
-        with open(os.path.realpath(fastafile), 'r') as filin:
-            fasta = filin.read()
-            fasta = fasta.split('>')[1:]
-            outputdict = {x.split('\n')[0].strip(): "".join(x.split('\n')[1:]) for x in fasta}
-        return outputdict
+            # The lines have different lengths
+            return IndexedFasta(file_name)
 
     def plot_y_axis(self, ax, plot_axis):
         pass
 
-    def plot(self, ax, chrom_region, start_region, end_region):
-
+    def get_chrom_name(self, chrom_region):
+        """
+        Returns the name of the chromosome in the file
+        (or None if it does not exist)
+        """
         if chrom_region not in self.seq.keys():
             chrom_region_before = chrom_region
             chrom_region = change_chrom_names(chrom_region)
@@ -57,13 +110,69 @@ class FastaTrack(GenomeTrack):
                                  f" nor {chrom_region}"
                                  " inside the fasta file. "
                                  "This will generate an empty track!!\n")
-                return
+                return None
+        return chrom_region
+
+    def read_seq(self, chrom, start, end):
+        """
+        Returns the sequence between start and end as a str
+        """
+        if type(self.seq) == pyfaidx.Fasta:
+            return self.seq[chrom][start:end].seq
+        else:
+            return self.seq[chrom][start:end]
+
+    def fetch(self, chrom_region, start_region, end_region):
+
+        chrom_name = self.get_chrom_name(chrom_region)
+        if chrom_name is None:
+            return TrackData(chrom_region, start_region, end_region,
+                             seq=None)
+        chrom_region = chrom_name
+
+        end_seq = end_region
+        if end_region > len(self.seq[chrom_region]):
+            self.log.warning("*Warning*\nPlotting regions goes above"
+                             " sequence length")
+            end_seq = len(self.seq[chrom_region])
+
+        seq_overlap = self.read_seq(chrom_region, start_region, end_seq)
+
+        return TrackData(chrom_region, start_region, end_region,
+                         seq=seq_overlap)
+
+    def draw(self, ax, data):
+        if data.seq is None or len(data.seq) == 0:
+            return
 
+        # If the x-scale is inverted the complement is used:
+        xleft, xright = ax.get_xlim()
+        if xleft > xright:
+            seq_overlap_correct = pyfaidx.complement(data.seq)
+        else:
+            seq_overlap_correct = data.seq
+        seq_array = np.array(list(seq_overlap_correct))
+
+        if self.plot_width_px is not None:
+            plot_width_px = self.plot_width_px
+        else:
+            plot_width_px = ax.get_window_extent().width
+        if (data.end_region - data.start_region) / plot_width_px > FASTA_BARS_BP_PER_PIXEL:
+            self.draw_bars(ax, data.start_region, seq_array, plot_width_px)
+        else:
+            self.draw_letters(ax, data.start_region, data.end_region, seq_array)
+
+    def draw_letters(self, ax, start_region, end_region, seq_array):
+        """
+        All the letters of the same base are plotted with
+        a single collection of the path of the letter.
+        """
         plotting_figure_width = ax.get_window_extent().transformed(ax.get_figure().dpi_scale_trans.inverted()).width
 
         # The first constrain on the fontsize is the width
         ideal_fontsize = 1.4 * get_optimal_fontsize(plotting_figure_width,
-                                                    start_region, end_region)
+                                                    start_region,
+                                                    end_region)
         # The other constraint is the height
         # 1 point = 1/72 inch = height of character
         max_fontsize = ax.get_window_extent().transformed(ax.get_figure().dpi_scale_trans.inverted()).height * 72
@@ -71,24 +180,358 @@ class FastaTrack(GenomeTrack):
         # Let's take the biggest font possible with these constraints so that the figure is as readable as possible
         fontsize = min(ideal_fontsize, max_fontsize)
 
-        if end_region > len(self.seq[chrom_region]):
-            self.log.warning("*Warning*\nPlotting regions goes above"
-                             " sequence length")
-            end_region = len(self.seq[chrom_region])
+        # The paths are in points and the offsets in data coordinates
+        path_transform = matplotlib.transforms.Affine2D().scale(1 / 72) + \
+            ax.get_figure().dpi_scale_trans
+        font = FontProperties()
+        # As in ax.text, the letters are vertically centered
+        # on the line (from the descent of 'p' to the ascent of 'l')
+        line_extents = TextPath((0, 0), 'lp', size=fontsize, prop=font).get_extents()
+        for letter in np.unique(seq_array):
+            x_values = np.flatnonzero(seq_array == letter) + start_region + 0.5
+            path = TextPath((0, 0), letter, size=fontsize, prop=font)
+            extents = path.get_extents()
+            path = path.transformed(matplotlib.transforms.Affine2D().translate(
+                - (extents.x0 + extents.x1) / 2,
+                - (line_extents.y0 + line_extents.y1) / 2))
+            ax.add_collection(PathCollection([path],
+                                             offsets=np.column_stack([x_values,
+                                                                      np.full(len(x_values), 0.5)]),
+                                             transOffset=ax.transData,
+                                             transform=path_transform,
+                                             facecolors=seq_color.get(letter.upper(), DEFAULT_SEQ_COLOR),
+                                             edgecolors='none'),
+                              autolim=False)
 
-        if type(self.seq) == pyfaidx.Fasta:
-            seq_overlap = self.seq[chrom_region][start_region:end_region].seq
+    def draw_bars(self, ax, start_region, seq_array, plot_width_px):
+        """
+        The bases are plotted as colored bars in a single image
+        with at most one base per pixel.
+        """
+        seq_length = len(seq_array)
+        if seq_length > plot_width_px:
+            # Only the base in the middle of each pixel is plotted
+            seq_array = seq_array[((np.arange(int(plot_width_px)) + 0.5)
+                                   * seq_length / int(plot_width_px)).astype(int)]
+        letters, letter_index = np.unique(np.char.upper(seq_array), return_inverse=True)
+        letter_colors = np.array([matplotlib.colors.to_rgb(seq_color.get(letter, DEFAULT_SEQ_COLOR))
+                                  for letter in letters])
+        ax.imshow(letter_colors[letter_index][np.newaxis], aspect='auto',
+                  interpolation='nearest',
+                  extent=(start_region, start_region + seq_length, 0, 1))
+
+
+class IndexedFasta(object):
+    """
+    Random access to the sequences of a fasta file
+    (plain or compressed with bgzip) which can have lines
+    of different lengths.
+    The index is built once and kept in the cache directory.
+    The plain files are read through mmap.
+    The sequences are given as str with:
+    fasta[name][start:end]
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.bgzip = is_bgzip(file_name)
+        self.index, self.blocks = self.open_index()
+        if self.bgzip:
+            self.handle = pysam.libcbgzf.BGZFile(file_name, 'rb')
+        elif os.path.getsize(file_name) > 0:
+            with open(file_name, 'rb') as f:
+                self.handle = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
         else:
-            seq_overlap = self.seq[chrom_region][start_region:end_region]
+            self.handle = None
 
-        # If the x-scale is inverted the complement is used:
-        xleft, xright = ax.get_xlim()
-        if xleft > xright:
-            seq_overlap_correct = pyfaidx.complement(seq_overlap)
+    def open_index(self):
+        index_file = get_cache_file_name(self.file_name, 'fasta_index.pkl')
+        if os.path.exists(index_file):
+            with open(index_file, 'rb') as f:
+                return pickle.load(f)
+        index = index_fasta(self.file_name)
+        if self.bgzip:
+            blocks = get_bgzip_blocks(self.file_name)
+        else:
+            blocks = None
+        # The index is written to a temporary file
+        # which is renamed at the end
+        # to never use a partial index
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(index_file),
+                                         delete=False) as f:
+            pickle.dump((index, blocks), f)
+        os.replace(f.name, index_file)
+        return index, blocks
+
+    def keys(self):
+        return self.index.keys()
+
+    def __getitem__(self, name):
+        return FastaSequence(self, name)
+
+    def get_length(self, name):
+        return self.index[name][0]
+
+    def get_seq(self, name, start, end):
+        length, segments = self.index[name]
+        start = max(0, start)
+        end = min(length, end)
+        seq = []
+        for seq_start, offset, line_bases, line_width, n_lines in segments:
+            first = max(start, seq_start)
+            last = min(end, seq_start + line_bases * n_lines)
+            if first >= last:
+                continue
+            # The offset of the first and the last base:
+            first_offset = offset + (first - seq_start) // line_bases * line_width \
+                + (first - seq_start) % line_bases
+            last_offset = offset + (last - 1 - seq_start) // line_bases * line_width \
+                + (last - 1 - seq_start) % line_bases
+            seq.append(self.read(first_offset, last_offset + 1).translate(None, b'\r\n'))
+        return b''.join(seq).decode()
+
+    def read(self, start, end):
+        """
+        Returns the bytes between start and end
+        of the (uncompressed) file.
+        """
+        if not self.bgzip:
+            return self.handle[start:end]
+        block = np.searchsorted(self.blocks[:, 1], start, side='right') - 1
+        block_coffset, block_uoffset = self.blocks[block]
+        self.handle.seek((int(block_coffset) << 16) | int(start - block_uoffset))
+        return self.handle.read(end - start)
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+class TwoBitFile(object):
+    """
+    Random access to the sequences of a 2bit file
+    (read through mmap).
+    The sequences are given as str with:
+    twobit[name][start:end]
+    The masked bases are in lower case.
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, 'rb') as f:
+            self.handle = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if struct.unpack('<I', self.handle[:4])[0] == TWOBIT_SIGNATURE:
+            self.endian = '<'
+        else:
+            self.endian = '>'
+        version, seq_count = struct.unpack(self.endian + 'II', self.handle[4:12])
+        if version not in [0, 1]:
+            raise InputError(f"The version {version} of the 2bit file {file_name}"
+                             " is not supported.")
+        # The version 1 uses 64 bits offsets
+        offset_format = self.endian + ('I' if version == 0 else 'Q')
+        offset_size = struct.calcsize(offset_format)
+        # The offsets of the records:
+        self.offsets = {}
+        pos = 16
+        for _ in range(seq_count):
+            name_size = self.handle[pos]
+            name = self.handle[pos + 1: pos + 1 + name_size].decode()
+            pos += 1 + name_size
+            self.offsets[name] = struct.unpack(offset_format,
+                                               self.handle[pos: pos + offset_size])[0]
+            pos += offset_size
+        # The records are read when needed
+        self.records = {}
+
+    def keys(self):
+        return self.offsets.keys()
+
+    def __getitem__(self, name):
+        return FastaSequence(self, name)
+
+    def get_record(self, name):
+        """
+        Returns the length, the blocks of N,
+        the masked blocks and the offset of the packed sequence
+        """
+        if name not in self.records:
+            pos = self.offsets[name]
+            length, n_count = struct.unpack(self.endian + 'II', self.handle[pos: pos + 8])
+            pos += 8
+            n_blocks = self.read_blocks(pos, n_count)
+            pos += 8 * n_count
+            mask_count = struct.unpack(self.endian + 'I', self.handle[pos: pos + 4])[0]
+            pos += 4
+            mask_blocks = self.read_blocks(pos, mask_count)
+            # There are 4 reserved bytes
+            pos += 8 * mask_count + 4
+            self.records[name] = (length, n_blocks, mask_blocks, pos)
+        return self.records[name]
+
+    def read_blocks(self, pos, count):
+        """
+        Returns the starts and ends of count blocks
+        """
+        values = np.frombuffer(self.handle, dtype=self.endian + 'u4',
+                               count=2 * count, offset=pos).astype(np.int64)
+        return values[:count], values[:count] + values[count:]
+
+    def get_length(self, name):
+        return self.get_record(name)[0]
+
+    def get_seq(self, name, start, end):
+        length, n_blocks, mask_blocks, dna_offset = self.get_record(name)
+        start = max(0, start)
+        end = min(length, end)
+        if start >= end:
+            return ''
+        packed = np.frombuffer(self.handle, dtype=np.uint8,
+                               count=(end - 1) // 4 - start // 4 + 1,
+                               offset=dna_offset + start // 4)
+        seq = TWOBIT_BASES[packed].ravel()[start % 4: start % 4 + end - start]
+        for (block_starts, block_ends), is_mask in [(n_blocks, False),
+                                                    (mask_blocks, True)]:
+            overlap = (block_starts < end) & (block_ends > start)
+            for block_start, block_end in zip(block_starts[overlap], block_ends[overlap]):
+                block = slice(max(block_start, start) - start,
+                              min(block_end, end) - start)
+                if is_mask:
+                    # Lower case
+                    seq[block] |= 0x20
+                else:
+                    seq[block] = ord('N')
+        return seq.tobytes().decode()
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+class FastaSequence(object):
+    """
+    A sequence of IndexedFasta or TwoBitFile
+    which can be sliced.
+    """
+    def __init__(self, fasta, name):
+        self.fasta = fasta
+        self.name = name
+
+    def __len__(self):
+        return self.fasta.get_length(self.name)
+
+    def __getitem__(self, key):
+        start, end, _ = key.indices(len(self))
+        return self.fasta.get_seq(self.name, start, end)
+
+
+def index_fasta(file_name):
+    """
+    Returns the index of a fasta file (plain or compressed with bgzip)
+    as a dict {name: (length, segments)}.
+    The segments are the consecutive lines with the same number of bases
+    as an array with in each row: the position in the sequence of the
+    first base, the offset in the (uncompressed) file of the first line,
+    the number of bases per line, the number of bytes per line and
+    the number of lines.
+    """
+    records = {}
+    current = None
+    offset = 0
+    leftover = b''
+    with opener(file_name) as f:
+        for chunk in iter(lambda: f.read(FASTA_INDEX_CHUNK_SIZE), b''):
+            data = leftover + chunk
+            data_offset = offset - len(leftover)
+            offset += len(chunk)
+            # Only complete lines are indexed
+            last_new_line = data.rfind(b'\n')
+            leftover = data[last_new_line + 1:]
+            if last_new_line >= 0:
+                current = index_fasta_lines(records, current,
+                                            data[:last_new_line + 1],
+                                            data_offset)
+    if len(leftover) > 0:
+        index_fasta_lines(records, current, leftover + b'\n',
+                          offset - len(leftover))
+    return {name: (length, np.array(segments, dtype=np.int64).reshape(-1, 5))
+            for name, (length, segments) in records.items()}
+
+
+def index_fasta_lines(records, current, lines, lines_offset):
+    """
+    Adds to records the lines (bytes ending with a new line)
+    which start at lines_offset in the file.
+    current is the name of the record of the first line.
+    Returns the name of the record of the last line.
+    """
+    array = np.frombuffer(lines, dtype=np.uint8)
+    ends = np.flatnonzero(array == ord('\n')) + 1
+    starts = np.concatenate([[0], ends[:-1]])
+    widths = ends - starts
+    # The new line (and the carriage return) are not bases
+    bases = widths - 1
+    bases[widths > 1] -= array[ends[widths > 1] - 2] == ord('\r')
+    is_header = array[starts] == ord('>')
+    # The lines between 2 headers belong to the same record
+    bounds = np.unique(np.concatenate([[0], np.flatnonzero(is_header),
+                                       [len(starts)]]))
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        if is_header[first]:
+            fields = lines[starts[first] + 1: ends[first]].split()
+            current = fields[0].decode() if len(fields) > 0 else ''
+            records[current] = [0, []]
+            first += 1
+        if current is None or first >= last:
+            continue
+        add_fasta_segments(records[current], starts[first:last] + lines_offset,
+                           widths[first:last], bases[first:last])
+    return current
+
+
+def add_fasta_segments(record, starts, widths, bases):
+    """
+    Adds the lines to the segments of the record ([length, segments])
+    """
+    # Empty lines are skipped
+    keep = bases > 0
+    starts = starts[keep]
+    widths = widths[keep]
+    bases = bases[keep]
+    if len(starts) == 0:
+        return
+    # A new segment starts when the length of the line changes
+    # or when the line does not follow the previous one
+    new_segment = np.ones(len(starts), dtype=bool)
+    new_segment[1:] = (bases[1:] != bases[:-1]) | (widths[1:] != widths[:-1]) | \
+        (starts[1:] != starts[:-1] + widths[:-1])
+    segment_firsts = np.flatnonzero(new_segment)
+    n_lines = np.diff(np.concatenate([segment_firsts, [len(starts)]]))
+    seq_starts = record[0] + np.concatenate([[0], np.cumsum(bases)])[segment_firsts]
+    segments = record[1]
+    for seq_start, offset, line_bases, line_width, n in zip(seq_starts, starts[segment_firsts],
+                                                            bases[segment_firsts],
+                                                            widths[segment_firsts], n_lines):
+        if len(segments) > 0 and segments[-1][2] == line_bases and \
+           segments[-1][3] == line_width and \
+           segments[-1][1] + segments[-1][3] * segments[-1][4] == offset:
+            segments[-1][4] += n
         else:
-            seq_overlap_correct = seq_overlap
+            segments.append([int(seq_start), int(offset), int(line_bases),
+                             int(line_width), int(n)])
+    record[0] += int(bases.sum())
+
 
-        for i, letter in enumerate(seq_overlap_correct):
-            ax.text(i + start_region + 0.5, 0.5, letter,
-                    color=seq_color[letter.upper()], verticalalignment='center',
-                    horizontalalignment='center', fontsize=fontsize)
+def get_bgzip_blocks(file_name):
+    """
+    Returns the offsets in the compressed and in the uncompressed
+    file of each block of a file compressed with bgzip
+    (like the .gzi index of samtools).
+    """
+    blocks = []
+    uoffset = 0
+    with open(file_name, 'rb') as f:
+        for coffset, isize in BgzfReader.iter_blocks(f):
+            blocks.append((coffset, uoffset))
+            uoffset += isize
+    return np.array(blocks, dtype=np.int64).reshape(-1, 2)
@@ -0,0 +1,211 @@
+from . FastaTrack import FastaTrack
+from . GenomeTrack import GenomeTrack, TrackData
+from .. utilities import plot_coverage
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_GC_CONTENT_COLOR = '#1f78b4'
+# The bases are counted by chunks of the chromosomes
+# which are kept for the next regions
+GC_CONTENT_CHUNK_SIZE = 100000
+GC_CONTENT_CACHED_CHUNKS = 32
+# The counts needed for each composition
+COMPOSITION_COUNTS = {'gc': ['acgt', 'gc'],
+                      'cpg_oe': ['acgt', 'c', 'g', 'cpg'],
+                      'n_fraction': ['n']}
+
+
+class GCContentTrack(FastaTrack):
+    # The fasta files are plotted as fasta by default
+    SUPPORTED_ENDINGS = []
+    TRACK_TYPE = 'gc_content'
+    OPTIONS_TXT = GenomeTrack.OPTIONS_TXT + f"""
+# The sequence composition is computed on the fly
+# from a fasta file (plain or compressed with bgzip) or a 2bit file.
+# The composition can be:
+# gc: the percentage of G and C among the A, C, G, T
+# cpg_oe: the ratio of observed to expected CpG
+# (number of CpG * number of A, C, G, T / (number of C * number of G))
+# n_fraction: the fraction of N
+composition = gc
+# The number of bins takes the region to be plotted and divides it
+# into the number of bins specified
+# Then, the composition of each bin is computed and plotted.
+number_of_bins = 700
+color = {DEFAULT_GC_CONTENT_COLOR}
+# To use transparency, you can use alpha
+# default is 1
+# alpha = 0.5
+# the default for max_value is 'auto' which means that the scale will go
+# roughly to the maximum value found in the region plotted.
+# the default for min_value is 0.
+#min_value = auto
+#max_value = auto
+# for type, the options are: line, points, fill. Default is fill
+# to add the preferred line width or point size use:
+# type = line:lw where lw (linewidth) is float
+# similarly points:ms sets the point size (markersize (ms) to the given float
+# type = line:0.5
+# type = points:0.5
+# set show_data_range to false to hide the text on the left showing the data range
+show_data_range = true
+# If you want to have a grid on the y-axis
+#grid = true
+# The file type must be given as the fasta files
+# are plotted as sequences by default:
+file_type = {TRACK_TYPE}
+    """
+
+    DEFAULTS_PROPERTIES = {'composition': 'gc',
+                           'number_of_bins': 700,
+                           'max_value': None,
+                           'min_value': 0,
+                           'show_data_range': True,
+                           'orientation': None,
+                           'color': DEFAULT_GC_CONTENT_COLOR,
+                           'alpha': 1,
+                           'type': 'fill',
+                           'grid': False}
+    NECESSARY_PROPERTIES = ['file']
+    SYNONYMOUS_PROPERTIES = {'max_value': {'auto': None},
+                             'min_value': {'auto': None}}
+    POSSIBLE_PROPERTIES = {'orientation': [None, 'inverted'],
+                           'composition': ['gc', 'cpg_oe', 'n_fraction']}
+    BOOLEAN_PROPERTIES = ['show_data_range', 'grid']
+    STRING_PROPERTIES = ['file', 'file_type', 'overlay_previous',
+                         'orientation', 'title', 'composition',
+                         'color', 'type']
+    FLOAT_PROPERTIES = {'max_value': [- np.inf, np.inf],
+                        'min_value': [- np.inf, np.inf],
+                        'alpha': [0, 1],
+                        'height': [0, np.inf]}
+    INTEGER_PROPERTIES = {'number_of_bins': [1, np.inf]}
+
+    def __init__(self, *args, **kwarg):
+        super(GCContentTrack, self).__init__(*args, **kwarg)
+        # (chromosome, chunk) -> cumulative counts
+        self.chunk_counts = OrderedDict()
+
+    def set_properties_defaults(self):
+        super(GCContentTrack, self).set_properties_defaults()
+        super(GCContentTrack, self).process_type_for_coverage_track()
+        self.process_color('color')
+
+    def plot_y_axis(self, ax, plot_axis):
+        GenomeTrack.plot_y_axis(self, ax, plot_axis,
+                                only_at_ticks=self.properties['grid'])
+
+    def fetch(self, chrom_region, start_region, end_region):
+        chrom_name = self.get_chrom_name(chrom_region)
+        if chrom_name is None:
+            return TrackData(chrom_region, start_region, end_region,
+                             x_values=None, scores=None)
+        chrom_length = len(self.seq[chrom_name])
+        if end_region > chrom_length:
+            self.log.warning("*Warning*\nPlotting regions goes above"
+                             " sequence length")
+        n_bins = self.properties['number_of_bins']
+        bin_edges = np.clip(np.linspace(start_region, end_region,
+                                        n_bins + 1).astype(int),
+                            0, chrom_length)
+        counts = dict(zip(COMPOSITION_COUNTS[self.properties['composition']],
+                          np.diff(self.get_counts(chrom_name, chrom_length,
+                                                  bin_edges))))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.properties['composition'] == 'gc':
+                scores = 100 * counts['gc'] / counts['acgt']
+            elif self.properties['composition'] == 'cpg_oe':
+                scores = counts['cpg'] * counts['acgt'] / \
+                    (counts['c'] * counts['g'])
+            else:
+                scores = counts['n'] / np.diff(bin_edges)
+        # The bins without base (or without C and G) are not plotted
+        scores[~ np.isfinite(scores)] = np.nan
+        return TrackData(chrom_region, start_region, end_region,
+                         x_values=np.linspace(start_region, end_region, n_bins),
+                         scores=scores)
+
+    def draw(self, ax, data):
+        if data.scores is None:
+            return
+
+        plot_coverage(ax, data.x_values, data.scores, self.plot_type,
+                      self.size,
+                      self.properties['color'],
+                      self.properties['color'],
+                      self.properties['alpha'],
+                      self.properties['grid'])
+
+        self.adjust_ylim(ax)
+
+    def get_counts(self, chrom, chrom_length, positions):
+        """
+        Returns the cumulative counts (one row per count
+        of the composition) at each position
+        relative to the chunk of the first position.
+        The positions must be sorted.
+        """
+        chunks = np.minimum(positions // GC_CONTENT_CHUNK_SIZE,
+                            max(0, chrom_length - 1) // GC_CONTENT_CHUNK_SIZE)
+        counts = np.zeros((len(COMPOSITION_COUNTS[self.properties['composition']]),
+                           len(positions)), dtype=np.int64)
+        # The counts of the previous chunks
+        offset = 0
+        for chunk in range(chunks[0], chunks[-1] + 1):
+            chunk_counts = self.get_chunk_counts(chrom, chrom_length, chunk)
+            in_chunk = chunks == chunk
+            counts[:, in_chunk] = \
+                chunk_counts[:, positions[in_chunk] - chunk * GC_CONTENT_CHUNK_SIZE] \
+                + offset
+            offset = offset + chunk_counts[:, -1:]
+        return counts
+
+    def get_chunk_counts(self, chrom, chrom_length, chunk):
+        """
+        Returns the cumulative counts of the chunk
+        (which are kept for the next regions).
+        """
+        key = (chrom, chunk)
+        if key in self.chunk_counts:
+            self.chunk_counts.move_to_end(key)
+            return self.chunk_counts[key]
+        start = chunk * GC_CONTENT_CHUNK_SIZE
+        end = min(chrom_length, start + GC_CONTENT_CHUNK_SIZE)
+        # One more base is needed for the CpG
+        seq = self.read_seq(chrom, start, min(chrom_length, end + 1))
+        counts = self.count_bases(np.frombuffer(seq.upper().encode('ascii'),
+                                                dtype=np.uint8),
+                                  end - start,
+                                  COMPOSITION_COUNTS[self.properties['composition']])
+        self.chunk_counts[key] = counts
+        if len(self.chunk_counts) > GC_CONTENT_CACHED_CHUNKS:
+            self.chunk_counts.popitem(last=False)
+        return counts
+
+    @staticmethod
+    def count_bases(seq, length, count_names):
+        """
+        Returns the cumulative counts of the
+        first length bases of seq (an upper case array of bytes)
+        with one row per count in count_names
+        (and length + 1 columns starting with 0).
+        The CpG are counted at the position of the C.
+
+        >>> seq = np.frombuffer(b'ACGNNCG', dtype=np.uint8)
+        >>> GCContentTrack.count_bases(seq, 6, ['gc', 'n', 'cpg']).tolist()
+        [[0, 0, 1, 2, 2, 2, 3], [0, 0, 0, 0, 1, 2, 2], [0, 0, 1, 1, 1, 1, 2]]
+        """
+        bases = seq[:length]
+        is_c = bases == ord('C')
+        is_g = bases == ord('G')
+        next_is_g = np.zeros(length, dtype=bool)
+        next_is_g[:len(seq) - 1] = seq[1:length + 1] == ord('G')
+        values = {'acgt': is_c | is_g | (bases == ord('A')) | (bases == ord('T')),
+                  'gc': is_c | is_g,
+                  'c': is_c,
+                  'g': is_g,
+                  'cpg': is_c & next_is_g,
+                  'n': bases == ord('N')}
+        counts = np.zeros((len(count_names), length + 1), dtype=np.int64)
+        counts[:, 1:] = np.cumsum([values[name] for name in count_names], axis=1)
+        return counts
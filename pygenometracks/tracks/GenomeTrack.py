@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from .. utilities import InputError, transform
+from .. utilities import InputError, transform, data_sources, decimate_per_pixel
 import logging
 import numpy as np
 from matplotlib import colors as mc
@@ -18,6 +18,39 @@ color_tuple = re.compile(r'^\(({0}),({0}),({0})\)$'.format(float_regex))
 block_no_comma_outside_parenthesis = re.compile(r'(?:[^,(]|\([^)]*\))+')
 
 DEFAULT_MAX_SIGNS = 4
+# Number of bins of the coverage tracks with number_of_bins = auto
+# when the width of the plot is unknown
+DEFAULT_NUMBER_OF_BINS = 700
+
+
+class TrackData(object):
+    """
+    Holds the data fetched by a track for one region.
+    The region is stored in chrom_region, start_region, end_region
+    and each track adds the values it needs to draw
+    (preferably as numpy arrays) as attributes.
+    It is picklable as soon as the values are.
+
+    >>> data = TrackData('chr1', 0, 100, scores=np.array([0.5, 1]))
+    >>> data.scores
+    array([0.5, 1. ])
+    >>> import pickle
+    >>> pickle.loads(pickle.dumps(data)).end_region
+    100
+    """
+
+    def __init__(self, chrom_region, start_region, end_region, **values):
+        self.chrom_region = chrom_region
+        self.start_region = start_region
+        self.end_region = end_region
+        self.__dict__.update(values)
+
+    def __repr__(self):
+        values = ', '.join([f"{k}={v!r}" for k, v in self.__dict__.items()
+                            if k not in ['chrom_region', 'start_region',
+                                         'end_region']])
+        return f"TrackData({self.chrom_region}:{self.start_region}-" \
+            f"{self.end_region}, {values})"
 
 
 class GenomeTrack(object):
@@ -26,7 +59,10 @@ class GenomeTrack(object):
     For example, to plot a bedgraph file a new class that extends GenomeTrack
     should be created.
 
-    It is expected that all GenomeTrack objects have a plot method.
+    It is expected that all GenomeTrack objects have a fetch method,
+    which gets the data of a region without plotting anything,
+    and a draw method, which plots this data.
+    Tracks which only implement the plot method are still supported.
 
     """
     SUPORTED_ENDINGS = []
@@ -54,6 +90,11 @@ height = 2
     INTEGER_PROPERTIES = {}
 
     def __init__(self, properties_dict):
+        # keys of the data sources used by this track
+        self.data_source_keys = []
+        # width (in pixels) of the plot
+        # (set by PlotTracks, None if unknown)
+        self.plot_width_px = None
         FORMAT = "[%(levelname)s:%(filename)s:%(lineno)s - %(funcName)20s()] %(message)s"
         logging.basicConfig(format=FORMAT)
         log = logging.getLogger(__name__)
@@ -81,6 +122,57 @@ height = 2
                                  f"{default_value}.\n")
                 self.properties[prop] = default_value
 
+    def acquire_data_source(self, kind, file_name, load, close=None,
+                            **options):
+        """
+        Returns the data source of kind for the file file_name
+        loaded with the options.
+        The data source is shared with all tracks using the same
+        file with the same options so load() is only called once.
+        close(value) is called once no track uses it anymore.
+        """
+        key = data_sources.get_key(kind, file_name, **options)
+        value = data_sources.acquire(key, load, close)
+        self.data_source_keys.append(key)
+        return value
+
+    def release_data_sources(self):
+        """
+        Releases all data sources used by the track.
+        Can be called multiple times.
+        """
+        while len(getattr(self, 'data_source_keys', [])) > 0:
+            data_sources.release(self.data_source_keys.pop())
+
+    def fetch(self, chrom_region, start_region, end_region):
+        """
+        Gets the data needed to plot the region.
+        It must not use matplotlib so it can be done
+        before or while other tracks are drawn.
+        By default, only the region is stored.
+        Returns a TrackData which is given to draw.
+        """
+        return TrackData(chrom_region, start_region, end_region)
+
+    def draw(self, ax, data):
+        """
+        Plots on ax the data obtained by fetch.
+        By default, uses the plot method (for tracks which
+        do not implement fetch and draw).
+        """
+        self.plot(ax, data.chrom_region, data.start_region, data.end_region)
+
+    def plot(self, ax, chrom_region, start_region, end_region):
+        """
+        Fetches and draws the region.
+        Kept for compatibility, PlotTracks uses fetch and draw.
+        The tracks must implement either draw (with fetch) or plot.
+        """
+        if type(self).draw is GenomeTrack.draw:
+            raise NotImplementedError(f"The track class {type(self).__name__}"
+                                      " must implement draw or plot.")
+        self.draw(ax, self.fetch(chrom_region, start_region, end_region))
+
     def plot_y_axis(self, ax, plot_axis, transform='no', log_pseudocount=0,
                     y_axis='tranformed', only_at_ticks=False):
         """
@@ -390,6 +482,30 @@ height = 2
                              "Will use default.\n")
             self.plot_type = default_plot_type
 
+    def get_coverage_to_plot(self, data):
+        """
+        Returns the x values and the scores of the data of a
+        coverage track to plot. With lines or fill, only the
+        points visible at the pixel width of the plot are kept.
+        """
+        if self.plot_type == 'points' or self.plot_width_px is None:
+            return data.x_values, data.scores
+        return decimate_per_pixel(data.x_values, data.scores,
+                                  data.start_region, data.end_region,
+                                  max(1, int(self.plot_width_px)))
+
+    def get_number_of_bins(self):
+        """
+        Returns the number of bins of a coverage track.
+        With number_of_bins = auto, there is one bin per
+        pixel of the plot.
+        """
+        if self.properties['number_of_bins'] is not None:
+            return self.properties['number_of_bins']
+        if self.plot_width_px is None:
+            return DEFAULT_NUMBER_OF_BINS
+        return max(1, int(self.plot_width_px))
+
     def process_color(self, param, colormap_possible=False,
                       bed_rgb_possible=False, colormap_only=False,
                       default_value_is_colormap=False):
@@ -621,4 +737,4 @@ height = 2
             axis.set_ylim(ymin, ymax)
 
     def __del__(self):
-        return
+        self.release_data_sources()
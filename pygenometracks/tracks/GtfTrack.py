@@ -2,7 +2,6 @@ from . GenomeTrack import GenomeTrack
 from . BedTrack import BedTrack
 from .. readGtf import ReadGtf
 from matplotlib import font_manager
-from .. utilities import temp_file_from_intersect
 import numpy as np
 
 DEFAULT_BED_COLOR = '#1f78b4'
@@ -171,17 +170,23 @@ file_type = {TRACK_TYPE}
         # to set the distance between rows
         self.row_scale = 2.3
 
-    def get_bed_handler(self, plot_regions=None):
-        if not self.properties['global_max_row']:
-            # I do the intersection:
-            file_to_open = temp_file_from_intersect(self.properties['file'],
-                                                    plot_regions, AROUND_REGION)
-        else:
-            file_to_open = self.properties['file']
+    def get_reader_options(self):
+        return {'reader': 'gtf',
+                'prefered_name': self.properties['prefered_name'],
+                'merge_transcripts': self.properties['merge_transcripts'],
+                'merge_overlapping_exons':
+                self.properties['merge_overlapping_exons']}
 
-        bed_file_h = ReadGtf(file_to_open,
+    def get_bed_handler(self, plot_regions=None):
+        # The whole gtf is converted to bed12 once
+        # and stored in the cache directory:
+        bed_file_h = ReadGtf(self.properties['file'],
                              self.properties['prefered_name'],
                              self.properties['merge_transcripts'],
-                             self.properties['merge_overlapping_exons'])
+                             self.properties['merge_overlapping_exons'],
+                             use_cache=True)
+        if not self.properties['global_max_row'] and plot_regions is not None:
+            # I restrict to the regions:
+            bed_file_h.restrict_to_regions(plot_regions, AROUND_REGION)
         total_length = bed_file_h.length
         return(bed_file_h, total_length)
@@ -96,6 +96,53 @@ show_masked_bins = false
                 # Like 3 bins each direction but I don't manage
                 # To think about a good way.
                 region = [f"{chrom}:{start}-{end}"]
+        # The matrix is loaded only once for all tracks
+        # which use the same file with the same options
+        self.hic_ma, self.chrom_sizes, min_value = \
+            self.acquire_data_source('hic_matrix', self.properties['file'],
+                                     lambda: self.load_matrix(region),
+                                     region=region,
+                                     depth=self.properties.get('depth'),
+                                     show_masked_bins=self.properties['show_masked_bins'])
+        if min_value is None:
+            # There is no data
+            return
+
+        # check that the matrix can be log transformed
+        if self.properties['transform'] != 'no':
+            if self.properties['transform'] == 'log1p':
+                if min_value + 1 <= 0:
+                    raise Exception("\n*ERROR*\nMatrix contains values below - 1.\n"
+                                    "log1p transformation can not be applied to \n"
+                                    f"values in matrix: {self.properties['file']}")
+
+            elif self.properties['transform'] in ['-log', 'log']:
+                if min_value < 0:
+                    # For values not filled or equal to zero there will be a
+                    # mask, they will be replaced by the minimum value after 0.
+                    raise Exception("\n*ERROR*\nMatrix contains negative values.\n"
+                                    "log transformation can not be applied to \n"
+                                    f"values in matrix: {self.properties['file']}")
+
+        if len(self.hic_ma.matrix.data) == 0:
+            # The depth is smaller than the binsize
+            return
+
+        self.process_color('colormap', colormap_possible=True,
+                           colormap_only=True, default_value_is_colormap=True)
+
+        self.cmap = copy.copy(cm.get_cmap(self.properties['colormap']))
+        self.cmap.set_bad('black')
+
+    def load_matrix(self, region):
+        """
+        Loads the matrix (restricted to region if not None),
+        masks the bins and reduces it to the depth if needed.
+        Returns the hiCMatrix, the chromosome sizes and the
+        minimum value of the matrix (before the reduction).
+        The chromosome sizes and the minimum value are None when
+        there is no data.
+        """
         # Cooler and thus HiCMatrix with cool file will raise an error if:
         # - the file is a cool file and:
         #    - the region goes over the chromosome size
@@ -106,8 +153,8 @@ show_masked_bins = false
         # the user to see all the errors raised during the try except
         logging.getLogger('hicmatrix').setLevel(logging.CRITICAL)
         try:
-            self.hic_ma = HiCMatrix.hiCMatrix(self.properties['file'],
-                                              pChrnameList=region)
+            hic_ma = HiCMatrix.hiCMatrix(self.properties['file'],
+                                         pChrnameList=region)
         except ValueError as ve:
             if region is not None:
                 if "Unknown sequence label" in str(ve):
@@ -117,26 +164,26 @@ show_masked_bins = false
                     chrom_region = change_chrom_names(chrom_region)
                     region = [f"{chrom_region}:{rs[1]}"]
                     try:
-                        self.hic_ma = HiCMatrix.hiCMatrix(self.properties['file'],
-                                                          pChrnameList=region)
+                        hic_ma = HiCMatrix.hiCMatrix(self.properties['file'],
+                                                     pChrnameList=region)
                     except ValueError as ve2:
                         if "Unknown sequence label" in str(ve2):
                             self.log.warning("*Warning*\nNeither " + chrom_region_before
                                              + " nor " + chrom_region + " exists as a "
                                              "chromosome name on the matrix. "
                                              "This will generate an empty track!!\n")
-                            self.hic_ma = HiCMatrix.hiCMatrix()
-                            self.hic_ma.matrix = scipy.sparse.csr_matrix((0, 0))
+                            hic_ma = HiCMatrix.hiCMatrix()
+                            hic_ma.matrix = scipy.sparse.csr_matrix((0, 0))
                         elif "Genomic region out of bounds" in str(ve2):
                             region = [chrom_region]
-                            self.hic_ma = HiCMatrix.hiCMatrix(self.properties['file'],
-                                                              pChrnameList=region)
+                            hic_ma = HiCMatrix.hiCMatrix(self.properties['file'],
+                                                         pChrnameList=region)
                         else:
                             raise ve2
                 elif "Genomic region out of bounds" in str(ve):
                     region = [region[0].split(':')[0]]
-                    self.hic_ma = HiCMatrix.hiCMatrix(self.properties['file'],
-                                                      pChrnameList=region)
+                    hic_ma = HiCMatrix.hiCMatrix(self.properties['file'],
+                                                 pChrnameList=region)
                 else:
                     raise ve
             else:
@@ -144,42 +191,30 @@ show_masked_bins = false
         # We put back the log to warning
         logging.getLogger('hicmatrix').setLevel(logging.WARNING)
 
-        if len(self.hic_ma.matrix.data) == 0:
+        if len(hic_ma.matrix.data) == 0:
             if region is None:
                 # This is not due to a restriction of the matrix
                 raise Exception(f"Matrix {self.properties['file']} is empty")
             else:
-                return
+                return hic_ma, None, None
         # We need to get the size before masking bins because
         # HiCMatrix>=v13 give smaller chromosome_sizes after:
-        self.chrom_sizes = self.hic_ma.get_chromosome_sizes()
+        chrom_sizes = hic_ma.get_chromosome_sizes()
         if self.properties['show_masked_bins']:
             pass
         else:
-            self.hic_ma.maskBins(self.hic_ma.nan_bins)
+            hic_ma.maskBins(hic_ma.nan_bins)
 
-        # check that the matrix can be log transformed
-        if self.properties['transform'] != 'no':
-            if self.properties['transform'] == 'log1p':
-                if self.hic_ma.matrix.data.min() + 1 <= 0:
-                    raise Exception("\n*ERROR*\nMatrix contains values below - 1.\n"
-                                    "log1p transformation can not be applied to \n"
-                                    f"values in matrix: {self.properties['file']}")
-
-            elif self.properties['transform'] in ['-log', 'log']:
-                if self.hic_ma.matrix.data.min() < 0:
-                    # For values not filled or equal to zero there will be a
-                    # mask, they will be replaced by the minimum value after 0.
-                    raise Exception("\n*ERROR*\nMatrix contains negative values.\n"
-                                    "log transformation can not be applied to \n"
-                                    f"values in matrix: {self.properties['file']}")
+        # The minimum is used to check that the matrix can be
+        # log transformed
+        min_value = hic_ma.matrix.data.min()
 
-        new_intervals = hicmatrix.utilities.enlarge_bins(self.hic_ma.cut_intervals)
-        self.hic_ma.interval_trees, self.hic_ma.chrBinBoundaries = \
-            self.hic_ma.intervalListToIntervalTree(new_intervals)
+        new_intervals = hicmatrix.utilities.enlarge_bins(hic_ma.cut_intervals)
+        hic_ma.interval_trees, hic_ma.chrBinBoundaries = \
+            hic_ma.intervalListToIntervalTree(new_intervals)
 
-        self.hic_ma.cut_intervals = new_intervals
-        binsize = self.hic_ma.getBinSize()
+        hic_ma.cut_intervals = new_intervals
+        binsize = hic_ma.getBinSize()
 
         if 'depth' in self.properties:
             max_depth_in_bins = int(self.properties['depth'] / binsize)
@@ -188,45 +223,40 @@ show_masked_bins = false
                 self.log.warning(f"*Warning*\nThe depth({self.properties['depth']})"
                                  f" is smaller than binsize({binsize})"
                                  "This will generate an empty track!!\n")
-                self.hic_ma.matrix = scipy.sparse.csr_matrix((0, 0))
-                return
+                hic_ma.matrix = scipy.sparse.csr_matrix((0, 0))
+                return hic_ma, chrom_sizes, min_value
 
-            self.reduce_matrix(max_depth_in_bins)
+            self.reduce_matrix(hic_ma, max_depth_in_bins)
 
-        self.process_color('colormap', colormap_possible=True,
-                           colormap_only=True, default_value_is_colormap=True)
+        return hic_ma, chrom_sizes, min_value
 
-        self.cmap = copy.copy(cm.get_cmap(self.properties['colormap']))
-        self.cmap.set_bad('black')
-
-    def reduce_matrix(self, max_depth_in_bins):
+    def reduce_matrix(self, hic_ma, max_depth_in_bins):
         # work only with the lower matrix
         # and remove all pixels that are beyond
         # 2 * max_depth_in_bis which are not required
         # (this is done by subtracting a second sparse matrix
         # that contains only the lower matrix that wants to be removed.
         limit = 2 * max_depth_in_bins
-        self.hic_ma.matrix = scipy.sparse.triu(self.hic_ma.matrix, k=0, format='csr') - \
-            scipy.sparse.triu(self.hic_ma.matrix, k=limit, format='csr')
-        self.hic_ma.matrix.eliminate_zeros()
+        hic_ma.matrix = scipy.sparse.triu(hic_ma.matrix, k=0, format='csr') - \
+            scipy.sparse.triu(hic_ma.matrix, k=limit, format='csr')
+        hic_ma.matrix.eliminate_zeros()
 
         # fill the main diagonal, otherwise it looks
         # not so good. The main diagonal is filled
         # with an array containing the max value found
         # in the matrix
-        if sum(self.hic_ma.matrix.diagonal()) == 0:
+        if sum(hic_ma.matrix.diagonal()) == 0:
             self.log.info("Filling main diagonal with max value because it empty and looks bad...\n")
-            max_value = self.hic_ma.matrix.data.max()
-            main_diagonal = scipy.sparse.dia_matrix(([max_value] * self.hic_ma.matrix.shape[0], [0]),
-                                                    shape=self.hic_ma.matrix.shape)
-            self.hic_ma.matrix = self.hic_ma.matrix + main_diagonal
+            max_value = hic_ma.matrix.data.max()
+            main_diagonal = scipy.sparse.dia_matrix(([max_value] * hic_ma.matrix.shape[0], [0]),
+                                                    shape=hic_ma.matrix.shape)
+            hic_ma.matrix = hic_ma.matrix + main_diagonal
 
     def check_before_plotting(self, chrom_region, region_start, region_end, suffix=''):
         if len(self.hic_ma.matrix.data) == 0:
             self.log.warning("*Warning*\nThere is no data for the region "
                              "considered on the matrix. "
                              "This will generate an empty track!!\n")
-            self.last_img_plotted = None
             return False, chrom_region
 
         log.debug(f'{suffix}chrom_region {chrom_region}, region_start {region_start}, region_end {region_end}')
@@ -238,7 +268,6 @@ show_masked_bins = false
                                  + " nor " + chrom_region + " exists as a "
                                  "chromosome name on the matrix. "
                                  "This will generate an empty track!!\n")
-                self.last_img_plotted = None
                 return False, chrom_region
 
         if region_start > self.chrom_sizes[chrom_region]:
@@ -246,7 +275,6 @@ show_masked_bins = false
                              " chromosome size. This will generate an empty track.\n"
                              f"{chrom_region} size: {self.chrom_sizes[chrom_region]}"
                              f". Region to plot {suffix}{region_start}-{region_end}\n")
-            self.last_img_plotted = None
             return False, chrom_region
 
         if region_end > self.chrom_sizes[chrom_region]:
@@ -260,7 +288,6 @@ show_masked_bins = false
             self.log.warning("*Warning*\nThere is no data for the region "
                              "considered on the matrix. "
                              "This will generate an empty track!!\n")
-            self.last_img_plotted = None
             return False, chrom_region
         # Or it may be shortened:
         if region_start > self.hic_ma.get_chromosome_sizes()[chrom_region]:
@@ -269,14 +296,10 @@ show_masked_bins = false
                              " This will generate an empty track.\n"
                              f"{chrom_region} last bin: {self.hic_ma.get_chromosome_sizes()[chrom_region]}"
                              f". Region to plot {suffix}{region_start}-{region_end}\n")
-            self.last_img_plotted = None
             return False, chrom_region
 
         return True, chrom_region
 
-    def plot(self, ax, chrom_region, region_start, region_end):
-        return
-
     def plot_y_axis(self, cbar_ax, plot_ax):
         if self.last_img_plotted is None:
             return
@@ -1,6 +1,7 @@
 from matplotlib import colors
 import numpy as np
 from . HiCMatrixLikeTrack import HiCMatrixLikeTrack
+from . GenomeTrack import TrackData
 from .. utilities import get_region
 import logging
 
@@ -35,11 +36,12 @@ file_type = {TRACK_TYPE}
             self.properties['region'].append(region2)
         super(HiCMatrixSquareTrack, self).set_properties_defaults()
 
-    def plot(self, ax, chrom_region, region_start, region_end):
+    def fetch(self, chrom_region, region_start, region_end):
 
         continue_plotting, chrom_region = self.check_before_plotting(chrom_region, region_start, region_end)
         if not continue_plotting:
-            return
+            return TrackData(chrom_region, region_start, region_end,
+                             matrix=None)
 
         # get bin id of start and end of region in given chromosome
         chr_start_id_x, chr_end_id_x = self.hic_ma.getChrBinRange(chrom_region)
@@ -53,8 +55,8 @@ file_type = {TRACK_TYPE}
             self.log.warning("*Warning*\nThere is no data for the region "
                              "considered on the matrix. "
                              "This will generate an empty track!!\n")
-            self.img = None
-            return
+            return TrackData(chrom_region, region_start, region_end,
+                             matrix=None)
         start_pos = [x[1] for i, x in enumerate(self.hic_ma.cut_intervals) if i in idx]
 
         # Process region2:
@@ -67,7 +69,8 @@ file_type = {TRACK_TYPE}
             log.debug(f'On y: chrom_region: {chrom_region_y}, region_start {region_start_y}, region_end {region_end_y}')
             continue_plotting, chrom_region_y = self.check_before_plotting(chrom_region_y, region_start_y, region_end_y, suffix='on y ')
             if not continue_plotting:
-                return
+                return TrackData(chrom_region, region_start, region_end,
+                                 matrix=None)
 
             # get bin id of start and end of region2 in given chromosome
             chr_start_id_y, chr_end_id_y = self.hic_ma.getChrBinRange(chrom_region_y)
@@ -81,8 +84,8 @@ file_type = {TRACK_TYPE}
                 self.log.warning("*Warning*\nThere is no data for the region "
                                  "considered on the matrix. "
                                  "This will generate an empty track!!\n")
-                self.img = None
-                return
+                return TrackData(chrom_region, region_start, region_end,
+                                 matrix=None)
             start_pos_y = [x[1] for i, x in enumerate(self.hic_ma.cut_intervals) if i in idx_y]
 
         # select only relevant matrix part
@@ -124,16 +127,26 @@ file_type = {TRACK_TYPE}
                       f"{self.properties['section_name']} to: "
                       f"{vmin}, {vmax}\n")
 
+        return TrackData(chrom_region, region_start, region_end,
+                         matrix=matrix, start_pos=start_pos,
+                         start_pos_y=start_pos_y, region_start_y=region_start_y,
+                         region_end_y=region_end_y, vmin=vmin, vmax=vmax)
+
+    def draw(self, ax, data):
+        self.last_img_plotted = None
+        if data.matrix is None:
+            return
+
         if self.properties['transform'] == 'log1p':
-            self.current_norm = colors.LogNorm(vmin=vmin, vmax=vmax)
+            self.current_norm = colors.LogNorm(vmin=data.vmin, vmax=data.vmax)
         else:
-            self.current_norm = colors.Normalize(vmin=vmin, vmax=vmax)
+            self.current_norm = colors.Normalize(vmin=data.vmin, vmax=data.vmax)
 
-        self.last_img_plotted = ax.pcolormesh(start_pos, start_pos_y, np.transpose(matrix),
+        self.last_img_plotted = ax.pcolormesh(data.start_pos, data.start_pos_y, np.transpose(data.matrix),
                                               cmap=self.cmap, norm=self.current_norm, shading='flat')
         if self.properties['rasterize']:
             self.last_img_plotted.set_rasterized(True)
         if self.properties['orientation'] == 'inverted':
-            ax.set_ylim(region_start_y, region_end_y)
+            ax.set_ylim(data.region_start_y, data.region_end_y)
         else:
-            ax.set_ylim(region_end_y, region_start_y)
+            ax.set_ylim(data.region_end_y, data.region_start_y)
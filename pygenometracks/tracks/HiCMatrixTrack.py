@@ -2,6 +2,7 @@ import scipy.sparse
 from matplotlib import colors
 import numpy as np
 from . HiCMatrixLikeTrack import HiCMatrixLikeTrack
+from . GenomeTrack import TrackData
 import logging
 import itertools
 
@@ -26,11 +27,12 @@ file_type = {TRACK_TYPE}
                               **HiCMatrixLikeTrack.INTEGER_PROPERTIES)
     # The colormap can only be a colormap
 
-    def plot(self, ax, chrom_region, region_start, region_end):
+    def fetch(self, chrom_region, region_start, region_end):
 
         continue_plotting, chrom_region = self.check_before_plotting(chrom_region, region_start, region_end)
         if not continue_plotting:
-            return
+            return TrackData(chrom_region, region_start, region_end,
+                             matrix=None)
         # expand region to plus depth on both sides
         # to avoid a 45 degree 'cut' on the edges
 
@@ -46,8 +48,8 @@ file_type = {TRACK_TYPE}
             self.log.warning("*Warning*\nThere is no data for the region "
                              "considered on the matrix. "
                              "This will generate an empty track!!\n")
-            self.img = None
-            return
+            return TrackData(chrom_region, region_start, region_end,
+                             matrix=None)
         start_pos = [x[1] for i, x in enumerate(self.hic_ma.cut_intervals) if i in idx]
         # select only relevant matrix part
         matrix = self.hic_ma.matrix[idx, :][:, idx]
@@ -119,18 +121,27 @@ file_type = {TRACK_TYPE}
                       f"{self.properties['section_name']} to: "
                       f"{vmin}, {vmax}\n")
 
+        return TrackData(chrom_region, region_start, region_end,
+                         matrix=matrix, start_pos=start_pos, depth=depth,
+                         vmin=vmin, vmax=vmax)
+
+    def draw(self, ax, data):
+        self.last_img_plotted = None
+        if data.matrix is None:
+            return
+
         if self.properties['transform'] == 'log1p':
-            self.current_norm = colors.LogNorm(vmin=vmin, vmax=vmax)
+            self.current_norm = colors.LogNorm(vmin=data.vmin, vmax=data.vmax)
         else:
-            self.current_norm = colors.Normalize(vmin=vmin, vmax=vmax)
+            self.current_norm = colors.Normalize(vmin=data.vmin, vmax=data.vmax)
 
-        self.last_img_plotted = self.pcolormesh_45deg(ax, matrix, start_pos)
+        self.last_img_plotted = self.pcolormesh_45deg(ax, data.matrix, data.start_pos)
         if self.properties['rasterize']:
             self.last_img_plotted.set_rasterized(True)
         if self.properties['orientation'] == 'inverted':
-            ax.set_ylim(depth, 0)
+            ax.set_ylim(data.depth, 0)
         else:
-            ax.set_ylim(0, depth)
+            ax.set_ylim(0, data.depth)
 
     def pcolormesh_45deg(self, ax, matrix_c, start_pos_vector):
         """
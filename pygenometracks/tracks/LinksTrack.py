@@ -1,18 +1,26 @@
-from . GenomeTrack import GenomeTrack
+from . GenomeTrack import GenomeTrack, TrackData
 from pygenometracks.utilities import InputError
 from intervaltree import IntervalTree, Interval
 import matplotlib
 import numpy as np
-from matplotlib.patches import Arc, Polygon
-from .. utilities import opener, to_string, change_chrom_names, temp_file_from_intersect, get_region
-from tqdm import tqdm
+from matplotlib.collections import LineCollection, PathCollection, PolyCollection
+from matplotlib.path import Path
+from .. utilities import opener, to_string, change_chrom_names, temp_file_from_intersect, get_region, get_tabix_columns, iter_lines_with_progress
+import itertools
+import pysam
 
 DEFAULT_LINKS_COLOR = 'blue'
 HUGE_NUMBER = int(1e9)  # Which should be above any chromosome size
+DEFAULT_MAX_LINKS = 100000
+# The size of the bins used to plot the density of links
+DENSITY_BIN_SIZE_PX = 5
+# Half of the unit circle, it is scaled to get the arcs
+ARC_PATH = Path.arc(0, 180)
 
 
 class LinksTrack(GenomeTrack):
-    SUPPORTED_ENDINGS = ['.arcs', '.arc', '.link', '.links', '.bedpe']
+    SUPPORTED_ENDINGS = ['.arcs', '.arc', '.link', '.links', '.bedpe',
+                         '.arcs.gz', '.links.gz', '.bedpe.gz', '.bedpe.bgz']
     TRACK_TYPE = 'links'
     OPTIONS_TXT = GenomeTrack.OPTIONS_TXT + f"""
 # the file format for links is (tab separated)
@@ -21,6 +29,12 @@ class LinksTrack(GenomeTrack):
 # The fields after the score field will be ignored
 # for example:
 #   chr1 100 200 chr1 250 300 0.5
+# For large files, the links in the same chromosome can be
+# compressed with bgzip and indexed from start1 to end2:
+#   sort -k1,1 -k2,2n links.bedpe | bgzip > links.bedpe.gz
+#   tabix -s 1 -b 2 -e 6 links.bedpe.gz
+# Then only the links of the plotted region are read
+# (except when region2 is used).
 # depending on the value of links_type either 'arcs' or 'triangles' or 'loops'
 # or 'squares' can be plotted.
 # If arcs, an arc will be drawn linking the beginning of the first region (chr1: 100),
@@ -66,6 +80,11 @@ line_style = solid
 # The unit is bp. This corresponds to the longest arc you will see.
 # This option is incompatible with compact_arcs_level = 2
 #ylim = 100000
+# When more than max_links links would be plotted,
+# the density of links is plotted instead (default is 100000)
+# (links smaller than a pixel are only counted once per pixel)
+# Use none to always plot the links.
+#max_links = 1000
 file_type = {TRACK_TYPE}
     """
     DEFAULTS_PROPERTIES = {'links_type': 'arcs',
@@ -80,11 +99,13 @@ file_type = {TRACK_TYPE}
                            'ylim': None,
                            'compact_arcs_level': '0',
                            'use_middle': False,
-                           'region2': None}
+                           'region2': None,
+                           'max_links': DEFAULT_MAX_LINKS}
     NECESSARY_PROPERTIES = ['file']
     SYNONYMOUS_PROPERTIES = {'max_value': {'auto': None},
                              'min_value': {'auto': None},
-                             'ylim': {'auto': None}}
+                             'ylim': {'auto': None},
+                             'max_links': {'none': None}}
     POSSIBLE_PROPERTIES = {'orientation': [None, 'inverted'],
                            'links_type': ['arcs', 'triangles', 'loops', 'squares'],
                            'line_style': ['solid', 'dashed',
@@ -101,12 +122,13 @@ file_type = {TRACK_TYPE}
                         'alpha': [0, 1],
                         'line_width': [0, np.inf],
                         'height': [0, np.inf]}
-    INTEGER_PROPERTIES = {}
+    INTEGER_PROPERTIES = {'max_links': [0, np.inf]}
     # The color can be a color or a colormap (if there is a score)
 
     def set_properties_defaults(self):
         super(LinksTrack, self).set_properties_defaults()
         self.max_height = None
+        self.density_plotted = False
 
         if self.properties['region2'] is not None \
            and self.properties['links_type'] != 'squares':
@@ -129,7 +151,14 @@ file_type = {TRACK_TYPE}
                                  "\n")
                 self.properties['use_middle'] = False
 
-        self.interval_tree, min_score, max_score, has_score = self.process_link_file(self.properties['region'])
+        self.tbx = None
+        self.interval_tree = None
+        if self.properties['region2'] is None:
+            self.tbx = self.open_tabix(self.properties['file'])
+        if self.tbx is not None:
+            min_score, max_score, has_score = self.get_score_range(self.properties['region'])
+        else:
+            self.interval_tree, min_score, max_score, has_score = self.process_link_file(self.properties['region'])
         if self.properties['line_width'] is None and not has_score:
             self.log.warning("*WARNING* for section "
                              f"{self.properties['section_name']}"
@@ -176,75 +205,116 @@ file_type = {TRACK_TYPE}
                              "ylim will be ignored.\n")
             self.properties['ylim'] = None
 
-    def plot(self, ax, chrom_region, region_start, region_end):
+    def fetch(self, chrom_region, region_start, region_end):
         """
-        Makes an arc connecting two points on a linear scale representing
-        interactions between Hi-C bins.
-        Or a diamong or a triangle highlighting interactions.
-        Or a square.
-        :param ax: matplotlib axis
+        Selects the links to plot in the region.
+        Returns for each link the interval plotted
+        (begin, end), the coordinates (start1, end1,
+        start2, end2) and the score.
+        For squares, the sides to plot are also stored.
         """
-        self.max_height = 0
-        count = 0
-
-        if chrom_region not in list(self.interval_tree):
+        if self.tbx is not None:
+            chrom_names = self.tbx.contigs
+        else:
+            chrom_names = list(self.interval_tree)
+        if chrom_region not in chrom_names:
             chrom_region_before = chrom_region
             chrom_region = change_chrom_names(chrom_region)
-            if chrom_region not in list(self.interval_tree):
+            if chrom_region not in chrom_names:
                 self.log.warning("*Warning*\nNeither " + chrom_region_before
                                  + " nor " + chrom_region + " exists as a "
                                  "chromosome name inside the link file. "
                                  "This will generate an empty track!!\n")
-                return
+                return TrackData(chrom_region, region_start, region_end,
+                                 intervals=None)
 
-        arcs_in_region = sorted(self.interval_tree[chrom_region][region_start:region_end])
-
-        for idx, interval in enumerate(arcs_in_region):
-            if self.properties['links_type'] == 'squares':
-                plotting_sides = {'as_in_data': False, 'mirrored': False}
-                start1, end1, start2, end2, _ = interval.data
-                if self.properties['region2'] is None:
-                    temp_region2 = [chrom_region, region_start, region_end]
-                else:
-                    temp_region2 = self.region2
-                if chrom_region not in [temp_region2[0], change_chrom_names(temp_region2[0])]:
-                    # This is a trans:
-                    plotting_sides['as_in_data'] = True
-                else:
-                    # We need to check which sides need to be plotted:
-                    if (start1 < region_end and end1 > region_start) \
-                       and (start2 < temp_region2[2] and end2 > temp_region2[1]):
-                        plotting_sides['as_in_data'] = True
-                    if (start2 < region_end and end2 > region_start) \
-                       and (start1 < temp_region2[2] and end1 > temp_region2[1]):
-                        plotting_sides['mirrored'] = True
-                    if not plotting_sides['as_in_data'] and not plotting_sides['mirrored']:
-                        continue
-            else:
-                # skip intervals whose start and end are outside the plotted region
-                if interval.begin < region_start and interval.end > region_end:
-                    continue
-
-            if self.properties['line_width'] is not None:
-                self.current_line_width = float(self.properties['line_width'])
+        if self.tbx is not None:
+            intervals, links = self.get_links_from_tabix(chrom_region, region_start, region_end)
+        else:
+            arcs_in_region = sorted(self.interval_tree[chrom_region][region_start:region_end])
+            intervals = np.array([(interval.begin, interval.end) for interval in arcs_in_region],
+                                 dtype=float).reshape(-1, 2)
+            links = np.array([interval.data for interval in arcs_in_region],
+                             dtype=float).reshape(-1, 5)
+        coordinates = links[:, :4]
+        scores = links[:, 4]
+        sides = None
+        if self.properties['links_type'] == 'squares':
+            start1, end1, start2, end2 = coordinates.T
+            if self.properties['region2'] is None:
+                temp_region2 = [chrom_region, region_start, region_end]
             else:
-                self.current_line_width = 0.5 * np.sqrt(interval.data[4])
-
-            if self.properties['links_type'] == 'triangles':
-                self.plot_triangles(ax, interval)
-            elif self.properties['links_type'] == 'loops':
-                self.plot_loops(ax, interval.data)
-            elif self.properties['links_type'] == 'squares':
-                if plotting_sides['as_in_data']:
-                    self.plot_squares(ax, interval.data)
-                if plotting_sides['mirrored']:
-                    self.plot_squares(ax, interval.data, mirrored=True)
+                temp_region2 = self.region2
+            if chrom_region not in [temp_region2[0], change_chrom_names(temp_region2[0])]:
+                # This is a trans:
+                sides = np.zeros((len(links), 2), dtype=bool)
+                sides[:, 0] = True
             else:
-                self.plot_arcs(ax, interval)
+                # We need to check which sides need to be plotted:
+                # the first column is as_in_data and the second mirrored
+                sides = np.column_stack([(start1 < region_end) & (end1 > region_start)
+                                         & (start2 < temp_region2[2]) & (end2 > temp_region2[1]),
+                                         (start2 < region_end) & (end2 > region_start)
+                                         & (start1 < temp_region2[2]) & (end1 > temp_region2[1])])
+            to_keep = sides.any(axis=1)
+            sides = sides[to_keep]
+        else:
+            # skip intervals whose start and end are outside the plotted region
+            to_keep = ~((intervals[:, 0] < region_start) & (intervals[:, 1] > region_end))
+        return TrackData(chrom_region, region_start, region_end,
+                         intervals=intervals[to_keep],
+                         coordinates=coordinates[to_keep],
+                         scores=scores[to_keep], sides=sides)
+
+    def draw(self, ax, data):
+        """
+        Makes an arc connecting two points on a linear scale representing
+        interactions between Hi-C bins.
+        Or a diamong or a triangle highlighting interactions.
+        Or a square.
+        All links are drawn at once in a single collection.
+        The links smaller than a pixel are only drawn once per pixel
+        and above max_links links, the density of links is plotted.
+        :param ax: matplotlib axis
+        """
+        self.max_height = 0
+        self.density_plotted = False
+        if data.intervals is None:
+            return
+        region_start = data.start_region
+        region_end = data.end_region
+
+        if self.properties['line_width'] is not None:
+            line_widths = np.full(len(data.scores), float(self.properties['line_width']))
+        else:
+            line_widths = 0.5 * np.sqrt(data.scores)
+        if self.colormap:
+            # translate score field
+            # into a color
+            colors = self.colormap.to_rgba(data.scores)
+        else:
+            colors = np.tile(matplotlib.colors.to_rgba(self.properties['color']),
+                             (len(data.scores), 1))
+
+        if self.properties['links_type'] == 'triangles':
+            vertices = self.get_triangles_vertices(data.intervals)
+        elif self.properties['links_type'] == 'loops':
+            vertices = self.get_loops_vertices(data.coordinates)
+        elif self.properties['links_type'] == 'squares':
+            vertices = np.concatenate([self.get_squares_vertices(data.coordinates[data.sides[:, 0]]),
+                                       self.get_squares_vertices(data.coordinates[data.sides[:, 1]],
+                                                                 mirrored=True)])
+            line_widths = np.concatenate([line_widths[data.sides[:, 0]],
+                                          line_widths[data.sides[:, 1]]])
+            colors = np.concatenate([colors[data.sides[:, 0]],
+                                     colors[data.sides[:, 1]]])
+        else:
+            vertices = self.get_arcs_vertices(data.intervals)
 
-            count += 1
+        if self.properties['links_type'] != 'squares' and len(vertices) > 0:
+            self.max_height = vertices[:, :, 1].max()
 
-        self.log.debug(f"{count} were links plotted")
+        y_lim = None
         if self.properties['overlay_previous'] != 'share-y':
             if self.properties['links_type'] == 'squares':
                 if self.properties['region2'] is None:
@@ -254,9 +324,9 @@ file_type = {TRACK_TYPE}
                     region_start_y = self.region2[1]
                     region_end_y = self.region2[2]
                 if self.properties['orientation'] == 'inverted':
-                    ax.set_ylim(region_start_y, region_end_y)
+                    y_lim = (region_start_y, region_end_y)
                 else:
-                    ax.set_ylim(region_end_y, region_start_y)
+                    y_lim = (region_end_y, region_start_y)
             else:
                 # the arc height is equal to the radius, the track height is the largest
                 # radius plotted plus an small increase to avoid cropping of the arcs
@@ -269,164 +339,284 @@ file_type = {TRACK_TYPE}
                     else:
                         ymax = self.properties['ylim']
                 if self.properties['orientation'] == 'inverted':
-                    ax.set_ylim(ymax, -1)
+                    y_lim = (ymax, -1)
                 else:
-                    ax.set_ylim(-1, ymax)
+                    y_lim = (-1, ymax)
+
+        if len(vertices) > 0:
+            extent = ax.get_window_extent()
+            width_px = self.plot_width_px if self.plot_width_px is not None else extent.width
+            height_px = extent.height * width_px / extent.width
+            y_lim_px = y_lim if y_lim is not None else ax.get_ylim()
+            bboxes = np.column_stack([vertices[:, :, 0].min(axis=1),
+                                      vertices[:, :, 0].max(axis=1),
+                                      vertices[:, :, 1].min(axis=1),
+                                      vertices[:, :, 1].max(axis=1)])
+            to_keep = self.merge_subpixel_links(bboxes,
+                                                width_px / (region_end - region_start),
+                                                height_px / abs(y_lim_px[1] - y_lim_px[0]))
+            self.log.debug(f"{to_keep.sum()} links out of {len(to_keep)} will be plotted")
+            if self.properties['max_links'] is not None and \
+               to_keep.sum() > self.properties['max_links']:
+                self.draw_density(ax, bboxes, (region_start, region_end),
+                                  y_lim_px, width_px, height_px)
+                self.density_plotted = True
+            else:
+                self.draw_links(ax, vertices[to_keep], colors[to_keep],
+                                line_widths[to_keep])
+
+        if y_lim is not None:
+            ax.set_ylim(*y_lim)
 
     def plot_y_axis(self, axis, plot_ax):
-        if self.colormap is not None and self.properties['overlay_previous'] == 'no':
+        # The colorbar gives the scores which are not
+        # used when the density is plotted
+        if self.colormap is not None and self.properties['overlay_previous'] == 'no' \
+           and not self.density_plotted:
             self.colormap.set_array([])
             GenomeTrack.plot_custom_cobar(self, axis, fraction=1)
 
-    def plot_arcs(self, ax, interval):
-
-        width = (interval.end - interval.begin)
-        if self.properties['compact_arcs_level'] == '1':
-            half_height = np.sqrt(width)
-        elif self.properties['compact_arcs_level'] == '2':
-            half_height = 1000
-        else:
-            half_height = width
-        center = interval.begin + width / 2
-        if half_height > self.max_height:
-            self.max_height = half_height
-        # I think this was an error...
-        # ax.plot([center], [diameter])
-        if self.colormap:
-            # translate score field
-            # into a color
-            rgb = self.colormap.to_rgba(interval.data[4])
-        else:
-            rgb = self.properties['color']
-        ax.add_patch(Arc((center, 0), width,
-                         2 * half_height, 0, 0, 180, color=rgb,
-                         linewidth=self.current_line_width,
-                         ls=self.properties['line_style']))
-
-    def plot_triangles(self, ax, interval):
-        x1 = interval.begin
-        x2 = x1 + float(interval.end - interval.begin) / 2
-        x3 = interval.end
-        y1 = 0
+    def get_heights(self, widths):
+        """
+        Returns the heights of arcs and triangles
+        depending on the compact_arcs_level.
+        """
         if self.properties['compact_arcs_level'] == '1':
-            y2 = np.sqrt(interval.end - interval.begin)
+            return np.sqrt(widths)
         elif self.properties['compact_arcs_level'] == '2':
-            y2 = 1000
+            return np.full(len(widths), 1000.)
         else:
-            y2 = (interval.end - interval.begin)
+            return widths
 
-        if self.colormap:
-            # translate score field
-            # into a color
-            rgb = self.colormap.to_rgba(interval.data[4])
-        else:
-            rgb = self.properties['color']
-
-        triangle = Polygon(np.array([[x1, y1], [x2, y2], [x3, y1]]),
-                           closed=False,
-                           facecolor='none', edgecolor=rgb,
-                           linewidth=self.current_line_width,
-                           ls=self.properties['line_style'])
-        ax.add_artist(triangle)
-        if y2 > self.max_height:
-            self.max_height = y2
-
-    def plot_loops(self, ax, loop):
+    def get_arcs_vertices(self, intervals):
+        """
+        Returns the vertices of the bezier curves of the half ellipses
+        linking the begin and the end of each interval.
+        """
+        width = intervals[:, 1] - intervals[:, 0]
+        half_height = self.get_heights(width)
+        center = intervals[:, 0] + width / 2
+        # The unit half circle is scaled and translated for each arc
+        return ARC_PATH.vertices[np.newaxis, :, :] \
+            * np.column_stack([width / 2, half_height])[:, np.newaxis, :] \
+            + np.column_stack([center, np.zeros(len(center))])[:, np.newaxis, :]
+
+    def get_triangles_vertices(self, intervals):
+        x1 = intervals[:, 0]
+        x3 = intervals[:, 1]
+        x2 = x1 + (x3 - x1) / 2
+        y1 = np.zeros(len(x1))
+        y2 = self.get_heights(x3 - x1)
+        return np.stack([np.column_stack([x1, y1]),
+                         np.column_stack([x2, y2]),
+                         np.column_stack([x3, y1])], axis=1)
+
+    def get_loops_vertices(self, loops):
         """
               " <- 2
         3->  "  " <- 1
                " <- 0
             """
-        width1 = loop[1] - loop[0]
-        width2 = loop[3] - loop[2]
-        x0 = (loop[1] + loop[2]) / 2
-        y0 = loop[2] - loop[1]
+        width1 = loops[:, 1] - loops[:, 0]
+        width2 = loops[:, 3] - loops[:, 2]
+        x0 = (loops[:, 1] + loops[:, 2]) / 2
+        y0 = loops[:, 2] - loops[:, 1]
 
         x1 = x0 + width2 / 2
         y1 = y0 + width2
 
-        x2 = (loop[0] + loop[3]) / 2
-        y2 = loop[3] - loop[0]
+        x2 = (loops[:, 0] + loops[:, 3]) / 2
+        y2 = loops[:, 3] - loops[:, 0]
 
         x3 = x0 - width1 / 2
         y3 = y0 + width1
 
-        if self.colormap:
-            # translate score field
-            # into a color
-            rgb = self.colormap.to_rgba(loop[4])
-        else:
-            rgb = self.properties['color']
-
-        rectangle = Polygon(np.array([[x0, y0], [x1, y1], [x2, y2], [x3, y3]]),
-                            facecolor='none', edgecolor=rgb,
-                            linewidth=self.current_line_width,
-                            ls=self.properties['line_style'])
-        ax.add_artist(rectangle)
-        if y2 > self.max_height:
-            self.max_height = y2
+        return np.stack([np.column_stack([x0, y0]),
+                         np.column_stack([x1, y1]),
+                         np.column_stack([x2, y2]),
+                         np.column_stack([x3, y3])], axis=1)
 
-    def plot_squares(self, ax, loop, mirrored=False):
+    def get_squares_vertices(self, loops, mirrored=False):
         """
         mirrored means mirrored regarding to the diagonal
         (start2, end2, start1, end1)
         2->  "  " <- 1
         3->  "  " <- 0
         """
-        # loop is start1, end1, start2, end2, score
+        # loops are start1, end1, start2, end2
         if not mirrored:
-            x0 = loop[1]
-            y0 = loop[2]
-            y1 = loop[3]
-            x2 = loop[0]
+            x0 = loops[:, 1]
+            y0 = loops[:, 2]
+            y1 = loops[:, 3]
+            x2 = loops[:, 0]
         else:
-            x0 = loop[3]
-            y0 = loop[0]
-            y1 = loop[1]
-            x2 = loop[2]
-
-        x1 = x0
-        y2 = y1
-
-        x3 = x2
-        y3 = y0
+            x0 = loops[:, 3]
+            y0 = loops[:, 0]
+            y1 = loops[:, 1]
+            x2 = loops[:, 2]
+
+        return np.stack([np.column_stack([x0, y0]),
+                         np.column_stack([x0, y1]),
+                         np.column_stack([x2, y1]),
+                         np.column_stack([x2, y0])], axis=1)
+
+    @staticmethod
+    def merge_subpixel_links(bboxes, x_scale, y_scale):
+        """
+        Returns a boolean array with the links to plot.
+        The links which are smaller than a pixel in both
+        directions are only kept once per pixel (the last
+        one, which would be drawn on top of the others).
+        bboxes are x_min, x_max, y_min, y_max of each link
+        and the scales are in pixels per unit.
+
+        >>> bboxes = np.array([[0, 10, 0, 10], [0, 0.1, 0, 0.1],
+        ...                    [0.2, 0.3, 0, 0.1], [5, 5.1, 0, 0.1]])
+        >>> LinksTrack.merge_subpixel_links(bboxes, 1, 1)
+        array([ True, False,  True,  True])
+        """
+        x_scale = abs(x_scale)
+        y_scale = abs(y_scale)
+        to_keep = ((bboxes[:, 1] - bboxes[:, 0]) * x_scale >= 1) | \
+            ((bboxes[:, 3] - bboxes[:, 2]) * y_scale >= 1)
+        small = np.flatnonzero(~to_keep)[::-1]
+        if len(small) > 0:
+            pixels = np.floor(np.column_stack([(bboxes[small, 0] + bboxes[small, 1]) / 2 * x_scale,
+                                               (bboxes[small, 2] + bboxes[small, 3]) / 2 * y_scale]))
+            # small is reversed so the first occurrence
+            # is the last link of each pixel
+            __, first = np.unique(pixels, axis=0, return_index=True)
+            to_keep[small[first]] = True
+        return to_keep
+
+    def draw_links(self, ax, vertices, colors, line_widths):
+        """
+        Draws all links in a single collection.
+        """
+        options = dict(facecolors='none', edgecolors=colors,
+                       linewidths=line_widths,
+                       linestyles=self.properties['line_style'],
+                       joinstyle='miter')
+        if self.properties['links_type'] == 'triangles':
+            ax.add_collection(LineCollection(vertices, **options),
+                              autolim=False)
+        elif self.properties['links_type'] in ['loops', 'squares']:
+            ax.add_collection(PolyCollection(vertices, closed=True, **options),
+                              autolim=False)
+        else:
+            ax.add_collection(PathCollection([Path(arc_vertices, ARC_PATH.codes)
+                                              for arc_vertices in vertices],
+                                             **options),
+                              autolim=False)
 
+    def draw_density(self, ax, bboxes, x_lim, y_lim, width_px, height_px):
+        """
+        Plots the number of links per area
+        (using the top of arcs and triangles
+        and the center of loops and squares).
+        """
+        n_x = max(1, int(width_px / DENSITY_BIN_SIZE_PX))
+        n_y = max(1, int(height_px / DENSITY_BIN_SIZE_PX))
+        x_min, x_max = sorted(x_lim)
+        y_min, y_max = sorted(y_lim)
+        if self.properties['links_type'] in ['loops', 'squares']:
+            y_values = (bboxes[:, 2] + bboxes[:, 3]) / 2
+        else:
+            y_values = bboxes[:, 3]
+        density, __, __ = np.histogram2d((bboxes[:, 0] + bboxes[:, 1]) / 2,
+                                         y_values,
+                                         bins=[n_x, n_y],
+                                         range=[[x_min, x_max], [y_min, y_max]])
         if self.colormap:
-            # translate score field
-            # into a color
-            rgb = self.colormap.to_rgba(loop[4])
+            color = self.colormap.cmap(1.0)
+        else:
+            color = self.properties['color']
+        cmap = matplotlib.colors.LinearSegmentedColormap.from_list(
+            'density', [matplotlib.colors.to_rgba(color, 0),
+                        matplotlib.colors.to_rgba(color, 1)])
+        ax.imshow(np.ma.masked_equal(density.T, 0),
+                  extent=(x_min, x_max, y_min, y_max), origin='lower',
+                  aspect='auto', interpolation='nearest', cmap=cmap,
+                  vmin=0)
+
+    def open_tabix(self, file_name):
+        """
+        Returns the tabix file if file_name is compressed with bgzip
+        and indexed from start1 to end2 (tabix -s 1 -b 2 -e 6)
+        else returns None.
+        """
+        try:
+            columns = get_tabix_columns(file_name)
+        except IOError:
+            return None
+        if columns != (1, 2, 6):
+            self.log.warning("*Warning*\nThe tabix index of "
+                             f"{file_name} uses the columns "
+                             f"{columns} for the chromosome, start and end."
+                             " Only the indexes from start1 to end2 "
+                             "(tabix -s 1 -b 2 -e 6) can be used. "
+                             "The whole file will be loaded.\n")
+            return None
+        return self.acquire_data_source('tabix', file_name,
+                                        lambda: pysam.TabixFile(file_name),
+                                        close=lambda tbx: tbx.close())
+
+    def get_score_range(self, plot_regions):
+        """
+        Returns the min and max scores and if all links have a score
+        for the links of the tabix file in the plot_regions
+        (or in the whole file if plot_regions is None).
+        Only one link is kept in memory at a time.
+        """
+        if plot_regions is None:
+            lines = self.tbx.fetch()
         else:
-            rgb = self.properties['color']
-        rectangle = Polygon(np.array([[x0, y0], [x1, y1], [x2, y2], [x3, y3]]),
-                            facecolor='none', edgecolor=rgb,
-                            linewidth=self.current_line_width,
-                            ls=self.properties['line_style'])
-        ax.add_artist(rectangle)
+            lines = itertools.chain.from_iterable(self.tbx.fetch(chrom, max(0, start), end)
+                                                  for chrom_region, start, end in plot_regions
+                                                  for chrom in [chrom_region, change_chrom_names(chrom_region)]
+                                                  if chrom in self.tbx.contigs)
+        has_score = True
+        max_score = float('-inf')
+        min_score = float('inf')
+        for __, __, __, link in self.parse_links(lines):
+            score = link[4]
+            if np.isnan(score):
+                has_score = False
+            else:
+                min_score = min(min_score, score)
+                max_score = max(max_score, score)
+        return min_score, max_score, has_score
 
-    def process_link_file(self, plot_regions):
+    def get_links_from_tabix(self, chrom_region, region_start, region_end):
+        """
+        Returns the intervals plotted and the links
+        (start1, end1, start2, end2, score) overlapping the region
+        sorted as the intervals of the interval tree.
+        """
+        links = np.array([[begin, end] + link for __, begin, end, link
+                          in self.parse_links(self.tbx.fetch(chrom_region,
+                                                             max(0, region_start),
+                                                             region_end))],
+                         dtype=float).reshape(-1, 7)
+        # With use_middle the interval is smaller than the indexed one
+        links = links[(links[:, 0] < region_end) & (links[:, 1] > region_start)]
+        links = links[np.lexsort(links.T[::-1])]
+        return links[:, :2], links[:, 2:]
+
+    def parse_links(self, lines):
+        """
+        Yields for each valid line the chromosome, the interval
+        to plot (begin and end) and the link as a list
+        [start1, end1, start2, end2, score].
+        The score is nan when it is missing or invalid
+        (and for all the following lines).
+        """
         # the file format expected is similar to file format of links in
         # circos:
         # chr1 100 200 chr1 250 300 0.5
         # where the last value is a score.
-
-        if plot_regions is None:
-            file_to_open = self.properties['file']
-        else:
-            # To be sure we do not miss links we will intersect with bed with
-            # only chromosomes used in plot_regions
-            plot_regions_adapted = [(chrom, 0, HUGE_NUMBER) for chrom, __, __ in plot_regions]
-            file_to_open = temp_file_from_intersect(self.properties['file'],
-                                                    plot_regions_adapted)
-
-        valid_intervals = 0
-        interval_tree = {}
-        line_number = 0
         has_score = True
-        max_score = float('-inf')
-        min_score = float('inf')
-        file_h = opener(file_to_open)
-        for line in tqdm(file_h.readlines()):
-            line_number += 1
+        for line_number, line in enumerate(lines, 1):
             line = to_string(line)
             if line.startswith('browser') or line.startswith('track') or line.startswith('#'):
                 continue
@@ -463,7 +653,6 @@ file_type = {TRACK_TYPE}
                 score = line.strip().split('\t')[6]
             except IndexError:
                 has_score = False
-                score = np.nan
 
             try:
                 start1 = int(start1)
@@ -483,30 +672,53 @@ file_type = {TRACK_TYPE}
                 except ValueError as detail:
                     self.log.warning(f"Warning: reading line: {line}. The score is not valid {score} will not be used. "
                                      f"\nError message: {detail}\n")
-                    score = np.nan
                     has_score = False
-                else:
-                    if score < min_score:
-                        min_score = score
-                    if score > max_score:
-                        max_score = score
+            if not has_score:
+                score = np.nan
 
-            if chrom1 not in interval_tree:
-                interval_tree[chrom1] = IntervalTree()
             if start2 < start1 and not is_trans:
                 start1, start2 = start2, start1
                 end1, end2 = end2, end1
             if self.properties['use_middle']:
-                mid1 = (start1 + end1) / 2
-                mid2 = (start2 + end2) / 2
-                interval_tree[chrom1].add(Interval(mid1, mid2, [start1, end1, start2, end2, score]))
+                begin = (start1 + end1) / 2
+                end = (start2 + end2) / 2
+            elif not is_trans:
+                # each interval spans from the smallest start to the largest end
+                begin = start1
+                end = end2
             else:
-                if not is_trans:
-                    # each interval spans from the smallest start to the largest end
-                    interval_tree[chrom1].add(Interval(start1, end2, [start1, end1, start2, end2, score]))
-                else:
-                    # For the trans we keep start1 and end1
-                    interval_tree[chrom1].add(Interval(start1, end1, [start1, end1, start2, end2, score]))
+                # For the trans we keep start1 and end1
+                begin = start1
+                end = end1
+            yield chrom1, begin, end, [start1, end1, start2, end2, score]
+
+    def process_link_file(self, plot_regions):
+        if plot_regions is None:
+            file_to_open = self.properties['file']
+        else:
+            # To be sure we do not miss links we will intersect with bed with
+            # only chromosomes used in plot_regions
+            plot_regions_adapted = [(chrom, 0, HUGE_NUMBER) for chrom, __, __ in plot_regions]
+            file_to_open = temp_file_from_intersect(self.properties['file'],
+                                                    plot_regions_adapted)
+
+        valid_intervals = 0
+        interval_tree = {}
+        has_score = True
+        max_score = float('-inf')
+        min_score = float('inf')
+        file_h = opener(file_to_open)
+        for chrom1, begin, end, link in self.parse_links(iter_lines_with_progress(file_h)):
+            score = link[4]
+            if np.isnan(score):
+                has_score = False
+            else:
+                min_score = min(min_score, score)
+                max_score = max(max_score, score)
+
+            if chrom1 not in interval_tree:
+                interval_tree[chrom1] = IntervalTree()
+            interval_tree[chrom1].add(Interval(begin, end, link))
             valid_intervals += 1
 
         if valid_intervals == 0:
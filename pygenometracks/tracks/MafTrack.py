@@ -1,14 +1,16 @@
-from . GenomeTrack import GenomeTrack
-from .. utilities import change_chrom_names, InputError, get_optimal_fontsize
+from . GenomeTrack import GenomeTrack, TrackData
+from .. utilities import change_chrom_names, InputError, get_optimal_fontsize, get_cache_file_name, is_bgzip
 import bx.align.maf
 import bx.interval_index_file
 import bx.seq
 import matplotlib as mpl
-from matplotlib.patches import Rectangle
+from matplotlib.collections import LineCollection, PolyCollection
 import numpy as np
 from tqdm import tqdm
 import tempfile
-import re
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pysam.libcbgzf
 
 # Color code for seqs
 seq_color = {'A': 'red',
@@ -16,21 +18,36 @@ seq_color = {'A': 'red',
              'G': 'blue',
              'C': 'black',
              'N': 'grey'}
+# Status of the rectangles plotted for each species
+# The first three are the result of compare_seqs
+# 'missing' are the 'M' empty blocks
+RECTANGLE_STATUS = ['identical', 'mismatch', 'gap', 'missing']
+# Gap in the sequences of the blocks
+GAP = ord('-')
+# Size of the chunks of the maf file indexed in parallel
+MAF_INDEX_CHUNK_SIZE = 64 * 1024 * 1024
+# Above this number of bp per pixel the summary is displayed
+# when display is auto
+MAF_SUMMARY_BP_PER_PIXEL = 10
+# Number of bins of the summary when the width of the plot is unknown
+DEFAULT_MAF_SUMMARY_BINS = 1000
 
 
 class MafTrack(GenomeTrack):
-    SUPPORTED_ENDINGS = ['maf']
+    SUPPORTED_ENDINGS = ['maf', 'maf.gz']
     TRACK_TYPE = 'maf'
     OPTIONS_TXT = GenomeTrack.OPTIONS_TXT + f"""
 # In addition to the maf file the reference genome is required:
 # For example
 #reference = mm10
+# The maf file can be compressed with bgzip
 # To speed the access to specific region
 # The maf file needs an index.
 # The default is the file
 # followed by '.index'. Alternatively another
 # file can be specified.
-# If it does not exists it will be created:
+# If it does not exists it will be created
+# (in the cache directory for the default):
 #file_index =
 # Set colors
 #color_identical = black
@@ -46,6 +63,16 @@ class MafTrack(GenomeTrack):
 #species_order_only = true
 # optional if you want to see the DNA sequence of the ref
 #display_ref_seq = true
+# When the region plotted is large, instead of plotting
+# each identical base, mismatch or gap, the summary
+# of each pixel is plotted (the color is the mix of
+# the colors weighted by their proportion in the pixel
+# and the 'C' and 'I' lines are not plotted).
+# By default (auto), the summary is used when there are
+# more than 10 bp per pixel. It can be forced with:
+#display = summary
+# or never used with:
+#display = detailed
 # optional: If not given is guessed from the file ending.
 file_type = {TRACK_TYPE}
     """
@@ -59,18 +86,19 @@ file_type = {TRACK_TYPE}
                            'species_order': None,
                            'species_labels': None,
                            'species_order_only': False,
-                           'display_ref_seq': False}
+                           'display_ref_seq': False,
+                           'display': 'auto'}
     NECESSARY_PROPERTIES = ['file', 'reference']
     SYNONYMOUS_PROPERTIES = {}
     POSSIBLE_PROPERTIES = {'orientation': [None, 'inverted'],
-                           }
+                           'display': ['auto', 'detailed', 'summary']}
     BOOLEAN_PROPERTIES = ['species_order_only', 'display_ref_seq']
     STRING_PROPERTIES = ['file', 'file_type',
                          'overlay_previous', 'orientation',
                          'title', 'file_index', 'color_identical',
                          'color_mismatch',
                          'color_gap', 'reference',
-                         'species_order', 'species_labels']
+                         'species_order', 'species_labels', 'display']
     FLOAT_PROPERTIES = {'line_width': [0, np.inf],
                         'height': [0, np.inf]}
     INTEGER_PROPERTIES = {}
@@ -82,29 +110,17 @@ file_type = {TRACK_TYPE}
         self.idx = None
         self.database = None
         self.chromosome = None
+        with open(self.properties['file'], 'rb') as f:
+            if f.read(2) == b'\x1f\x8b' and \
+               not is_bgzip(self.properties['file']):
+                # The blocks of the maf are read from their offset
+                raise InputError(f"The file {self.properties['file']} is"
+                                 " compressed with gzip. Only the maf"
+                                 " files compressed with bgzip are"
+                                 " supported, please compress it with"
+                                 " bgzip.")
         # Read or create the index
-        try:
-            self.idx = bx.align.maf.Indexed(self.properties['file'],
-                                            self.properties['file_index'],
-                                            keep_open=True,
-                                            parse_e_rows=True)
-        except FileNotFoundError:
-            self.idx = None
-            self.write_maf_index()
-        else:
-            if not self.maf_index_has_good_ref():
-                new_index = tempfile.NamedTemporaryFile(delete=False)
-                self.log.warning(f"The index {self.properties['file_index']}"
-                                 f" is not for {self.ref}."
-                                 f" Will generate a new one to {new_index.name}")
-                self.properties['file_index'] = new_index.name
-                self.idx = None
-                self.write_maf_index()
-        if self.idx is None:
-            self.idx = bx.align.maf.Indexed(self.properties['file'],
-                                            self.properties['file_index'],
-                                            keep_open=True,
-                                            parse_e_rows=True)
+        self.idx = self.open_maf_index()
         # Process the species_order and species_labels:
         self.species, self.labels = self.process_species_user()
         # Initialize current_labels:
@@ -127,7 +143,8 @@ file_type = {TRACK_TYPE}
         for p in ['color_identical', 'color_mismatch', 'color_gap']:
             self.process_color(p)
         # Process file_index
-        if self.properties['file_index'] is None:
+        self.default_file_index = self.properties['file_index'] is None
+        if self.default_file_index:
             self.properties['file_index'] = self.properties['file'] + '.index'
         # to set the distance between rows
         self.row_scale = 1.3
@@ -153,15 +170,14 @@ file_type = {TRACK_TYPE}
             my_labels = my_species
         return(my_species, my_labels)
 
-    def plot(self, ax, chrom_region, start_region, end_region):
+    def fetch(self, chrom_region, start_region, end_region):
         ref_in_index_array = self.ref_chrom_in_maf_index(chrom_region)
         if len(ref_in_index_array) == 0:
             self.log.warning("The plotting chromosome is not the reference."
                              " Nothing will be plotted.")
-            return
+            return TrackData(chrom_region, start_region, end_region,
+                             labels=None, max_y=None)
         ref_in_index = ref_in_index_array[0]
-        epsilon = 0.08
-        ymax = 0
         valid_blocks = 0
         # Initiate lists and dicts
         if self.species is not None:
@@ -169,14 +185,30 @@ file_type = {TRACK_TYPE}
         else:
             current_species = None
         if self.labels is not None:
-            self.current_labels = self.labels.copy()
+            current_labels = self.labels.copy()
         else:
-            self.current_labels = None
+            current_labels = None
         current_species_y = self.species_y.copy()
         current_max_y = self.max_y
 
+        # The rectangles to plot are stored with their status:
+        # one of RECTANGLE_STATUS
+        # (one array per block and species)
+        rect_starts = []
+        rect_ends = []
+        rect_y = []
+        rect_status = []
+        # The empty blocks which are plotted as lines are stored with
+        # their synteny_empty code ('C' or 'I')
+        line_starts = []
+        line_ends = []
+        line_y = []
+        line_code = []
         if self.properties['display_ref_seq']:
-            ref_seq_dic = {}
+            # '' means no sequence
+            ref_seq_array = np.full(end_region - start_region, '', dtype='U1')
+        else:
+            ref_seq_array = None
         for block in tqdm(self.idx.get_as_iterator(ref_in_index, start_region, end_region)):
             # I need to slice if needed:
             ref = block.get_component_by_src(ref_in_index)
@@ -192,23 +224,20 @@ file_type = {TRACK_TYPE}
             if ref.strand == "-":
                 sliced = sliced.reverse_complement()
                 ref = sliced.get_component_by_src(ref_in_index)
-            # Get the gap positions in the ref:
-            ref_seq = ref.text.upper()
-            gaps = [m.start() for m in re.finditer('(?=-)', ref_seq)]
-            ref_seq_no_gap = ''.join([l for i, l in enumerate(ref_seq)
-                                      if i not in gaps])
+            ref_start = ref.get_forward_strand_start()
+            # The sequences are compared as arrays of bytes
+            # Only the positions which are not gaps in the ref are kept:
+            ref_seq = self.seq_to_array(ref.text)
+            not_gap = ref_seq != GAP
+            ref_seq_no_gap = ref_seq[not_gap]
             # Store the sequence if required:
             if self.properties['display_ref_seq']:
-                # Check the orientation:
-                xleft, xright = ax.get_xlim()
-                if xleft > xright:
-                    # I need to complement (not reversed because I keep the coordinates)
-                    ref_seq_no_gap_correct = ref_seq_no_gap.translate(bx.seq.DNA_COMP)
-                else:
-                    ref_seq_no_gap_correct = ref_seq_no_gap
-                for i, lr in enumerate(ref_seq_no_gap_correct,
-                                       start=ref.get_forward_strand_start()):
-                    ref_seq_dic[i] = lr
+                first = max(0, start_region - ref_start)
+                last = min(len(ref_seq_no_gap), end_region - ref_start)
+                if first < last:
+                    ref_seq_array[ref_start + first - start_region:
+                                  ref_start + last - start_region] = \
+                        ref_seq_no_gap[first:last].view('S1').astype('U1')
             for c in sliced.components:
                 # We only plot the non-ref:
                 if c.src != ref_in_index:
@@ -216,14 +245,14 @@ file_type = {TRACK_TYPE}
                     # Check if we plot this assembly:
                     if self.properties["species_order_only"] and assembly not in self.species:
                         continue
-                    # Initiate self.current_species if needed:
+                    # Initiate current_species if needed:
                     if current_species is None:
                         current_species = []
-                        self.current_labels = []
+                        current_labels = []
                     # Add this assembly if needed:
                     if assembly not in current_species:
                         current_species.append(assembly)
-                        self.current_labels.append(assembly)
+                        current_labels.append(assembly)
                         current_species_y[assembly] = current_max_y
                         current_max_y += 1
                         # self.log.debug(f"self.max_y {self.max_y}")
@@ -231,57 +260,41 @@ file_type = {TRACK_TYPE}
                     ypos = current_species_y[assembly] * self.row_scale
                     if not c.empty:
                         # Get the sequence to compare with ref:
-                        c_seq = c.text.upper()
-                        c_seq_no_gap = ''.join([l for i, l in enumerate(c_seq)
-                                                if i not in gaps])
-                        last_status = None
-                        last_end = None
-                        # This might need some improvement
-                        for i, (lr, la) in enumerate(zip(ref_seq_no_gap, c_seq_no_gap),
-                                                     start=ref.get_forward_strand_start()):
-                            cur_status = self.compare_letters(lr, la)
-                            if cur_status != last_status:
-                                if last_status is not None:
-                                    # I plot it:
-                                    ax.add_patch(Rectangle((last_end, ypos),
-                                                           i - last_end, 1,
-                                                           edgecolor="none",
-                                                           facecolor=self.properties[f'color_{last_status}']))
-                                    valid_blocks += 1
-                                last_end = i
-                                last_status = cur_status
-                        if last_status is not None:
-                            # I plot it:
-                            ax.add_patch(Rectangle((last_end, ypos),
-                                                   ref.get_forward_strand_end() - last_end, 1,
-                                                   edgecolor="none",
-                                                   facecolor=self.properties[f'color_{last_status}']))
-                            valid_blocks += 1
+                        c_seq_no_gap = self.seq_to_array(c.text)[not_gap]
+                        if len(c_seq_no_gap) == 0:
+                            continue
+                        starts, ends, status = \
+                            self.compare_seqs(ref_seq_no_gap, c_seq_no_gap)
+                        rect_starts.append(starts + ref_start)
+                        # The last one ends at the end of the ref
+                        ends += ref_start
+                        ends[-1] = ref.get_forward_strand_end()
+                        rect_ends.append(ends)
+                        rect_y.append(np.full(len(starts), ypos))
+                        rect_status.append(status)
+                        valid_blocks += len(starts)
                     else:
-                        if c.synteny_empty == "C":
-                            # the sequence before and after is contiguous
+                        if c.synteny_empty in ["C", "I"]:
+                            # C: the sequence before and after is contiguous
                             # implying that this region was either deleted
                             # in the source or inserted in the reference sequence.
                             # The browser draws a single line or a "-" in base mode in these blocks.
-                            ax.plot([ref.get_forward_strand_start(), ref.get_forward_strand_end()],
-                                    [ypos + 0.5, ypos + 0.5], color="black", linewidth=self.properties['line_width'])
-                        elif c.synteny_empty == "I":
-                            # there are non-aligning bases in the source species
+                            # I: there are non-aligning bases in the source species
                             # between chained alignment blocks before and
                             # after this block.
                             # The browser shows a double line or "=" in base mode.
-                            ax.plot([ref.get_forward_strand_start(), ref.get_forward_strand_end()],
-                                    [ypos + 0.3, ypos + 0.3], color="black", linewidth=self.properties['line_width'])
-                            ax.plot([ref.get_forward_strand_start(), ref.get_forward_strand_end()],
-                                    [ypos + 0.7, ypos + 0.7], color="black", linewidth=self.properties['line_width'])
+                            line_starts.append(ref_start)
+                            line_ends.append(ref.get_forward_strand_end())
+                            line_y.append(ypos)
+                            line_code.append(c.synteny_empty)
                         elif c.synteny_empty == "M":
                             # there are non-aligning bases in the source and
                             # more than 90% of them are Ns in the source.
                             # The browser shows a pale yellow bar.
-                            ax.add_patch(Rectangle((ref.get_forward_strand_start(), ypos),
-                                                   ref.size, 1,
-                                                   edgecolor="none",
-                                                   facecolor="lightyellow"))
+                            rect_starts.append(np.array([ref_start]))
+                            rect_ends.append(np.array([ref_start + ref.size]))
+                            rect_y.append(np.array([ypos]))
+                            rect_status.append(np.array([RECTANGLE_STATUS.index('missing')]))
                         elif c.synteny_empty == "n":
                             # there are non-aligning bases in the source
                             # and the next aligning block starts
@@ -300,10 +313,52 @@ file_type = {TRACK_TYPE}
             self.log.warning("No valid blocks were found in file "
                              f"{self.properties['file']} for region"
                              f"{chrom_region}:{start_region}-{end_region}.\n")
+        rect_starts = np.concatenate([[]] + rect_starts).astype(int)
+        rect_ends = np.concatenate([[]] + rect_ends).astype(int)
+        rect_y = np.concatenate([[]] + rect_y).astype(float)
+        rect_status = np.concatenate([[]] + rect_status).astype(int)
+        if self.use_summary(start_region, end_region):
+            if self.plot_width_px is None:
+                n_bins = DEFAULT_MAF_SUMMARY_BINS
+            else:
+                n_bins = max(1, int(self.plot_width_px))
+            summary = self.get_summary(rect_starts, rect_ends, rect_y,
+                                       rect_status, current_max_y,
+                                       start_region, end_region, n_bins)
+            # The sequence would not be readable
+            return TrackData(chrom_region, start_region, end_region,
+                             labels=current_labels, max_y=current_max_y,
+                             summary=summary, ref_seq=None)
+        return TrackData(chrom_region, start_region, end_region,
+                         labels=current_labels, max_y=current_max_y,
+                         summary=None,
+                         rect_starts=rect_starts,
+                         rect_ends=rect_ends,
+                         rect_y=rect_y,
+                         rect_status=rect_status,
+                         line_starts=np.array(line_starts, dtype=int),
+                         line_ends=np.array(line_ends, dtype=int),
+                         line_y=np.array(line_y, dtype=float),
+                         line_code=np.array(line_code, dtype='U1'),
+                         ref_seq=ref_seq_array)
+
+    def draw(self, ax, data):
+        # The labels are used by plot_y_axis
+        self.current_labels = data.labels
+        if data.max_y is None:
+            return
+        start_region = data.start_region
+        end_region = data.end_region
+        if data.summary is not None:
+            self.draw_summary(ax, data)
+        else:
+            self.draw_detailed(ax, data)
+        epsilon = 0.08
+        ymax = 0
         ymax -= epsilon
-        ymin = self.row_scale * current_max_y + epsilon
+        ymin = self.row_scale * data.max_y + epsilon
         # I need to know how many species are plotted before plotting the sequence:
-        if self.properties['display_ref_seq']:
+        if self.properties['display_ref_seq'] and data.ref_seq is not None:
             plotting_figure_width = ax.get_window_extent().transformed(ax.get_figure().dpi_scale_trans.inverted()).width
 
             # The first constrain on the fontsize is the width
@@ -312,7 +367,7 @@ file_type = {TRACK_TYPE}
             # The other constraint is the height
             real_height_in = ax.get_window_extent().transformed(ax.get_figure().dpi_scale_trans.inverted()).height
             # We cannot have the sequence that take more than the height of an alignment:
-            max_height_in = real_height_in / (current_max_y + 1)
+            max_height_in = real_height_in / (data.max_y + 1)
 
             # 1 point = 1/72 inch = height of character
             max_fontsize = max_height_in * 72
@@ -326,16 +381,126 @@ file_type = {TRACK_TYPE}
 
             height_seq = (ymin - ymax) / (1 / relative_height_letters - 1)
             ymax -= height_seq
-            for i in range(start_region, end_region):
-                if i in ref_seq_dic:
-                    ax.text(i + 0.5, - height_seq / 2, ref_seq_dic[i],
-                            color=seq_color[ref_seq_dic[i]], verticalalignment='center',
+            # Check the orientation:
+            xleft, xright = ax.get_xlim()
+            for i, letter in enumerate(data.ref_seq, start=start_region):
+                if letter != '':
+                    if xleft > xright:
+                        # I need to complement (not reversed because I keep the coordinates)
+                        letter = letter.translate(bx.seq.DNA_COMP)
+                    ax.text(i + 0.5, - height_seq / 2, letter,
+                            color=seq_color[letter], verticalalignment='center',
                             horizontalalignment='center', fontsize=fontsize)
 
         self.log.debug(f"ylim {ymin},{ymax}")
         # the axis is inverted (thus, ymax < ymin)
         ax.set_ylim(ymin, ymax)
 
+    def draw_detailed(self, ax, data):
+        # One collection per status:
+        for status, status_name in enumerate(RECTANGLE_STATUS):
+            is_status = data.rect_status == status
+            if not np.any(is_status):
+                continue
+            starts = data.rect_starts[is_status]
+            ends = data.rect_ends[is_status]
+            ypos = data.rect_y[is_status]
+            verts = np.stack([np.column_stack([starts, ypos]),
+                              np.column_stack([starts, ypos + 1]),
+                              np.column_stack([ends, ypos + 1]),
+                              np.column_stack([ends, ypos])], axis=1)
+            ax.add_collection(PolyCollection(verts, edgecolor="none",
+                                             facecolor=self.get_status_color(status_name)))
+        # The 'C' are plotted as a single line
+        # The 'I' are plotted as a double line
+        segments = []
+        for code, y_shifts in [("C", [0.5]), ("I", [0.3, 0.7])]:
+            is_code = data.line_code == code
+            for y_shift in y_shifts:
+                ypos = data.line_y[is_code] + y_shift
+                segments += [np.stack([np.column_stack([data.line_starts[is_code], ypos]),
+                                       np.column_stack([data.line_ends[is_code], ypos])],
+                                      axis=1)]
+        segments = np.concatenate(segments)
+        if len(segments) > 0:
+            ax.add_collection(LineCollection(segments, colors="black",
+                                             linewidths=self.properties['line_width'],
+                                             capstyle='projecting',
+                                             zorder=2))
+
+    def draw_summary(self, ax, data):
+        # The color of each bin is the mean of the colors
+        # of the status weighted by their fraction
+        # and the transparency is the fraction covered
+        status_colors = np.array([mpl.colors.to_rgb(self.get_status_color(status_name))
+                                  for status_name in RECTANGLE_STATUS])
+        covered = data.summary.sum(axis=2)
+        rgba = np.zeros(data.summary.shape[:2] + (4, ))
+        rgba[:, :, :3] = data.summary @ status_colors / \
+            np.maximum(covered, 1e-9)[:, :, np.newaxis]
+        rgba[:, :, 3] = np.minimum(covered, 1)
+        # One image row per species:
+        for row in range(data.max_y):
+            if not np.any(covered[row] > 0):
+                continue
+            ypos = row * self.row_scale
+            ax.imshow(rgba[row:row + 1], aspect='auto',
+                      interpolation='nearest',
+                      extent=(data.start_region, data.end_region,
+                              ypos + 1, ypos))
+
+    def get_status_color(self, status_name):
+        if status_name == 'missing':
+            return "lightyellow"
+        return self.properties[f'color_{status_name}']
+
+    def use_summary(self, start_region, end_region):
+        if self.properties['display'] == 'auto':
+            return self.plot_width_px is not None and \
+                (end_region - start_region) / self.plot_width_px > MAF_SUMMARY_BP_PER_PIXEL
+        return self.properties['display'] == 'summary'
+
+    def get_summary(self, rect_starts, rect_ends, rect_y, rect_status,
+                    max_y, start_region, end_region, n_bins):
+        """
+        Returns the fraction of each bin covered by each status
+        (the index in RECTANGLE_STATUS) for each row,
+        as an array of shape (max_y, n_bins, len(RECTANGLE_STATUS)).
+        """
+        bin_edges = np.linspace(start_region, end_region, n_bins + 1)
+        rows = np.rint(rect_y / self.row_scale).astype(int)
+        summary = np.zeros((max_y, n_bins, len(RECTANGLE_STATUS)))
+        for row in np.unique(rows):
+            in_row = rows == row
+            for status in np.unique(rect_status[in_row]):
+                selected = in_row & (rect_status == status)
+                summary[row, :, status] = \
+                    np.diff(self.covered_length(rect_starts[selected],
+                                                rect_ends[selected],
+                                                bin_edges))
+        return summary / np.diff(bin_edges)[np.newaxis, :, np.newaxis]
+
+    @staticmethod
+    def covered_length(starts, ends, positions):
+        """
+        Returns for each position the total length of
+        the intervals (starts, ends) before this position.
+
+        >>> MafTrack.covered_length(np.array([0, 10]), np.array([5, 20]),
+        ...                         np.array([0, 3, 8, 15, 30])).tolist()
+        [0, 3, 5, 10, 15]
+        """
+        # The length before x of an interval is
+        # (x - start) if start < x minus (x - end) if end < x
+        starts = np.sort(starts)
+        ends = np.sort(ends)
+        cum_starts = np.concatenate([[0], np.cumsum(starts)])
+        cum_ends = np.concatenate([[0], np.cumsum(ends)])
+        n_starts = np.searchsorted(starts, positions)
+        n_ends = np.searchsorted(ends, positions)
+        return (n_starts * positions - cum_starts[n_starts]) - \
+            (n_ends * positions - cum_ends[n_ends])
+
     def plot_y_axis(self, ax, plot_axis):
         if self.current_labels is not None:
             if int(mpl.__version__.split(".")[1]) < 3:
@@ -349,80 +514,227 @@ file_type = {TRACK_TYPE}
             ax.set_ylim(*plot_axis.get_ylim())
 
     @staticmethod
-    def compare_letters(lr, la):
+    def seq_to_array(seq):
         """
-            Compare a reference letter lr with another letter lr
-            We assume lr cannot be '-' while la can.
+        Convert a sequence to an upper case array of bytes
         """
-        if lr == la:
-            return("identical")
-        if la == '-':
-            return("gap")
-        return("mismatch")
-
-    # This is inspired from galaxy tools util maf_utilities
-    # Except that parse_e_rows=True
-    def build_maf_index_species_chromosomes(self, filename, index_species=None):
-        species = []
-        species_chromosomes = {}
-        indexes = bx.interval_index_file.Indexes()
-        blocks = 0
+        return np.frombuffer(seq.upper().encode('ascii'), dtype=np.uint8)
+
+    @staticmethod
+    def compare_seqs(ref_seq, other_seq):
+        """
+        Compare a reference sequence with another sequence
+        (both as arrays of bytes of the same length).
+        We assume ref_seq does not contain gaps while other_seq can.
+        Returns the starts, ends and status of the runs
+        of identical status (the index in RECTANGLE_STATUS)
+        relative to the start of the sequences.
+
+        >>> starts, ends, status = MafTrack.compare_seqs(
+        ...     MafTrack.seq_to_array('ACGTAA'),
+        ...     MafTrack.seq_to_array('acC--A'))
+        >>> starts.tolist(), ends.tolist()
+        ([0, 2, 3, 5], [2, 3, 5, 6])
+        >>> [RECTANGLE_STATUS[s] for s in status]
+        ['identical', 'mismatch', 'gap', 'identical']
+        """
+        status = np.full(len(ref_seq), RECTANGLE_STATUS.index('mismatch'))
+        status[ref_seq == other_seq] = RECTANGLE_STATUS.index('identical')
+        status[other_seq == GAP] = RECTANGLE_STATUS.index('gap')
+        # Run length encoding
+        changes = np.flatnonzero(status[1:] != status[:-1]) + 1
+        starts = np.concatenate([[0], changes])
+        ends = np.concatenate([changes, [len(status)]])
+        return starts, ends, status[starts]
+
+    def open_maf_index(self):
+        """
+        Opens the index of the maf file.
+        If it does not exist or is not for the reference
+        it is created (the default index is created in the cache
+        directory and reused in the next runs).
+        """
+        index_file = self.properties['file_index']
+        if os.path.exists(index_file):
+            idx = self.read_maf_index(index_file)
+            if self.maf_index_has_good_ref(idx):
+                return idx
+            idx.close()
+            index_file = self.get_cached_index_name()
+            self.log.warning(f"The index {self.properties['file_index']}"
+                             f" is not for {self.ref}."
+                             f" Will use the index {index_file}")
+        elif self.default_file_index:
+            index_file = self.get_cached_index_name()
+        if not os.path.exists(index_file):
+            self.write_maf_index(index_file)
+        self.properties['file_index'] = index_file
+        return self.read_maf_index(index_file)
+
+    def read_maf_index(self, index_file):
+        if is_bgzip(self.properties['file']):
+            indexed_class = BgzipMafIndexed
+        else:
+            indexed_class = bx.align.maf.Indexed
+        return indexed_class(self.properties['file'], index_file,
+                             keep_open=True, parse_e_rows=True)
+
+    def get_cached_index_name(self):
+        """
+        The name of the index in the cache directory
+        depends on the path of the maf file, its modification time
+        and the reference.
+        """
+        return get_cache_file_name(self.properties['file'],
+                                   f"{self.ref}.index")
+
+    def build_maf_index(self, file_name, index_species):
+        """
+        Returns the index of the blocks for the index_species.
+        The plain maf files are splitted in chunks which are
+        indexed in parallel.
+        """
+        bgzip = is_bgzip(file_name)
+        if bgzip:
+            # The blocks of a bgzip file cannot be splitted
+            chunk_starts = [0]
+        else:
+            chunk_starts = list(range(0, max(1, os.path.getsize(file_name)),
+                                      MAF_INDEX_CHUNK_SIZE))
+        chunk_ends = chunk_starts[1:] + [None]
+        n_chunks = len(chunk_starts)
         try:
-            maf_reader = bx.align.maf.Reader(open(filename), parse_e_rows=True)
-            while True:
-                pos = maf_reader.file.tell()
-                block = next(maf_reader)
-                if block is None:
-                    break
-                blocks += 1
-                for c in block.components:
-                    spec = c.src
-                    chrom = None
-                    if "." in spec:
-                        spec, chrom = spec.split(".", 1)
-                    if spec not in species:
-                        species.append(spec)
-                        species_chromosomes[spec] = []
-                    if chrom and chrom not in species_chromosomes[spec]:
-                        species_chromosomes[spec].append(chrom)
-                    if (index_species is None or spec in index_species) and \
-                       c.size > 0 and not c.empty:
-                        # We only index species if the size is positive
-                        # And if the it is not a e line because multiple
-                        # blocks may correspond to the same region in the src
-                        forward_strand_start = c.forward_strand_start
-                        forward_strand_end = c.forward_strand_end
-                        try:
-                            forward_strand_start = int(forward_strand_start)
-                            forward_strand_end = int(forward_strand_end)
-                        except ValueError:
-                            continue
-                            # I am not sure this can happen
-                            # Original comment from @blankenberg:
-                            # start and end are not integers, can't add component to index, goto next component
-                            # this likely only occurs when parse_e_rows is True?
-                            # could a species exist as only e rows? should the
-                        indexes.add(c.src, forward_strand_start, forward_strand_end, pos, max=c.src_size)
+            if n_chunks == 1:
+                all_entries = [index_maf_chunk(file_name, index_species,
+                                               bgzip=bgzip)]
+            else:
+                with ProcessPoolExecutor(max_workers=min(n_chunks,
+                                                         os.cpu_count() or 1)) as executor:
+                    all_entries = list(executor.map(index_maf_chunk,
+                                                    [file_name] * n_chunks,
+                                                    [index_species] * n_chunks,
+                                                    chunk_starts, chunk_ends))
         except Exception as e:
             # most likely a bad MAF
-            self.log.warning(f'Building MAF index on {filename} failed: {e}')
-            return (None, [], {}, 0)
-        return (indexes, species, species_chromosomes, blocks)
+            self.log.warning(f'Building MAF index on {file_name} failed: {e}')
+            return None
+        indexes = bx.interval_index_file.Indexes()
+        for entries in all_entries:
+            for src, start, end, offset, src_size in entries:
+                indexes.add(src, start, end, offset, max=src_size)
+        return indexes
 
-    def write_maf_index(self):
-        indexes, *_ = self.build_maf_index_species_chromosomes(self.properties['file'],
-                                                               self.ref)
+    def write_maf_index(self, index_file):
+        indexes = self.build_maf_index(self.properties['file'], self.ref)
         if indexes is not None:
-            with open(self.properties['file_index'], 'wb') as index:
+            # The index is written to a temporary file
+            # which is renamed at the end
+            # to never use a partial index
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(index_file)),
+                                             delete=False) as index:
                 indexes.write(index)
+            os.replace(index.name, index_file)
         else:
             raise InputError("Unable to generate index for " + self.properties['file'])
 
-    def maf_index_has_good_ref(self):
-        ref_species = [ref.split(".")[0] for ref in self.idx.indexes.indexes.keys()]
+    def maf_index_has_good_ref(self, idx):
+        ref_species = [ref.split(".")[0] for ref in idx.indexes.indexes.keys()]
         return(self.ref in ref_species)
 
     def ref_chrom_in_maf_index(self, chrom_name):
         compatible_ref = [ref for ref in self.idx.indexes.indexes.keys()
                           if ref in [f"{self.ref}.{chrom_name}", f"{self.ref}.{change_chrom_names(chrom_name)}"]]
         return(compatible_ref)
+
+
+class BgzipFile(object):
+    """
+    A maf file compressed with bgzip opened for reading lines
+    (as bytes or as str if text is True).
+    seek and tell use virtual offsets.
+    """
+    def __init__(self, file_name, text=False):
+        self.bgzf = pysam.libcbgzf.BGZFile(file_name, 'rb')
+        self.text = text
+
+    def readline(self):
+        # The readline of BGZFile removes the new line
+        # and returns an empty line at the end of the file
+        offset = self.bgzf.tell()
+        line = self.bgzf.readline()
+        if self.bgzf.tell() == offset:
+            line = b''
+        else:
+            line += b'\n'
+        if self.text:
+            return line.decode('ascii')
+        return line
+
+    def seek(self, offset):
+        self.bgzf.seek(offset)
+
+    def tell(self):
+        return self.bgzf.tell()
+
+    def close(self):
+        self.bgzf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class BgzipMafIndexed(bx.align.maf.Indexed):
+    """
+    Indexed access to a maf file compressed with bgzip
+    (the offsets in the index are virtual offsets).
+    """
+    def open_data(self):
+        return BgzipFile(self.data_filename, text=True)
+
+
+def index_maf_chunk(file_name, index_species, chunk_start=0, chunk_end=None,
+                    bgzip=False):
+    """
+    Returns the entries of the index for the blocks of the maf file
+    which begins between chunk_start and chunk_end.
+    Only the 's' lines with a positive size of the index_species are used.
+    Each entry is (src, start, end, offset of the block, src_size).
+    This is inspired from galaxy tools util maf_utilities.
+    """
+    entries = []
+    if bgzip:
+        f = BgzipFile(file_name)
+    else:
+        f = open(file_name, 'rb')
+    with f:
+        if chunk_start > 0:
+            # Go to the beginning of the first line in the chunk
+            f.seek(chunk_start - 1)
+            f.readline()
+        offset = f.tell()
+        block_offset = None
+        for line in iter(f.readline, b''):
+            if line.startswith(b'a'):
+                if chunk_end is not None and offset >= chunk_end:
+                    break
+                block_offset = offset
+            elif line.startswith(b's') and block_offset is not None:
+                fields = line.split(maxsplit=6)
+                src = fields[1].decode()
+                if src.split(".")[0] == index_species:
+                    start = int(fields[2])
+                    size = int(fields[3])
+                    src_size = int(fields[5])
+                    if size > 0:
+                        if fields[4] == b'-':
+                            start = src_size - start - size
+                        entries.append((src, start, start + size,
+                                        block_offset, src_size))
+            if bgzip:
+                offset = f.tell()
+            else:
+                offset += len(line)
+    return entries
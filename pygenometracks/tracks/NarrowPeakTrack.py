@@ -1,24 +1,30 @@
 # -*- coding: utf-8 -*-
 
-from . GenomeTrack import GenomeTrack
+from . GenomeTrack import GenomeTrack, TrackData
 from . BedGraphTrack import BedGraphTrack
+from .. utilities import change_chrom_names, is_bigbed, InputError
 
-from matplotlib.patches import Rectangle
-from matplotlib.collections import PatchCollection
+from matplotlib.collections import PathCollection, PolyCollection
 from matplotlib.path import Path
-import matplotlib.patches as patches
 import numpy as np
+import pyBigWig
 
 DEFAULT_NARROWPEAK_COLOR = '#FF000080'  # red, alpha=0.55
+# The labels are only plotted for the peaks wider than:
+NARROWPEAK_LABEL_MIN_WIDTH_PX = 5
+# The codes of the bezier curves of a peak
+PEAK_CODES = [Path.MOVETO] + [Path.CURVE4] * 6
 
 
 class NarrowPeakTrack(BedGraphTrack):
-    SUPPORTED_ENDINGS = ['.narrowPeak']
+    SUPPORTED_ENDINGS = ['.narrowPeak', '.narrowPeak.gz',
+                         '.narrowPeak.bb', '.narrowPeak.bigbed']
     TRACK_TYPE = 'narrow_peak'
     OPTIONS_TXT = GenomeTrack.OPTIONS_TXT + f"""
 color = #FF000080
 #max_value = 0.70
 show_data_range = true
+# The labels are only shown for peaks wider than 5 pixels
 show_labels = true
 # the narrowPeak format provides the information of the
 # peak summit. By default this information is used
@@ -69,84 +75,177 @@ file_type = {TRACK_TYPE}
         GenomeTrack.set_properties_defaults(self)
         self.process_color('color')
 
-    def peak_plot(self, start, end, height, center=None, width_adjust=1.5):
-        # uses bezier curves to plot a shape that
-        # looks like a peak
-        peak_width = float(end - start)
-        if center is None:
-            center = peak_width / 2 + start
-        if width_adjust != 1:
-            start -= width_adjust * peak_width / 2
-            end += width_adjust * peak_width / 2
-            peak_width *= width_adjust
-
-        path_data = [
-            (Path.MOVETO, (start, 0)),
-            (Path.CURVE4, (start + peak_width / 2, 0)),
-            (Path.CURVE4, (start + peak_width * 0.4, height)),
-            (Path.CURVE4, (center, height)),
-            (Path.CURVE4, (end - peak_width * 0.4, height)),
-            (Path.CURVE4, (end - peak_width / 2, 0)),
-            (Path.CURVE4, (end, 0))]
-
-        codes, verts = zip(*path_data)
-        path = Path(verts, codes)
-        return patches.PathPatch(path)
-
-    def plot(self, ax, chrom_region, start_region, end_region):
+    def load_file(self):
+        self.bb = None
+        if is_bigbed(self.properties['file']):
+            # Only the peaks of the plotted regions are read
+            # from the bigBed index.
+            file_name = self.properties['file']
+            self.bb = self.acquire_data_source('bigbed', file_name,
+                                               lambda: pyBigWig.open(file_name),
+                                               close=lambda bb: bb.close())
+            self.tbx = None
+            self.num_fields = None
+        else:
+            super(NarrowPeakTrack, self).load_file()
+
+    @staticmethod
+    def get_peaks_vertices(starts, ends, heights, centers, width_adjust=1.5):
         """
+        Returns the vertices of the bezier curves
+        of shapes that look like peaks (one per row).
+        centers can be nan to use the middle of the peak.
+        """
+        peak_widths = (ends - starts).astype(float)
+        centers = np.where(np.isnan(centers), peak_widths / 2 + starts, centers)
+        if width_adjust != 1:
+            starts = starts - width_adjust * peak_widths / 2
+            ends = ends + width_adjust * peak_widths / 2
+            peak_widths = peak_widths * width_adjust
+        zeros = np.zeros(len(starts))
+        return np.stack([np.column_stack([starts, zeros]),
+                         np.column_stack([starts + peak_widths / 2, zeros]),
+                         np.column_stack([starts + peak_widths * 0.4, heights]),
+                         np.column_stack([centers, heights]),
+                         np.column_stack([ends - peak_widths * 0.4, heights]),
+                         np.column_stack([ends - peak_widths / 2, zeros]),
+                         np.column_stack([ends, zeros])], axis=1)
 
-        Args:
-            chrom_region:
-            start_region:
-            end_region:
+    @staticmethod
+    def get_visible_peaks(starts, ends, heights, scale):
+        """
+        Returns a boolean array with the peaks to plot:
+        among the peaks which are smaller than a pixel
+        (scale is in pixels per bp), only the highest
+        of each pixel is kept.
 
-        Returns:
+        >>> NarrowPeakTrack.get_visible_peaks(np.array([0, 1, 2, 10, 20]),
+        ...                                   np.array([30, 2, 3, 11, 21]),
+        ...                                   np.array([1, 5, 3, 2, 2]), 0.1)
+        array([ True,  True, False,  True,  True])
+        """
+        to_keep = (ends - starts) * scale >= 1
+        small = np.flatnonzero(~to_keep)
+        if len(small) > 0:
+            pixels = np.floor((starts[small] + ends[small]) / 2 * scale)
+            # sorted by pixel and decreasing height
+            order = np.lexsort((-heights[small], pixels))
+            __, first = np.unique(pixels[order], return_index=True)
+            to_keep[small[order[first]]] = True
+        return to_keep
 
+    def get_peaks(self, chrom_region, start_region, end_region):
         """
+        Returns the columns (start, end, name, score, strand,
+        signal_value, p_value, q_value, summit) of the peaks
+        in the region or None if there is no peak.
+        The rows of a tabix or bigBed file are all split at once.
+        """
+        if self.bb is not None:
+            if chrom_region not in self.bb.chroms():
+                chrom_region = change_chrom_names(chrom_region)
+            if chrom_region not in self.bb.chroms():
+                return None
+            start = max(0, start_region)
+            end = min(end_region, self.bb.chroms(chrom_region))
+            entries = self.bb.entries(chrom_region, start, end) if start < end else None
+            if entries is None or len(entries) == 0:
+                return None
+            starts, ends, rests = zip(*entries)
+            fields = '\t'.join(rests).split('\t')
+            if len(fields) != 7 * len(entries):
+                raise InputError(f"The bigBed file {self.properties['file']}"
+                                 " does not have the 10 fields of a"
+                                 " narrowPeak file.")
+            return [starts, ends] + [fields[column::7] for column in range(7)]
+        if self.tbx is not None:
+            if chrom_region not in self.tbx.contigs:
+                chrom_region = change_chrom_names(chrom_region)
+            if chrom_region in self.tbx.contigs:
+                rows = list(self.tbx.fetch(chrom_region, start_region, end_region))
+                fields = '\t'.join(rows).split('\t')
+                # Only possible if all rows have the 10 fields
+                if len(rows) > 0 and len(fields) == 10 * len(rows):
+                    return [fields[column::10] for column in range(1, 10)]
         score_list, pos_list = self.get_scores(chrom_region, start_region, end_region, return_nans=False)
         if pos_list == []:
+            return None
+        return list(zip(*pos_list)) + list(zip(*score_list))
+
+    def fetch(self, chrom_region, start_region, end_region):
+        columns = self.get_peaks(chrom_region, start_region, end_region)
+        if columns is None:
+            return TrackData(chrom_region, start_region, end_region,
+                             starts=None)
+        starts, ends, names, __, __, signal_values, p_values, q_values, summits = columns
+        starts = np.array(starts, dtype=int)
+        summits = np.array(summits, dtype=int)
+        # nan means that there is no summit
+        summits = np.where((summits > 0) & self.properties['use_summit'],
+                           starts + summits, np.nan)
+        return TrackData(chrom_region, start_region, end_region,
+                         starts=starts,
+                         ends=np.array(ends, dtype=int),
+                         names=np.array(names, dtype=str),
+                         signal_values=np.array(signal_values, dtype=float),
+                         p_values=np.array(p_values, dtype=float),
+                         q_values=np.array(q_values, dtype=float),
+                         summits=summits)
+
+    def draw(self, ax, data):
+        if data.starts is None:
             return
-        self.patches = []
-
-        max_signal = -1
-        for idx, peak in enumerate(score_list):
-            name, score, strand, signal_value, p_value, q_value, summit = peak
-            signal_value = float(signal_value)
-            p_value = float(p_value)
-            q_value = float(q_value)
-            summit = int(summit)
-            start, end = pos_list[idx]
-            if summit > 0 and self.properties['use_summit']:
-                summit = start + summit
-            else:
-                summit = None
-            if self.properties['type'] == 'box':
-                self.patches.append(Rectangle((start, 20), end - start, 60,
-                                              edgecolor='black',
-                                              linewidth=self.properties['line_width']))
-                if summit is not None:
-                    self.patches.append(Rectangle((summit, 0), 1, 100,
-                                                  edgecolor='black',
-                                                  linewidth=self.properties['line_width']))
-                max_signal = 110
-            else:
-                if signal_value > max_signal:
-                    max_signal = signal_value
-                p = self.peak_plot(start, end, signal_value, center=summit,
-                                   width_adjust=self.properties['width_adjust'])
-                p.set_edgecolor(self.properties['color'])
-                p.set_linewidth(self.properties['line_width'])
-                self.patches.append(p)
-
-            x_pos = start + float(end - start) / 2
-            y_pos = 0 - max_signal * 0.05
-            if self.properties['show_labels']:
-                ax.text(x_pos, y_pos, f"{name}\np-val:{p_value:.1f}\nq-val:{q_value:.1f}",
-                        horizontalalignment='center', size='smaller', verticalalignment='top')
 
-        collection = PatchCollection(self.patches, facecolor=self.properties['color'], match_original=True)
-        ax.add_collection(collection)
+        if self.plot_width_px is not None:
+            width_px = self.plot_width_px
+        else:
+            width_px = ax.get_window_extent().width
+        scale = width_px / (data.end_region - data.start_region)
+
+        if self.properties['type'] == 'box':
+            heights = np.full(len(data.starts), 110.)
+            # The label of a peak is below all peaks before
+            label_heights = heights
+            has_summit = ~np.isnan(data.summits)
+            starts = np.concatenate([data.starts, data.summits[has_summit]])
+            ends = np.concatenate([data.ends, data.summits[has_summit] + 1])
+            bottoms = np.concatenate([np.full(len(data.starts), 20.),
+                                      np.zeros(has_summit.sum())])
+            tops = bottoms + np.concatenate([np.full(len(data.starts), 60.),
+                                             np.full(has_summit.sum(), 100.)])
+            to_keep = self.get_visible_peaks(starts, ends, tops, scale)
+            starts, ends, bottoms, tops = starts[to_keep], ends[to_keep], bottoms[to_keep], tops[to_keep]
+            vertices = np.stack([np.column_stack([starts, bottoms]),
+                                 np.column_stack([starts, tops]),
+                                 np.column_stack([ends, tops]),
+                                 np.column_stack([ends, bottoms])], axis=1)
+            ax.add_collection(PolyCollection(vertices,
+                                             facecolors=self.properties['color'],
+                                             edgecolors='black',
+                                             linewidths=self.properties['line_width']))
+            max_signal = 110
+        else:
+            heights = data.signal_values
+            # The label of a peak is below all peaks before
+            label_heights = np.maximum.accumulate(np.maximum(heights, -1))
+            to_keep = self.get_visible_peaks(data.starts, data.ends, heights, scale)
+            vertices = self.get_peaks_vertices(data.starts[to_keep], data.ends[to_keep],
+                                               heights[to_keep], data.summits[to_keep],
+                                               width_adjust=self.properties['width_adjust'])
+            ax.add_collection(PathCollection([Path(peak_vertices, PEAK_CODES)
+                                              for peak_vertices in vertices],
+                                             facecolors=self.properties['color'],
+                                             edgecolors=self.properties['color'],
+                                             linewidths=self.properties['line_width']))
+            max_signal = max(-1, heights.max())
+
+        if self.properties['show_labels']:
+            x_pos = data.starts + (data.ends - data.starts) / 2
+            y_pos = 0 - label_heights * 0.05
+            for idx in np.flatnonzero((data.ends - data.starts) * scale >= NARROWPEAK_LABEL_MIN_WIDTH_PX):
+                ax.text(x_pos[idx], y_pos[idx],
+                        f"{data.names[idx]}\np-val:{data.p_values[idx]:.1f}\nq-val:{data.q_values[idx]:.1f}",
+                        horizontalalignment='center', size='smaller', verticalalignment='top')
 
         if self.properties['max_value'] is None:
             self.properties['max_value'] = max_signal
@@ -4,15 +4,19 @@ import logging
 import os
 from configparser import ConfigParser
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.textpath
+import matplotlib.transforms
 import matplotlib.colors
 import matplotlib.gridspec
 import matplotlib.cm
 import mpl_toolkits.axisartist as axisartist
-from . utilities import file_to_intervaltree, change_chrom_names, MyBasePairFormatter, get_region
+from . utilities import file_to_intervaltree, change_chrom_names, MyBasePairFormatter, get_region, data_sources
 from collections import OrderedDict
 from pygenometracks.tracks.GenomeTrack import GenomeTrack
 from pygenometracks.utilities import InputError
@@ -66,7 +70,7 @@ class PlotTracks(object):
     def __init__(self, tracks_file, fig_width=DEFAULT_FIGURE_WIDTH,
                  fig_height=None, fontsize=None, dpi=None,
                  track_label_width=0.1,
-                 plot_regions=None, plot_width=None):
+                 plot_regions=None, plot_width=None, threads=1):
         self.fig_width = fig_width
         self.fig_height = fig_height
         self.dpi = dpi
@@ -74,6 +78,8 @@ class PlotTracks(object):
         self.vlines_properties = None
         self.vhighlight_intval_tree = []
         self.vhighlight_properties = []
+        # keys of the data sources used for vlines and vhighlight
+        self.data_source_keys = []
         self.track_list = None
         start = self.print_elapsed(None)
         self.available_tracks = self.get_available_tracks()
@@ -107,6 +113,23 @@ class PlotTracks(object):
             properties['region'] = plot_regions.copy()
             self.track_obj_list.append(track_class(properties))
 
+        # The tracks can adapt the level of detail
+        # to the number of pixels available
+        dpi = self.dpi if self.dpi is not None \
+            else matplotlib.rcParams['figure.dpi']
+        for track in self.track_obj_list:
+            track.plot_width_px = self.get_plot_width() / 2.54 * dpi
+
+        # The data of the tracks can be fetched in parallel
+        # The lock of each track prevents to fetch 2 regions
+        # or to fetch a region while drawing another one
+        # at the same time with the same track (or the same file)
+        self.threads = max(1, threads)
+        self.fetch_executor = None
+        self.track_locks = self.get_track_locks()
+        # The figure can be reused between regions (see plot)
+        self.figure_layout = None
+
         log.info("time initializing track(s):")
         self.print_elapsed(start)
 
@@ -185,11 +208,7 @@ class PlotTracks(object):
                 # 0.01 of the mean of the 3 regions is not occupied.
                 # 1 / (1 + 2 / 3 * 0.01) is used to plot.
 
-                hic_width = \
-                    self.fig_width * \
-                    (DEFAULT_MARGINS['right'] - DEFAULT_MARGINS['left']) / \
-                    (1 + 2 / 3 * 0.01) * \
-                    self.width_ratios[1] / sum(self.width_ratios)
+                hic_width = self.get_plot_width()
                 # the scale factor is to obtain each bin as a square
                 # (a 45 degree rotated matrix)
                 if track_dict['file_type'] == 'hic_matrix':
@@ -213,11 +232,175 @@ class PlotTracks(object):
 
         return track_height
 
+    def get_plot_width(self):
+        """
+        Returns the width (in cm) of the axis where
+        the tracks are plotted (see get_tracks_height).
+        """
+        return self.fig_width * \
+            (DEFAULT_MARGINS['right'] - DEFAULT_MARGINS['left']) / \
+            (1 + 2 / 3 * 0.01) * \
+            self.width_ratios[1] / sum(self.width_ratios)
+
+    def get_track_locks(self):
+        """
+        Returns one lock per track. Tracks which share
+        a data source (directly or through other tracks)
+        share the same lock.
+        """
+        groups = []  # list of (data source keys, track indices)
+        for idx, track in enumerate(self.track_obj_list):
+            keys = set(track.data_source_keys)
+            members = [idx]
+            for group in [g for g in groups if len(g[0] & keys) > 0]:
+                groups.remove(group)
+                keys |= group[0]
+                members += group[1]
+            groups.append((keys, members))
+        track_locks = [None] * len(self.track_obj_list)
+        for __, members in groups:
+            lock = threading.Lock()
+            for idx in members:
+                track_locks[idx] = lock
+        return track_locks
+
+    def fetch_track_data(self, idx, chrom, start, end):
+        """
+        Gets the data of the track number idx for the region.
+        """
+        track = self.track_obj_list[idx]
+        with self.track_locks[idx]:
+            log.info(f"fetching {track.properties['section_name']}")
+            return track.fetch(chrom, start, end)
+
+    def fetch_tracks_data(self, chrom, start, end):
+        """
+        Gets the data of all tracks for the region
+        (nothing is plotted).
+        If self.threads is above 1, the tracks are fetched
+        concurrently.
+
+        :return: a list with the TrackData of each track
+        """
+        if self.threads == 1:
+            return [self.fetch_track_data(idx, chrom, start, end)
+                    for idx in range(len(self.track_obj_list))]
+        if self.fetch_executor is None:
+            self.fetch_executor = ThreadPoolExecutor(max_workers=self.threads)
+        futures = [self.fetch_executor.submit(self.fetch_track_data,
+                                              idx, chrom, start, end)
+                   for idx in range(len(self.track_obj_list))]
+        return [future.result() for future in futures]
+
+    def iter_tracks_data(self, regions, prefetch=1):
+        """
+        Generator which gives for each region of regions
+        the region and the data of all tracks.
+        If self.threads is above 1, the data of the
+        next regions (at most prefetch) is fetched
+        while the current region is plotted.
+        A track is never fetched while it is drawn
+        (both hold the lock of the track).
+
+        :param regions: a list of tuple [(chrom1, start1, end1), ...]
+        :param prefetch: the maximum number of regions fetched in advance
+        """
+        if self.threads == 1:
+            for chrom, start, end in regions:
+                yield (chrom, start, end), \
+                    self.fetch_tracks_data(chrom, start, end)
+            return
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=1) as region_executor:
+            for region in regions:
+                pending.append((region,
+                                region_executor.submit(self.fetch_tracks_data,
+                                                       *region)))
+                if len(pending) > prefetch:
+                    current_region, future = pending.popleft()
+                    yield current_region, future.result()
+            while pending:
+                current_region, future = pending.popleft()
+                yield current_region, future.result()
+
     def plot(self, file_name, chrom, start, end, title=None,
-             h_align_titles='left', decreasing_x_axis=False):
+             h_align_titles='left', decreasing_x_axis=False,
+             tracks_data=None, reuse_figure=False):
+        # The data is fetched before any plotting
+        # (unless it was given)
+        if tracks_data is None:
+            tracks_data = self.fetch_tracks_data(chrom, start, end)
+
         track_height = self.get_tracks_height(start_region=start,
                                               end_region=end)
 
+        # When several regions are plotted and the height of the tracks
+        # does not depend on the region, the figure, the axes and
+        # the labels of the previous region are reused
+        # only the data is cleared and plotted again.
+        layout_key = (track_height, title, h_align_titles)
+        if reuse_figure and self.figure_layout is not None \
+           and self.figure_layout['key'] == layout_key:
+            layout = self.figure_layout
+            self.clear_figure_layout(layout)
+        else:
+            self.close_figure_layout()
+            layout = self.create_figure_layout(track_height, title,
+                                               h_align_titles)
+            layout['key'] = layout_key
+            if reuse_figure:
+                self.figure_layout = layout
+        fig = layout['fig']
+
+        axis_list = []
+        for idx, (track, data) in enumerate(zip(self.track_obj_list,
+                                                tracks_data)):
+            log.info(f"plotting {track.properties['section_name']}")
+            plot_axis = layout['plot_axes'][idx]
+            y_axis = layout['y_axes'][layout['rows'][idx]]
+
+            if track.properties['overlay_previous'] == 'share-y':
+                ylim = plot_axis.get_ylim()
+
+            if decreasing_x_axis:
+                plot_axis.set_xlim(end, start)
+            else:
+                plot_axis.set_xlim(start, end)
+            # The lock is also held while drawing because
+            # the next region may be prefetched meanwhile
+            # (see iter_tracks_data)
+            with self.track_locks[idx]:
+                track.draw(plot_axis, data)
+                track.plot_y_axis(y_axis, plot_axis)
+
+            if track.properties['overlay_previous'] == 'share-y':
+                plot_axis.set_ylim(ylim)
+
+            if track.properties['overlay_previous'] == 'no':
+                axis_list.append(plot_axis)
+
+        if self.vlines_intval_tree:
+            self.plot_vlines(axis_list, chrom, start, end)
+
+        if len(self.vhighlight_intval_tree) > 0:
+            self.plot_vhighlight(axis_list, chrom, start, end)
+
+        fig.savefig(file_name, dpi=self.dpi, transparent=False)
+        return fig
+
+    def create_figure_layout(self, track_height, title, h_align_titles):
+        """
+        Creates the figure with all the axes needed to plot
+        the tracks and plots the labels of the tracks.
+
+        :param track_height: list with the height of each track
+        :param title: title of the figure
+        :param h_align_titles: horizontal alignment of the labels
+
+        :return: a dictionary with the figure, the grid,
+        the plot axis of each track, the row of each track
+        and the y axis of each row.
+        """
         if self.fig_height:
             fig_height = self.fig_height
         else:
@@ -241,64 +424,86 @@ class PlotTracks(object):
                                              height_ratios=track_height,
                                              width_ratios=self.width_ratios,
                                              wspace=0.01)
-        axis_list = []
+        layout = {'fig': fig, 'grids': grids, 'plot_axes': [],
+                  'rows': [], 'y_axes': [], 'static_axes': set()}
         # skipped_tracks is the count of tracks that have the
         # 'overlay_previous' parameter and should be skipped
         skipped_tracks = 0
         plot_axis = None
         for idx, track in enumerate(self.track_obj_list):
-            log.info(f"plotting {track.properties['section_name']}")
-
             if track.properties['overlay_previous'] in ['yes', 'share-y']:
                 overlay = True
                 skipped_tracks += 1
             else:
                 overlay = False
 
-            if track.properties['overlay_previous'] == 'share-y':
-                ylim = plot_axis.get_ylim()
-            else:
-                idx -= skipped_tracks
+            idx -= skipped_tracks
+            if track.properties['overlay_previous'] != 'share-y':
                 plot_axis = axisartist.Subplot(fig, grids[idx, 1])
                 fig.add_subplot(plot_axis)
-                # turns off the lines around the tracks
-                plot_axis.axis[:].set_visible(False)
-                # to make the background transparent
-                plot_axis.patch.set_visible(False)
+                self.hide_plot_axis(plot_axis)
+                layout['static_axes'].add(plot_axis)
                 if not overlay:
-                    y_axis = plt.subplot(grids[idx, 0])
-                    y_axis.set_axis_off()
+                    y_axis = self.new_y_axis(fig, grids, idx)
+                    layout['y_axes'].append(y_axis)
 
-                    label_axis = plt.subplot(grids[idx, 2])
+                    label_axis = fig.add_subplot(grids[idx, 2])
                     label_axis.set_axis_off()
+                    layout['static_axes'].add(label_axis)
                     # I get the width of the label_axis to be able to wrap the
                     # labels when right or center aligned.
                     width_inch = label_axis.get_window_extent().width
-                    width_dpi = width_inch * self.dpi / fig.dpi
+                    dpi = self.dpi if self.dpi is not None \
+                        else matplotlib.rcParams['figure.dpi']
+                    width_dpi = width_inch * dpi / fig.dpi
 
-            if decreasing_x_axis:
-                plot_axis.set_xlim(end, start)
-            else:
-                plot_axis.set_xlim(start, end)
-            track.plot(plot_axis, chrom, start, end)
-            track.plot_y_axis(y_axis, plot_axis)
+            layout['plot_axes'].append(plot_axis)
+            layout['rows'].append(idx)
             track.plot_label(label_axis, width_dpi=width_dpi,
                              h_align=h_align_titles)
+        return layout
 
-            if track.properties['overlay_previous'] == 'share-y':
-                plot_axis.set_ylim(ylim)
-
-            if not overlay:
-                axis_list.append(plot_axis)
-
-        if self.vlines_intval_tree:
-            self.plot_vlines(axis_list, chrom, start, end)
+    def clear_figure_layout(self, layout):
+        """
+        Removes everything that depends on the region plotted
+        (data, y axes and colorbars) from a figure created by
+        create_figure_layout. The labels are kept.
+        """
+        fig = layout['fig']
+        # Make it the current figure as some tracks use plt
+        plt.figure(fig.number)
+        for ax in fig.axes:
+            if ax not in layout['static_axes']:
+                ax.remove()
+        layout['y_axes'] = [self.new_y_axis(fig, layout['grids'], row)
+                            for row in range(len(layout['y_axes']))]
+        for plot_axis in OrderedDict.fromkeys(layout['plot_axes']):
+            plot_axis.cla()
+            # cla does not reset the data limits, they would be used
+            # to autoscale tracks without data in the new region
+            plot_axis.dataLim.set(matplotlib.transforms.Bbox.null())
+            self.hide_plot_axis(plot_axis)
+
+    def close_figure_layout(self):
+        """
+        Closes the figure kept to be reused (if any).
+        """
+        if self.figure_layout is not None:
+            plt.close(self.figure_layout['fig'])
+            self.figure_layout = None
 
-        if len(self.vhighlight_intval_tree) > 0:
-            self.plot_vhighlight(axis_list, chrom, start, end)
+    @staticmethod
+    def new_y_axis(fig, grids, row):
+        y_axis = fig.add_subplot(grids[row, 0])
+        y_axis.set_axis_off()
+        return y_axis
 
-        fig.savefig(file_name, dpi=self.dpi, transparent=False)
-        return fig
+    @staticmethod
+    def hide_plot_axis(plot_axis):
+        # turns off the lines around the tracks
+        plot_axis.axis[:].set_visible(False)
+        # to make the background transparent
+        plot_axis.patch.set_visible(False)
 
     def plot_vlines(self, axis_list, chrom_region, start_region, end_region):
         """
@@ -624,22 +829,42 @@ class PlotTracks(object):
         # Now that they were all checked
         self.track_list = track_list
         if self.vlines_properties:
-            self.vlines_intval_tree, __, __ = \
-                file_to_intervaltree(self.vlines_properties['file'],
-                                     plot_regions)
+            self.vlines_intval_tree = \
+                self.load_intervaltree(self.vlines_properties['file'],
+                                       plot_regions)
         if len(self.vhighlight_properties) > 0:
             for i in range(len(self.vhighlight_properties)):
-                current_vhighlight_intval_tree, __, __ = \
-                    file_to_intervaltree(self.vhighlight_properties[i]['file'],
-                                         plot_regions)
+                current_vhighlight_intval_tree = \
+                    self.load_intervaltree(self.vhighlight_properties[i]['file'],
+                                           plot_regions)
                 self.vhighlight_intval_tree.append(current_vhighlight_intval_tree)
 
+    def load_intervaltree(self, file_name, plot_regions):
+        """
+        Loads the file restricted to plot_regions as an
+        interval tree (shared with tracks using the same file).
+        """
+        key = data_sources.get_key('intervaltree', file_name,
+                                   plot_regions=plot_regions)
+        interval_tree, __, __ = \
+            data_sources.acquire(key,
+                                 lambda: file_to_intervaltree(file_name,
+                                                              plot_regions))
+        self.data_source_keys.append(key)
+        return interval_tree
+
     def close_files(self):
         """
         Close all opened files
         """
+        if self.fetch_executor is not None:
+            self.fetch_executor.shutdown()
+            self.fetch_executor = None
+        self.close_figure_layout()
         for track in self.track_obj_list:
             track.__del__()
+        while len(self.data_source_keys) > 0:
+            data_sources.release(self.data_source_keys.pop())
 
     @staticmethod
     def check_file_exists(track_dict, tracks_path, is_hic=False):
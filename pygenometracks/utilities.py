@@ -1,13 +1,21 @@
 import sys
 import os
+import io
+import collections
 import gzip
+import zlib
+import hashlib
+import struct
 import numpy as np
 from tqdm import tqdm
 from intervaltree import IntervalTree, Interval
 import pybedtools
+import pyBigWig
 import tempfile
 import warnings
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from matplotlib.ticker import Formatter
 import math
 
@@ -17,12 +25,95 @@ logging.basicConfig(format=FORMAT)
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
+BIGBED_MAGIC = b'\xeb\xf2\x89\x87'
+# gzip magic, deflate and FEXTRA flag of the BGZF blocks
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+# Size (uncompressed) of the chunks of the files parsed in parallel
+PARALLEL_CHUNK_SIZE = 64 * 1024 * 1024
+
 
 class InputError(Exception):
     """Exception raised for errors in the input."""
     pass
 
 
+class DataSources(object):
+    """
+    Keeps the data sources (opened or parsed files) which
+    are shared between tracks.
+    A data source is identified by a key (the kind of source,
+    the absolute path of the file, its modification time and the
+    options used to load it).
+    It is loaded the first time it is acquired and closed when
+    it has been released as many times as it was acquired.
+
+    >>> sources = DataSources()
+    >>> key = sources.get_key('test', 'file.txt', option=1)
+    >>> sources.acquire(key, lambda: [1, 2])
+    [1, 2]
+    >>> sources.acquire(key, lambda: [3, 4])
+    [1, 2]
+    >>> sources.release(key)
+    >>> sources.release(key)
+    >>> key in sources.sources
+    False
+    """
+
+    def __init__(self):
+        # A track may be garbage collected (and thus release its
+        # data sources) while another data source is loaded
+        self.lock = threading.RLock()
+        # key -> [value, number of tracks using it, close function]
+        self.sources = {}
+
+    @staticmethod
+    def get_key(kind, file_name, **options):
+        """
+        Returns a hashable key from the kind, the absolute path
+        of file_name, its modification time
+        and the options (lists are converted to tuples).
+        """
+        file_path = os.path.abspath(file_name)
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            # For example for mcool files with '::'
+            mtime = None
+        options_tuple = []
+        for option, value in sorted(options.items()):
+            if isinstance(value, list):
+                value = tuple([tuple(v) if isinstance(v, list) else v
+                               for v in value])
+            options_tuple.append((option, value))
+        return (kind, file_path, mtime, tuple(options_tuple))
+
+    def acquire(self, key, load, close=None):
+        """
+        Returns the data source corresponding to key.
+        If it does not exist, it is created with load().
+        close(value) is called when the source is not used anymore.
+        """
+        with self.lock:
+            if key not in self.sources:
+                self.sources[key] = [load(), 0, close]
+            self.sources[key][1] += 1
+            return self.sources[key][0]
+
+    def release(self, key):
+        with self.lock:
+            if key not in self.sources:
+                return
+            self.sources[key][1] -= 1
+            if self.sources[key][1] == 0:
+                value, __, close = self.sources.pop(key)
+                if close is not None:
+                    close(value)
+
+
+# The data sources shared by all tracks
+data_sources = DataSources()
+
+
 def to_string(s):
     """
     This takes care of python2/3 differences
@@ -39,28 +130,468 @@ def to_string(s):
     return s
 
 
+# The pool of threads shared by all BgzfReader (see get_bgzf_executor)
+bgzf_executor = None
+bgzf_executor_lock = threading.Lock()
+
+
+def get_bgzf_executor():
+    """
+    Returns the pool of threads used to decompress the bgzip files.
+    It is created at the first use with one thread per cpu
+    and shared by all the files so the number of threads
+    does not depend on the number of files opened.
+    """
+    global bgzf_executor
+    with bgzf_executor_lock:
+        if bgzf_executor is None:
+            bgzf_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1,
+                                               thread_name_prefix='bgzf')
+        return bgzf_executor
+
+
+def reset_bgzf_executor():
+    """
+    The threads of the pool do not exist in a forked process
+    so a new pool is created there when needed.
+    """
+    global bgzf_executor, bgzf_executor_lock
+    bgzf_executor = None
+    bgzf_executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_bgzf_executor)
+
+
+class BgzfReader(io.RawIOBase):
+    """
+    Reads a BGZF file (compressed with bgzip).
+    The BGZF blocks are independent gzip members
+    so they are decompressed in parallel by the pool of threads
+    shared by all files (zlib releases the GIL) and given back in order.
+    Only seek(0) is possible.
+    """
+
+    def __init__(self, fileobj, threads=None, offset=0):
+        """
+        :param fileobj: file opened in binary mode
+        :param threads: number of blocks decompressed at the same time
+                        (default is the number of cpus),
+                        with 1 the blocks are decompressed
+                        in the current thread
+        :param offset: position in fileobj of the first block to read
+        """
+        self.fileobj = fileobj
+        self.threads = threads if threads is not None else (os.cpu_count() or 1)
+        self.offset_in_file = offset
+        self.reset()
+
+    def reset(self):
+        self.fileobj.seek(self.offset_in_file)
+        # The decompression of the next blocks:
+        self.pending = collections.deque()
+        self.data = memoryview(b'')
+        self.offset = 0
+        self.position = 0
+        self.file_end = False
+
+    @property
+    def name(self):
+        return self.fileobj.name
+
+    def fileno(self):
+        return self.fileobj.fileno()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR and offset == 0:
+            return self.position
+        if whence != io.SEEK_SET or offset != 0:
+            raise io.UnsupportedOperation("Only seek(0) is possible"
+                                          " in a bgzip file.")
+        for future in self.pending:
+            future.cancel()
+        self.reset()
+        return 0
+
+    @staticmethod
+    def read_header(fileobj):
+        """
+        Reads the header of the next block of fileobj.
+        Returns the size of the block and the size of the header
+        or None at the end of the file.
+        """
+        header = fileobj.read(12)
+        if len(header) == 0:
+            return None
+        if len(header) < 12 or header[:4] != BGZF_MAGIC:
+            raise IOError(f"{fileobj.name} is not a valid bgzip file.")
+        extra = fileobj.read(struct.unpack('<H', header[10:12])[0])
+        # The BC subfield gives the size of the block
+        i = 0
+        while i + 4 <= len(extra):
+            subfield_length = struct.unpack('<H', extra[i + 2:i + 4])[0]
+            if extra[i:i + 2] == b'BC':
+                return struct.unpack('<H', extra[i + 4:i + 6])[0] + 1, 12 + len(extra)
+            i += 4 + subfield_length
+        raise IOError(f"{fileobj.name} is not a valid bgzip file.")
+
+    @staticmethod
+    def iter_blocks(fileobj):
+        """
+        Yields the position in fileobj and the uncompressed size
+        of each block (only the headers and the sizes are read).
+        """
+        offset = 0
+        fileobj.seek(0)
+        while True:
+            sizes = BgzfReader.read_header(fileobj)
+            if sizes is None:
+                return
+            block_size = sizes[0]
+            fileobj.seek(offset + block_size - 4)
+            yield offset, struct.unpack('<I', fileobj.read(4))[0]
+            offset += block_size
+
+    def read_block(self):
+        """
+        Returns the compressed data, the crc and the size
+        of the next block of the file or None at the end of the file.
+        """
+        sizes = self.read_header(self.fileobj)
+        if sizes is None:
+            return None
+        block_size, header_size = sizes
+        data = self.fileobj.read(block_size - header_size)
+        crc, size = struct.unpack('<II', data[-8:])
+        return data[:-8], crc, size
+
+    @staticmethod
+    def decompress_block(compressed_data, crc, size):
+        data = zlib.decompress(compressed_data, -15)
+        if len(data) != size or zlib.crc32(data) != crc:
+            raise IOError("Invalid block in the bgzip file.")
+        return data
+
+    def next_block(self):
+        """
+        Sets the data to the next decompressed block.
+        Returns False at the end of the file.
+        """
+        if self.threads == 1:
+            block = self.read_block()
+            if block is None:
+                return False
+            self.data = memoryview(self.decompress_block(*block))
+            self.offset = 0
+            return True
+        # Several blocks per thread are decompressed in advance
+        while not self.file_end and len(self.pending) < 4 * self.threads:
+            block = self.read_block()
+            if block is None:
+                self.file_end = True
+            else:
+                self.pending.append(get_bgzf_executor().submit(self.decompress_block,
+                                                               *block))
+        if len(self.pending) == 0:
+            return False
+        self.data = memoryview(self.pending.popleft().result())
+        self.offset = 0
+        return True
+
+    def readinto(self, buffer):
+        while self.offset == len(self.data):
+            if not self.next_block():
+                return 0
+        n = min(len(buffer), len(self.data) - self.offset)
+        buffer[:n] = self.data[self.offset:self.offset + n]
+        self.offset += n
+        self.position += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            for future in self.pending:
+                future.cancel()
+            # The blocks which are being decompressed are not waited for
+            # (the pool is shared)
+            self.pending.clear()
+            self.fileobj.close()
+        super(BgzfReader, self).close()
+
+
+def is_bgzip(file_name):
+    """
+    Returns True if the file has been compressed with bgzip.
+    """
+    with open(file_name, 'rb') as f:
+        header = f.read(14)
+    return header[:4] == BGZF_MAGIC and header[12:14] == b'BC'
+
+
 def opener(filename):
     """
-    Determines if a file is compressed or not
+    Determines if a file is compressed or not.
+    The bgzip files are decompressed with several threads.
     """
-    f = open(filename, 'rb')
-    if f.read(2) == b'\x1f\x8b':
-        f.seek(0)
-        return gzip.GzipFile(fileobj=f)
+    if is_bgzip(filename):
+        return io.BufferedReader(BgzfReader(open(filename, 'rb')),
+                                 buffer_size=1 << 16)
+    with open(filename, 'rb') as f:
+        header = f.read(2)
+    if header == b'\x1f\x8b':
+        # GzipFile opens the file itself to close it on close
+        return gzip.GzipFile(filename, 'rb')
     else:
-        f.seek(0)
-        return f
+        return open(filename, 'rb')
+
+
+def file_position(file_h):
+    """
+    Returns the position in the file on disk of a file handle
+    given by opener (for compressed files, this is the position
+    in the compressed file).
+    """
+    if isinstance(file_h, gzip.GzipFile):
+        return file_h.fileobj.tell()
+    if isinstance(getattr(file_h, 'raw', None), BgzfReader):
+        return file_h.raw.fileobj.tell()
+    return file_h.tell()
+
+
+def iter_lines_with_progress(file_h, every=10000):
+    """
+    Iterates over the lines of a file handle given by opener.
+    The progress is shown as the position in the file on disk
+    so the file is only read once.
+    """
+    with tqdm(total=os.fstat(file_h.fileno()).st_size,
+              unit='B', unit_scale=True) as progress:
+        for line_number, line in enumerate(file_h, 1):
+            yield line
+            if line_number % every == 0:
+                progress.update(file_position(file_h) - progress.n)
+        progress.update(file_position(file_h) - progress.n)
+
+
+def split_file(file_name, chunk_size=PARALLEL_CHUNK_SIZE):
+    """
+    Splits a plain or bgzip file in chunks of about chunk_size
+    uncompressed bytes which can be read independently
+    with iter_chunk_lines.
+    Each chunk is (position in the file on disk where the reading
+    begins, uncompressed position there, uncompressed start,
+    uncompressed end).
+    Returns None if the file cannot be splitted (gzip file).
+    """
+    if is_bgzip(file_name):
+        chunks = []
+        # Each chunk begins at a block
+        # but its first line begins after the last byte of
+        # the previous chunk so the reading begins
+        # at the previous (not empty) block
+        reading_start = (0, 0)
+        position = 0
+        with open(file_name, 'rb') as f:
+            for offset, size in BgzfReader.iter_blocks(f):
+                if len(chunks) == 0 or \
+                   (size > 0 and position >= chunks[-1][2] + chunk_size):
+                    chunks.append(reading_start + (position,))
+                if size > 0:
+                    reading_start = (offset, position)
+                position += size
+    else:
+        with open(file_name, 'rb') as f:
+            if f.read(2) == b'\x1f\x8b':
+                return None
+        position = os.path.getsize(file_name)
+        chunks = [(max(0, start - 1), max(0, start - 1), start)
+                  for start in range(0, max(1, position), chunk_size)]
+    return [chunk + (end,)
+            for chunk, end in zip(chunks, [chunk[2] for chunk in chunks[1:]] + [position])]
+
+
+def iter_chunk_lines(file_name, chunk):
+    """
+    Yields the lines (as bytes) of a chunk of a file (see split_file):
+    the lines which begin between the start and the end of the chunk.
+    """
+    offset, position, start, end = chunk
+    if is_bgzip(file_name):
+        # The chunks are already read in parallel
+        file_h = io.BufferedReader(BgzfReader(open(file_name, 'rb'),
+                                              threads=1, offset=offset))
+    else:
+        file_h = open(file_name, 'rb')
+        file_h.seek(offset)
+    with file_h:
+        if start > 0:
+            # Go to the beginning of the first line in the chunk
+            file_h.read(start - 1 - position)
+            position = start - 1 + len(file_h.readline())
+        for line in file_h:
+            if position >= end:
+                break
+            position += len(line)
+            yield line
+
+
+def map_file_chunks(function, file_name, *args,
+                    chunk_size=PARALLEL_CHUNK_SIZE, max_workers=None):
+    """
+    Returns the list of function(file_name, chunk, *args)
+    for the chunks of file_name (see split_file)
+    computed in a pool of processes
+    or None if the file is not splitted in several chunks
+    or if there is a single cpu (the file should be read
+    sequentially).
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers < 2:
+        return None
+    chunks = split_file(file_name, chunk_size)
+    if chunks is None or len(chunks) < 2:
+        return None
+    n_chunks = len(chunks)
+    with ProcessPoolExecutor(max_workers=min(n_chunks, max_workers)) as executor:
+        return list(tqdm(executor.map(function, [file_name] * n_chunks, chunks,
+                                      *[[arg] * n_chunks for arg in args]),
+                         total=n_chunks, unit='chunk'))
+
+
+def get_tabix_columns(file_name):
+    """
+    Returns the columns (1-based) of the chromosome, the start
+    and the end used in the tabix index (.tbi or .csi) of file_name.
+    Raises an IOError if there is no valid index.
+    """
+    for suffix in ['.tbi', '.csi']:
+        index_name = file_name + suffix
+        if not os.path.exists(index_name):
+            continue
+        with gzip.open(index_name, 'rb') as f:
+            magic = f.read(4)
+            if magic == b'TBI\x01':
+                # n_ref, format, col_seq, col_beg, col_end
+                __, __, col_seq, col_beg, col_end = struct.unpack('<5i', f.read(20))
+                return col_seq, col_beg, col_end
+            if magic == b'CSI\x01':
+                # min_shift, depth, l_aux
+                __, __, l_aux = struct.unpack('<3i', f.read(12))
+                if l_aux >= 16:
+                    # format, col_seq, col_beg, col_end
+                    __, col_seq, col_beg, col_end = struct.unpack('<4i', f.read(16))
+                    return col_seq, col_beg, col_end
+        raise IOError(f"{index_name} is not a valid tabix index.")
+    raise IOError(f"No tabix index found for {file_name}.")
+
+
+def get_cache_dir():
+    """
+    Returns the directory where the files which can be reused
+    from one run to the other (like indexes) are stored.
+    It is PYGENOMETRACKS_CACHE_DIR if this environment variable is set
+    else pyGenomeTracks in XDG_CACHE_HOME (default ~/.cache).
+    If it cannot be created, a directory in the temporary directory is used.
+    """
+    cache_dir = os.environ.get('PYGENOMETRACKS_CACHE_DIR')
+    if cache_dir is None:
+        cache_home = os.environ.get('XDG_CACHE_HOME',
+                                    os.path.join(os.path.expanduser('~'),
+                                                 '.cache'))
+        cache_dir = os.path.join(cache_home, 'pyGenomeTracks')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        cache_dir = os.path.join(tempfile.gettempdir(), 'pyGenomeTracks_cache')
+        os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def get_cache_file_name(file_name, suffix):
+    """
+    Returns the name of a file in the cache directory
+    which depends on the path of file_name, its modification time
+    and the suffix (so it is not reused when file_name is modified).
+    """
+    file_path = os.path.abspath(file_name)
+    file_id = f"{file_path}\t{os.path.getmtime(file_path)}"
+    file_hash = hashlib.sha1(file_id.encode()).hexdigest()[:16]
+    return os.path.join(get_cache_dir(),
+                        f"{os.path.basename(file_path)}.{file_hash}.{suffix}")
+
+
+def is_bigbed(file_name):
+    """
+    Returns True if file_name is a bigBed file
+    (uses the magic number at the start of the file).
+    """
+    with open(file_name, 'rb') as f:
+        return f.read(4) == BIGBED_MAGIC
+
+
+def bigbed_to_bed(file_name, plot_regions, around_region=0):
+    """
+    Writes the entries of a bigBed file which overlap
+    the plot_regions +/- around_region to a temporary bed file.
+    Only the entries of the regions are read from the bigBed
+    (the whole file is never converted).
+    :param file_name: string file name
+    :param plot_regions:a list of tuple [(chrom1, start1, end1), (chrom2, start2, end2)]
+                        with the region to restrict the data to.
+    :param around_region: integer with the bp to extend to plot_regions
+    :return: temporary bed file with the entries
+    """
+    if plot_regions is None:
+        raise InputError(f"The bigBed file {file_name} can only be read"
+                         " for the plotted regions.")
+    bb = pyBigWig.open(file_name)
+    chrom_sizes = bb.chroms()
+    # We will overlap with both version of chromosome name:
+    regions = [(chrom_name, max(0, start - around_region),
+                min(chrom_sizes[chrom_name], end + around_region))
+               for chrom, start, end in plot_regions
+               for chrom_name in [chrom, change_chrom_names(chrom)]
+               if chrom_name in chrom_sizes]
+    lines = []
+    for chrom, start, end in regions:
+        if start >= end:
+            continue
+        entries = bb.entries(chrom, start, end)
+        if entries is None:
+            continue
+        lines += [f"{chrom}\t{entry_start}\t{entry_end}\t{rest}"
+                  if rest != '' else f"{chrom}\t{entry_start}\t{entry_end}"
+                  for entry_start, entry_end, rest in entries]
+    bb.close()
+    # The entries which overlap several regions are written once:
+    lines = list(dict.fromkeys(lines))
+    return pybedtools.BedTool(''.join([line + '\n' for line in lines]),
+                              from_string=True).fn
 
 
 def temp_file_from_intersect(file_name, plot_regions=None, around_region=0):
     """
     intersect file_name with the plot_regions +/- around_region
+    bigBed files are converted to bed.
     :param file_name: string file name
     :param plot_regions:a list of tuple [(chrom1, start1, end1), (chrom2, start2, end2)]
                         with the region to restrict the data to.
     :param around_region: integer with the bp to extend to plot_regions
     :return: temporary file with the intersection
     """
+    if is_bigbed(file_name):
+        return bigbed_to_bed(file_name, plot_regions, around_region)
     file_to_open = file_name
     # Check if we can restrict the interval tree to a region:
     if plot_regions is not None:
@@ -114,6 +645,26 @@ def file_to_intervaltree(file_name, plot_regions=None):
     value is an IntervalTree. Each of the intervals have as 'value' the fields[3:] if any.
     """
     file_to_open = temp_file_from_intersect(file_name, plot_regions, 0)
+    # The large files are parsed by chunks in parallel
+    all_columns = map_file_chunks(bed_like_chunk_to_columns, file_to_open)
+    if all_columns is not None and None not in all_columns:
+        intervals = collections.defaultdict(list)
+        min_value = min([columns[4] for columns in all_columns])
+        max_value = max([columns[5] for columns in all_columns])
+        for chroms, starts, ends, values, __, __ in all_columns:
+            for chrom, start, end, value in zip(chroms, starts.tolist(),
+                                                ends.tolist(), values):
+                intervals[chrom].append(Interval(start, end, value))
+        del all_columns
+        if len(intervals) == 0:
+            suffix = " after intersection with the plotted region" \
+                if file_to_open != file_name else ""
+            log.warning(f"No valid intervals were found in file {file_name}{suffix}")
+        # The trees are built at once from all the intervals
+        return {chrom: IntervalTree(chrom_intervals)
+                for chrom, chrom_intervals in intervals.items()}, \
+            min_value, max_value
+
     # iterate over a BED like file
     # saving the data into an interval tree
     # for quick retrieval
@@ -124,7 +675,7 @@ def file_to_intervaltree(file_name, plot_regions=None):
     min_value = float('Inf')
     max_value = -float('Inf')
 
-    for line in tqdm(file_h.readlines()):
+    for line in iter_lines_with_progress(file_h):
         line_number += 1
         line = to_string(line)
         if line.startswith('browser') or line.startswith('track') or line.startswith('#'):
@@ -193,6 +744,97 @@ def file_to_intervaltree(file_name, plot_regions=None):
     return interval_tree, min_value, max_value
 
 
+def bed_like_chunk_to_columns(file_name, chunk):
+    """
+    Returns the chromosomes, the starts, the ends and the values
+    (the fields after the third one) of the lines of a chunk
+    of a BED like file (see split_file) with the min and the max
+    of the values or None if one of the lines is not valid
+    (the file should then be read sequentially
+    by file_to_intervaltree to get the errors).
+    """
+    chroms = []
+    starts = []
+    ends = []
+    values = []
+    min_value = float('Inf')
+    max_value = -float('Inf')
+    for line in iter_chunk_lines(file_name, chunk):
+        line = to_string(line)
+        if line.startswith('browser') or line.startswith('track') or line.startswith('#'):
+            continue
+        fields = line.strip().split('\t')
+        if len(fields) < 3:
+            return None
+        try:
+            start = int(fields[1])
+            end = int(fields[2])
+        except ValueError:
+            return None
+        if end <= start:
+            return None
+        value = None
+        if len(fields) > 3:
+            value = fields[3:]
+            try:
+                line_values = list(map(float, value))
+            except ValueError:
+                pass
+            else:
+                min_value = min(min_value, min(line_values))
+                max_value = max(max_value, max(line_values))
+        chroms.append(fields[0])
+        starts.append(start)
+        ends.append(end)
+        values.append(value)
+    return chroms, np.array(starts, dtype=np.int64), \
+        np.array(ends, dtype=np.int64), values, min_value, max_value
+
+
+def decimate_per_pixel(x_values, score_list, start_region, end_region,
+                       number_of_pixels):
+    """
+    Reduces the points of a coverage to plot it on number_of_pixels
+    columns of pixels without visible change: in each column only
+    the first, the last, the min and the max points are kept
+    (M4 decimation). The nan split the lines so this is done
+    for each part of a column between nan (where only the first
+    nan is kept).
+    The points are not changed if the x_values are not sorted
+    or if there are less than 4 points per column.
+
+    >>> x_values, score_list = decimate_per_pixel(
+    ...     np.arange(0, 20), np.array([0, 3, 1, 2, 5, 4, 6, 7, 9, 8,
+    ...                                 1, np.nan, 0, 0, 0, 2, 1, 1, 1, 1]),
+    ...     0, 20, 2)
+    >>> x_values
+    array([ 0,  8,  9, 10, 11, 12, 15, 19])
+    >>> score_list
+    array([ 0.,  9.,  8.,  1., nan,  0.,  2.,  1.])
+    """
+    n_points = len(x_values)
+    if n_points <= 4 * number_of_pixels or np.any(np.diff(x_values) < 0):
+        return x_values, score_list
+    pixels = np.floor((x_values - start_region) / (end_region - start_region)
+                      * number_of_pixels).astype(int)
+    pixels = np.clip(pixels, 0, number_of_pixels - 1)
+    is_nan = np.isnan(score_list)
+    # The points are sorted so each part of column is a slice
+    firsts = np.concatenate([[0], np.flatnonzero((np.diff(pixels) != 0)
+                                                 | (np.diff(is_nan) != 0)) + 1])
+    lasts = np.concatenate([firsts[1:], [n_points]]) - 1
+    keep = [firsts, lasts[~is_nan[lasts]]]
+    parts = np.repeat(np.arange(len(firsts)), lasts - firsts + 1)
+    for values in [np.where(is_nan, np.inf, score_list),
+                   np.where(is_nan, np.inf, -score_list)]:
+        # The first point of each part equal to the part min
+        part_min = np.minimum.reduceat(values, firsts)
+        indices = np.flatnonzero((values == part_min[parts]) & ~is_nan)
+        keep.append(indices[np.unique(parts[indices], return_index=True)[1]])
+    keep = np.unique(np.concatenate(keep))
+    return x_values[keep], score_list[keep]
+
+
 def plot_coverage(ax, x_values, score_list, plot_type, size, color,
                   negative_color, alpha, grid):
     if grid:
@@ -109,7 +109,7 @@ setup(
     name='pyGenomeTracks',
     version=get_version(),
     author='Lucille Lopez-Delisle, Leily Rabbani, Joachim Wolf, Björn Grüning',
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks', 'benchmarks.*']),
     scripts=['bin/make_tracks_file', 'bin/pgt', 'bin/pyGenomeTracks'],
     include_package_data=True,
     package_dir={'pygenometracks': 'pygenometracks'},